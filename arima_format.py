@@ -0,0 +1,255 @@
+"""
+Compact ARIMA Model Format for Chili Price Prediction
+Stores a fitted ARIMA/ARIMAX model as its order, parameters, exog spec and the
+filter state at the start of a short tail of observations, instead of pickling
+the whole statsmodels result with its training data and filter output
+"""
+
+import numpy as np
+import pandas as pd
+from statsmodels.tsa.arima.model import ARIMA
+from artifact_cache import atomic_open, file_hash
+import argparse
+import glob
+import joblib
+import json
+import os
+import statistics
+import time
+import warnings
+
+SLIM_FORMAT = 1
+ARIMA_DIR = 'models/arima'
+# Observations kept with the state; enough for train_arima's recent-error check (QUALITY_WINDOW)
+TAIL_ROWS = 20
+
+class KnownStateARIMA(ARIMA):
+    """
+    ARIMA whose filter starts from a known state mean and covariance.
+
+    The state is part of the init keywords, so clone() and therefore
+    results.append()/extend() keep it when new observations are added.
+    """
+
+    def __init__(self, endog, exog=None, initial_state=None, initial_state_cov=None, **kwargs):
+        super().__init__(endog, exog=exog, **kwargs)
+        self.initial_state = np.asarray(initial_state, dtype=np.float64)
+        self.initial_state_cov = np.asarray(initial_state_cov, dtype=np.float64)
+        self.initialize_known(self.initial_state, self.initial_state_cov)
+
+    def _get_init_kwds(self):
+        kwds = super()._get_init_kwds()
+        kwds.update(initial_state=self.initial_state, initial_state_cov=self.initial_state_cov)
+        return kwds
+
+def _user_exog(model):
+    """The exog passed to ARIMA, without the trend columns it adds to model.exog"""
+    exog = getattr(model, '_input_exog', None)
+    if exog is None:
+        return None, None
+    return np.asarray(exog, dtype=np.float64), list(model._input_exog_names)
+
+def slim_path(joblib_path):
+    """Path of the compact file next to a saved .joblib model"""
+    return f'{os.path.splitext(joblib_path)[0]}.npz'
+
+def _json_value(value):
+    """Make entry metadata (timestamps, numpy scalars) JSON-serializable"""
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, dict):
+        return {key: _json_value(item) for key, item in value.items()}
+    if isinstance(value, (tuple, list)):
+        return [_json_value(item) for item in value]
+    return value
+
+def save_slim(entry, path, tail_rows=TAIL_ROWS, source=None):
+    """
+    Write a saved-model entry ({'model': ARIMAResults, 'order': ..., ...}) in
+    the compact format. The predicted state at the first of the last
+    `tail_rows` observations is stored with those observations, so the model
+    can be re-filtered over them to forecast or append from the same state.
+    """
+    results = entry['model']
+    model = results.model
+    start = max(int(results.nobs) - tail_rows, 0)
+
+    init_kwds = model._get_init_kwds()
+    for key in ('initial_state', 'initial_state_cov'):
+        init_kwds.pop(key, None)
+    # The tail starts `start` rows later, which matters only for time trends
+    init_kwds['trend_offset'] = init_kwds.get('trend_offset', 1) + start
+
+    arrays = {
+        'params': np.asarray(results.params, dtype=np.float64),
+        'initial_state': results.predicted_state[:, start],
+        'initial_state_cov': results.predicted_state_cov[:, :, start],
+        'endog': model.endog[start:, 0],
+    }
+    exog, exog_names = _user_exog(model)
+    if exog is not None:
+        arrays['exog'] = exog[start:]
+
+    # Dates are not kept (the irregular business-day index gives statsmodels no
+    # frequency, so the full model uses integer positions too); the last date is
+    # recorded because older entries derive it from nobs, which the tail changes
+    metadata = {key: value for key, value in entry.items() if key != 'model'}
+    row_labels = model.data.row_labels
+    if 'last_date' not in metadata and isinstance(row_labels, pd.DatetimeIndex):
+        metadata['last_date'] = row_labels[-1]
+
+    header = {
+        'format': SLIM_FORMAT,
+        'init_kwds': _json_value(init_kwds),
+        'param_names': list(model.param_names),
+        'endog_name': model.endog_names,
+        'exog_names': exog_names,
+        'nobs': int(results.nobs),
+        'aic': float(results.aic),
+        'entry': _json_value(metadata),
+    }
+    if source is not None:
+        stat = os.stat(source)
+        header.update(source=os.path.basename(source), source_sha256=file_hash(source),
+                      source_size=stat.st_size, source_mtime_ns=stat.st_mtime_ns)
+
+    with atomic_open(path) as f:
+        np.savez(f, header=np.array(json.dumps(header)), **arrays)
+    return path
+
+def export_model(joblib_path, output_path=None, tail_rows=TAIL_ROWS):
+    """Write the compact file for a saved .joblib model"""
+    return save_slim(joblib.load(joblib_path), output_path or slim_path(joblib_path), tail_rows, source=joblib_path)
+
+def _read_header(path):
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(str(data['header']))
+
+def load_slim(path):
+    """
+    Rebuild a saved-model entry from a compact file. Its 'model' is a filtered
+    KnownStateARIMA result over the stored tail: forecast(), append() and the
+    tail's fittedvalues match the original result.
+    """
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data['header']))
+        if header['format'] != SLIM_FORMAT:
+            raise ValueError(f"{path}: slim format {header['format']}, expected {SLIM_FORMAT}")
+        arrays = {name: data[name] for name in data.files if name != 'header'}
+
+    endog = pd.Series(arrays['endog'], name=header['endog_name'])
+    exog = None
+    if 'exog' in arrays:
+        exog = pd.DataFrame(arrays['exog'], columns=header['exog_names'])
+
+    init_kwds = {key: tuple(value) if isinstance(value, list) else value
+                 for key, value in header['init_kwds'].items()}
+    model = KnownStateARIMA(endog, exog=exog, initial_state=arrays['initial_state'],
+                            initial_state_cov=arrays['initial_state_cov'], **init_kwds)
+    results = model.filter(pd.Series(arrays['params'], index=header['param_names']))
+
+    entry = dict(header['entry'])
+    entry['model'] = results
+    entry['order'] = tuple(entry['order'])
+    for key in ('last_date', 'last_full_search'):
+        if key in entry:
+            entry[key] = pd.Timestamp(entry[key])
+    return entry
+
+def is_current(joblib_path, path=None):
+    """
+    True when the compact file exists and was made from the current .joblib.
+    An unchanged size and mtime are trusted; otherwise the SHA-256 decides.
+    """
+    path = path or slim_path(joblib_path)
+    if not os.path.exists(path) or not os.path.exists(joblib_path):
+        return False
+    try:
+        header = _read_header(path)
+    except (OSError, ValueError, KeyError):
+        return False
+    if header.get('format') != SLIM_FORMAT or 'source_sha256' not in header:
+        return False
+    stat = os.stat(joblib_path)
+    if stat.st_size == header['source_size'] and stat.st_mtime_ns == header['source_mtime_ns']:
+        return True
+    return stat.st_size == header['source_size'] and file_hash(joblib_path) == header['source_sha256']
+
+def load_entry(joblib_path):
+    """Saved-model entry for a .joblib path, from its compact file when that is current"""
+    if is_current(joblib_path):
+        return load_slim(slim_path(joblib_path))
+    return joblib.load(joblib_path)
+
+def _median_seconds(fn, repeats):
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def compare_formats(joblib_path, path=None, horizon=30, repeats=5):
+    """File sizes, median load times and the max forecast difference of both formats"""
+    path = path or slim_path(joblib_path)
+    full = joblib.load(joblib_path)
+    slim = load_slim(path)
+    exog, exog_names = _user_exog(full['model'].model)
+    future_exog = np.zeros((horizon, len(exog_names))) if exog is not None else None
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        diff = np.max(np.abs(np.asarray(full['model'].forecast(horizon, exog=future_exog))
+                             - np.asarray(slim['model'].forecast(horizon, exog=future_exog))))
+    return {
+        'joblib_bytes': os.path.getsize(joblib_path),
+        'slim_bytes': os.path.getsize(path),
+        'joblib_seconds': _median_seconds(lambda: joblib.load(joblib_path), repeats),
+        'slim_seconds': _median_seconds(lambda: load_slim(path), repeats),
+        'max_forecast_diff': float(diff),
+    }
+
+def main(models_dir=ARIMA_DIR, benchmark=True, repeats=5):
+    print("="*80)
+    print("ARIMA EXPORT - Compact model format")
+    print("="*80)
+
+    joblib_paths = sorted(glob.glob(os.path.join(models_dir, '*.joblib')))
+    if not joblib_paths:
+        print(f"⚠ No .joblib models found in {models_dir}")
+        return
+
+    paths = [export_model(joblib_path) for joblib_path in joblib_paths]
+    print(f"\n✓ Exported {len(paths)} models to {models_dir}/*.npz")
+    if not benchmark:
+        return
+
+    print(f"\n{'Model':<38} {'joblib KB':>10} {'npz KB':>8} {'joblib ms':>10} {'npz ms':>8} {'max |diff|':>11}")
+    print("-"*90)
+    totals = {'joblib_bytes': 0, 'slim_bytes': 0, 'joblib_seconds': 0.0, 'slim_seconds': 0.0}
+    for joblib_path, path in zip(joblib_paths, paths):
+        result = compare_formats(joblib_path, path, repeats=repeats)
+        for key in totals:
+            totals[key] += result[key]
+        print(f"{os.path.basename(joblib_path):<38} {result['joblib_bytes'] / 1024:>10.1f} "
+              f"{result['slim_bytes'] / 1024:>8.1f} {result['joblib_seconds'] * 1000:>10.1f} "
+              f"{result['slim_seconds'] * 1000:>8.1f} {result['max_forecast_diff']:>11.2e}")
+    print("-"*90)
+    print(f"{'Total':<38} {totals['joblib_bytes'] / 1024:>10.1f} {totals['slim_bytes'] / 1024:>8.1f} "
+          f"{totals['joblib_seconds'] * 1000:>10.1f} {totals['slim_seconds'] * 1000:>8.1f}")
+    print(f"\n  Size: {totals['joblib_bytes'] / totals['slim_bytes']:.0f}x smaller, "
+          f"load: {totals['joblib_seconds'] / totals['slim_seconds']:.1f}x faster")
+    return totals
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Export ARIMA models to the compact format')
+    parser.add_argument('--models-dir', default=ARIMA_DIR, help='Directory with the .joblib models')
+    parser.add_argument('--no-benchmark', action='store_true', help='Skip the size/load time comparison')
+    parser.add_argument('--repeats', type=int, default=5, help='Loads per model when timing')
+    args = parser.parse_args(argv)
+    main(args.models_dir, benchmark=not args.no_benchmark, repeats=args.repeats)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,149 @@
+"""
+Artifact Cache for Chili Price Prediction
+Content-addressed store for trained models and metrics. Each artifact is keyed
+by a hash of everything it was built from (data slice, market, model variant,
+order or hyperparameters, library versions), so a rerun reuses it unless one
+of those inputs changed
+"""
+
+from contextlib import contextmanager
+import numpy as np
+import hashlib
+import importlib.metadata
+import joblib
+import json
+import os
+import shutil
+import uuid
+
+CACHE_DIR = 'models/cache'
+CACHE_FORMAT = 1
+
+@contextmanager
+def atomic_open(path, mode='wb'):
+    """
+    Write `path` through a uniquely named temporary file in the same
+    directory, moved into place when the block succeeds. Concurrent writers
+    never share a temporary file and readers never see a partial one.
+    """
+    tmp_path = os.path.join(os.path.dirname(path), f'.{os.path.basename(path)}.{uuid.uuid4().hex}.tmp')
+    try:
+        # Exclusive create, with the usual umask permissions (unlike mkstemp's 0600)
+        with open(tmp_path, mode.replace('w', 'x')) as f:
+            yield f
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+
+def library_versions(*packages):
+    """Installed version of each package (None when it is not installed)"""
+    versions = {}
+    for package in packages:
+        try:
+            versions[package] = importlib.metadata.version(package)
+        except importlib.metadata.PackageNotFoundError:
+            versions[package] = None
+    return versions
+
+def _update_with_data(digest, data):
+    """Hash an array, Series or DataFrame including its shape, dtype and index"""
+    if data is None:
+        digest.update(b'none')
+        return
+    if hasattr(data, 'index'):
+        index = np.asarray(data.index.values)
+        # Object indexes hold pointers, so hash their text instead of their bytes
+        digest.update(json.dumps([str(value) for value in index]).encode() if index.dtype == object
+                      else index.tobytes())
+        if hasattr(data, 'columns'):
+            digest.update(json.dumps([str(column) for column in data.columns]).encode())
+        data = data.to_numpy()
+    array = np.ascontiguousarray(data)
+    digest.update(f'{array.dtype.str}{array.shape}'.encode())
+    digest.update(array.tobytes())
+
+def artifact_key(kind, settings, data=(), packages=('numpy',)):
+    """
+    Hex key of one artifact: its kind, JSON-serializable settings, the input
+    data (arrays, Series or DataFrames) and the versions of `packages`.
+    """
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'format': CACHE_FORMAT,
+        'kind': kind,
+        'settings': settings,
+        'versions': library_versions(*packages),
+    }, sort_keys=True, default=str).encode())
+    for item in data:
+        _update_with_data(digest, item)
+    return digest.hexdigest()[:32]
+
+class ArtifactCache:
+    """
+    Directory of cached artifacts, one file per (kind, key).
+
+    load()/save() hold joblib-serializable values; file_path() gives the
+    location for artifacts written by other libraries (e.g. Keras .h5).
+    With enabled=False every lookup misses, but results are still saved.
+    """
+
+    def __init__(self, cache_dir=CACHE_DIR, enabled=True):
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def file_path(self, kind, key, suffix='.joblib'):
+        return os.path.join(self.cache_dir, kind, f'{key}{suffix}')
+
+    def has(self, kind, key, suffix='.joblib'):
+        found = self.enabled and os.path.exists(self.file_path(kind, key, suffix))
+        if found:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return found
+
+    def load(self, kind, key):
+        """Cached value, or None on a miss"""
+        if not self.has(kind, key):
+            return None
+        return joblib.load(self.file_path(kind, key))
+
+    def save(self, kind, key, value):
+        path = self.file_path(kind, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with atomic_open(path) as f:
+            joblib.dump(value, f)
+        return path
+
+    def save_file(self, kind, key, source_path, suffix):
+        """Copy a file written elsewhere into the cache"""
+        path = self.file_path(kind, key, suffix)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(source_path, 'rb') as source, atomic_open(path) as f:
+            shutil.copyfileobj(source, f)
+        return path
+
+    def summary(self):
+        return f"{self.hits} reused from cache, {self.misses} rebuilt"
+
+def file_hash(path):
+    """SHA-256 of a file, or None when it does not exist"""
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def install_file(cached_path, target_path):
+    """Copy a cached file to its working location unless the same bytes are already there"""
+    if file_hash(target_path) == file_hash(cached_path):
+        return False
+    os.makedirs(os.path.dirname(target_path), exist_ok=True)
+    with open(cached_path, 'rb') as source, atomic_open(target_path) as f:
+        shutil.copyfileobj(source, f)
+    return True
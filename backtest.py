@@ -0,0 +1,296 @@
+"""
+Walk-Forward Backtesting Script for Chili Price Prediction
+Evaluates ARIMA, ARIMAX, both LSTM variants (and optionally Prophet) over many
+rolling-origin train/forecast folds instead of the single chronological TEST_SIZE split
+"""
+
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from artifact_cache import atomic_open
+from data_access import MARKET_COLUMNS, split_index, load_market_frame
+from evaluation import error_metrics
+import argparse
+import hashlib
+import joblib
+import json
+import os
+import time
+import warnings
+warnings.filterwarnings('ignore')
+
+MODELS = ('arima', 'arimax', 'lstm', 'lstm_holiday')
+# Need extra packages, so only run when asked for
+OPTIONAL_MODELS = ('prophet',)
+CACHE_DIR = 'result/backtest/cache'
+RESULTS_PATH = 'result/backtest/backtest_results.pkl'
+
+DEFAULT_CONFIG = {
+    'arima_order': None,   # None = run the train_arima.py order search in every fold
+    'look_back': 30,
+    'epochs': 20,
+    'batch_size': 16,
+    'seed': 42,
+}
+
+def make_origins(n_rows, initial, step, horizon):
+    """
+    Rolling forecast origins: fold k trains on rows [0, origin) and forecasts
+    rows [origin, origin + horizon). The first origin is `initial`.
+    """
+    return list(range(initial, n_rows - horizon + 1, step))
+
+def _config_for(model, config):
+    """Only the settings that affect a model, so unrelated changes keep its cache"""
+    if model in ('arima', 'arimax'):
+        return {'arima_order': config['arima_order']}
+    if model == 'prophet':
+        return {}
+    return {key: config[key] for key in ('look_back', 'epochs', 'batch_size', 'seed')}
+
+def fold_key(model, train, future_holidays, horizon, config):
+    """Cache key of one fold: model, settings, horizon and the exact training data"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps({
+        'model': model,
+        'horizon': horizon,
+        'config': _config_for(model, config),
+        'columns': list(train.columns),
+    }, sort_keys=True, default=str).encode())
+    digest.update(np.ascontiguousarray(train.to_numpy(dtype=np.float64)).tobytes())
+    digest.update(train.index.values.astype('datetime64[ns]').tobytes())
+    digest.update(np.ascontiguousarray(future_holidays, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:24]
+
+def _cache_path(model, key):
+    return os.path.join(CACHE_DIR, model, f'{key}.joblib')
+
+def _init_worker():
+    """One BLAS/TensorFlow thread per worker so parallel folds don't oversubscribe cores"""
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    os.environ['TF_NUM_INTRAOP_THREADS'] = '1'
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    warnings.filterwarnings('ignore')
+
+def _fit_arima_fold(model, train, future_holidays, horizon, config):
+    from statsmodels.tsa.arima.model import ARIMA
+    from train_arima import find_best_arima_order
+
+    forecasts = np.empty((horizon, len(MARKET_COLUMNS)))
+    fitted = {}
+    exog = train['is_holiday'].values.reshape(-1, 1) if model == 'arimax' else None
+    future_exog = future_holidays.reshape(-1, 1) if model == 'arimax' else None
+
+    for idx, market in enumerate(MARKET_COLUMNS):
+        if config['arima_order'] is None:
+            order, result, _ = find_best_arima_order(train[market], exog, workers=1)
+        else:
+            order = tuple(config['arima_order'])
+            result = ARIMA(train[market], exog=exog, order=order).fit()
+        forecasts[:, idx] = np.asarray(result.forecast(steps=horizon, exog=future_exog))
+        fitted[market] = {'order': order, 'params': np.asarray(result.params)}
+
+    return forecasts, fitted
+
+def _fit_lstm_fold(model, train, future_holidays, horizon, config):
+    import tensorflow as tf
+    from sklearn.preprocessing import MinMaxScaler
+    from train_lstm import build_lstm_model, recursive_forecast
+    from windowing import window_dataset
+
+    tf.keras.utils.set_random_seed(config['seed'])
+    columns = MARKET_COLUMNS + (['is_holiday'] if model == 'lstm_holiday' else [])
+
+    # Scaler is fit on the fold's own training rows so no future data leaks in
+    scaler = MinMaxScaler()
+    scaled = scaler.fit_transform(train[columns].to_numpy())
+    dataset = window_dataset(scaled, config['look_back'], config['batch_size'])
+
+    lstm_model = build_lstm_model(config['look_back'], len(columns))
+    lstm_model.fit(dataset, epochs=config['epochs'], verbose=0)
+
+    holiday_column = None
+    future_scaled = None
+    if model == 'lstm_holiday':
+        holiday_column = columns.index('is_holiday')
+        future_rows = np.zeros((horizon, len(columns)))
+        future_rows[:, holiday_column] = future_holidays
+        future_scaled = scaler.transform(future_rows)[:, holiday_column]
+
+    predictions = recursive_forecast(lstm_model, scaled[-config['look_back']:], horizon,
+                                     holiday_column, future_scaled)
+    forecasts = scaler.inverse_transform(predictions)[:, :len(MARKET_COLUMNS)]
+    return forecasts, {'weights': lstm_model.get_weights(), 'scaler': scaler}
+
+def _fit_prophet_fold(model, train, future_holidays, horizon, config):
+    import logging
+    from train_prophet import build_model
+
+    logging.getLogger('cmdstanpy').setLevel(logging.WARNING)
+    # The tuned variants need lag/moving-average regressors for the unseen days,
+    # so folds use the baseline variant; future days are the next business days
+    future = pd.DataFrame({'ds': pd.bdate_range(train.index[-1] + pd.Timedelta(days=1), periods=horizon)})
+    forecasts = np.empty((horizon, len(MARKET_COLUMNS)))
+    fitted = {}
+    for idx, market in enumerate(MARKET_COLUMNS):
+        prophet_model = build_model('baseline')
+        prophet_model.fit(pd.DataFrame({'ds': train.index, 'y': train[market].values}))
+        forecasts[:, idx] = prophet_model.predict(future)['yhat'].values
+        fitted[market] = prophet_model.params
+    return forecasts, fitted
+
+def run_fold(job):
+    """Fit one model on one fold's training rows and forecast its horizon; cached on disk"""
+    model, train, future_holidays, horizon, config, key = job
+    path = _cache_path(model, key)
+    if os.path.exists(path):
+        return key, joblib.load(path)['forecast'], True
+
+    start = time.perf_counter()
+    if model in ('arima', 'arimax'):
+        forecast, fitted = _fit_arima_fold(model, train, future_holidays, horizon, config)
+    elif model == 'prophet':
+        forecast, fitted = _fit_prophet_fold(model, train, future_holidays, horizon, config)
+    else:
+        forecast, fitted = _fit_lstm_fold(model, train, future_holidays, horizon, config)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_open(path) as f:
+        joblib.dump({
+            'model': model,
+            'origin': train.index[-1],
+            'horizon': horizon,
+            'config': _config_for(model, config),
+            'forecast': forecast,
+            'fitted': fitted,
+            'fit_seconds': time.perf_counter() - start,
+        }, f)
+    return key, forecast, False
+
+def horizon_metrics(forecasts, actual):
+    """
+    Per-horizon error matrices from (folds, horizon, markets) forecasts and actuals.
+
+    Returns {'rmse', 'mae', 'mape'}, each a (markets, horizon) array where entry
+    [m, h] aggregates the h+1-step-ahead errors of market m over all folds.
+    """
+    return {name: values.T for name, values in error_metrics(actual, forecasts, axis=0).items()}
+
+def fold_job(df, model, origin, horizon, config):
+    """run_fold() job of one model trained on the rows before `origin`"""
+    train = df.iloc[:origin]
+    future_holidays = df['is_holiday'].to_numpy()[origin:origin + horizon]
+    key = fold_key(model, train, future_holidays, horizon, config)
+    return (model, train, future_holidays, horizon, config, key)
+
+def run_folds(jobs, workers=None):
+    """Forecasts {fold key: (horizon, markets) array}; cached folds are loaded, the rest fitted in a process pool"""
+    cached = [job for job in jobs if os.path.exists(_cache_path(job[0], job[5]))]
+    pending = [job for job in jobs if not os.path.exists(_cache_path(job[0], job[5]))]
+    print(f"  {len(jobs)} folds total, {len(cached)} cached, {len(pending)} to fit")
+
+    outcomes = {}
+    for key, forecast, _ in map(run_fold, cached):
+        outcomes[key] = forecast
+    if pending and workers == 1:
+        for key, forecast, _ in map(run_fold, pending):
+            outcomes[key] = forecast
+    elif pending:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as executor:
+            for key, forecast, _ in executor.map(run_fold, pending):
+                outcomes[key] = forecast
+    return outcomes
+
+def run_backtest(df, models=MODELS, origins=None, horizon=10, step=5, workers=None, config=None):
+    """
+    Run every (model, fold) pair in a process pool and collect per-horizon metrics.
+
+    Folds already in the cache are loaded instead of refitted, so extending the
+    backtest by one origin only fits that origin.
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    if origins is None:
+        origins = make_origins(len(df), split_index(len(df)), step, horizon)
+
+    jobs = [fold_job(df, model, origin, horizon, config) for model in models for origin in origins]
+    outcomes = run_folds(jobs, workers)
+
+    actual = np.stack([df[MARKET_COLUMNS].to_numpy()[origin:origin + horizon] for origin in origins])
+    results = {
+        'origins': [df.index[origin] for origin in origins],
+        'horizon': horizon,
+        'markets': MARKET_COLUMNS,
+        'config': config,
+        'actual': actual,
+        'models': {},
+    }
+    for model in models:
+        forecasts = np.stack([outcomes[job[5]] for job in jobs if job[0] == model])
+        results['models'][model] = {
+            'forecasts': forecasts,
+            **horizon_metrics(forecasts, actual),
+        }
+    return results
+
+def print_summary(results):
+    """Average-over-markets error by horizon for every model"""
+    horizon = results['horizon']
+    for metric in ('rmse', 'mae', 'mape'):
+        print(f"\n{metric.upper()} by horizon (average over markets):")
+        header = f"{'Model':<14}" + ''.join(f"{'h=' + str(h + 1):>10}" for h in range(horizon))
+        print(header)
+        print("-" * len(header))
+        for model, model_results in results['models'].items():
+            row = np.nanmean(model_results[metric], axis=0)
+            print(f"{model:<14}" + ''.join(f"{value:>10,.1f}" for value in row))
+
+def main(models=MODELS, horizon=10, step=5, initial=None, workers=None, config=None):
+    print("="*80)
+    print("WALK-FORWARD BACKTEST - Chili Price Prediction")
+    print("="*80)
+
+    df_with_holidays = load_market_frame()
+    initial = initial or split_index(len(df_with_holidays))
+    origins = make_origins(len(df_with_holidays), initial, step, horizon)
+    if not origins:
+        raise ValueError("No folds: initial + horizon exceeds the available history")
+
+    print(f"\nFolds: {len(origins)} origins from {df_with_holidays.index[origins[0]].date()} "
+          f"to {df_with_holidays.index[origins[-1]].date()}, every {step} days, horizon {horizon}")
+    print(f"Models: {', '.join(models)}")
+
+    start = time.perf_counter()
+    results = run_backtest(df_with_holidays, models, origins, horizon, step, workers, config)
+    print(f"✓ Backtest finished in {time.perf_counter() - start:.1f}s")
+
+    print_summary(results)
+
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    joblib.dump(results, RESULTS_PATH)
+    print(f"\n✓ Results saved to {RESULTS_PATH}")
+    return results
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Rolling-origin backtest of ARIMA, ARIMAX and LSTM models')
+    parser.add_argument('--models', nargs='+', choices=MODELS + OPTIONAL_MODELS, default=list(MODELS))
+    parser.add_argument('--horizon', type=int, default=10, help='Forecast horizon per fold (trading days)')
+    parser.add_argument('--step', type=int, default=5, help='Days between consecutive origins')
+    parser.add_argument('--initial', type=int, default=None,
+                        help='First origin (training rows of the first fold); default is the TEST_SIZE split')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: all cores)')
+    parser.add_argument('--arima-order', type=lambda s: tuple(int(x) for x in s.split(',')), default=None,
+                        help='Fixed ARIMA order like 1,1,1 instead of the per-fold order search')
+    parser.add_argument('--epochs', type=int, default=DEFAULT_CONFIG['epochs'], help='LSTM epochs per fold')
+    args = parser.parse_args(argv)
+
+    main(args.models, args.horizon, args.step, args.initial, args.workers,
+         {'arima_order': args.arima_order, 'epochs': args.epochs})
+
+if __name__ == "__main__":
+    cli()
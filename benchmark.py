@@ -0,0 +1,292 @@
+"""
+Benchmark Script for Chili Price Prediction
+Times and memory-profiles each pipeline stage (CSV load, scaling, window
+generation, fit, predict, serialization, plotting) on the real dataset and on
+synthetic datasets of the same shape with more markets and longer history
+"""
+
+import pandas as pd
+import numpy as np
+from data_access import DATA_PATH, MARKET_COLUMNS, load_frame
+from instrumentation import PeakRssSampler
+import argparse
+import datetime
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import warnings
+warnings.filterwarnings('ignore')
+
+RESULTS_DIR = 'result/benchmarks'
+TRADING_DAYS_PER_YEAR = 261
+ENTRY_POINTS = ['train_arima.py', 'train_lstm.py', 'inference.py', 'visualize_predictions.py']
+
+def measure(records, stage, fn, **info):
+    """Run fn(), append a timing/memory record for `stage` and return fn's result"""
+    with PeakRssSampler() as sampler:
+        start = time.perf_counter()
+        result = fn()
+        seconds = time.perf_counter() - start
+    record = {
+        'stage': stage,
+        'seconds': seconds,
+        'rss_start_mb': sampler.start_rss / 2**20,
+        'rss_peak_mb': sampler.peak / 2**20,
+        'rss_delta_mb': (sampler.end_rss - sampler.start_rss) / 2**20,
+        **info,
+    }
+    records.append(record)
+    print(f"    {stage:<24} {seconds*1000:>10.1f} ms   peak RSS {record['rss_peak_mb']:>8.1f} MB"
+          f"   Δ {record['rss_delta_mb']:>+7.1f} MB")
+    return result
+
+def make_synthetic_frame(n_markets, years, seed=42, start='2016-01-01'):
+    """
+    Synthetic data in the shape of data_with_holidays.csv: business-day index,
+    one price column per market and an is_holiday flag. Prices follow a common
+    log random walk with market-specific noise and occasional spikes.
+    """
+    rng = np.random.default_rng(seed)
+    n_days = int(years * TRADING_DAYS_PER_YEAR)
+    index = pd.bdate_range(start, periods=n_days, name='Date')
+
+    common = np.cumsum(rng.normal(0, 0.03, n_days))
+    spikes = rng.random(n_days) < 0.02
+    common += np.cumsum(np.where(spikes, rng.normal(0, 0.2, n_days), 0.0)) * 0.5
+    noise = rng.normal(0, 0.05, (n_days, n_markets))
+    offsets = rng.normal(0, 0.1, n_markets)
+    prices = np.round(40000 * np.exp(common[:, None] + offsets + noise), -2)
+
+    columns = [f'Market {i:03d}' for i in range(n_markets)]
+    df = pd.DataFrame(prices, index=index, columns=columns)
+    # Holiday windows of about a week, a few times per year
+    holiday = np.zeros(n_days)
+    for begin in rng.choice(n_days, size=max(1, int(years * 6)), replace=False):
+        holiday[begin:begin + 6] = 1
+    df['is_holiday'] = holiday
+    return df
+
+def bench_dataset(name, csv_path, cache_dir, records, fit_markets=5, plot_markets=5,
+                  look_back=30, batch_size=16, lstm_epochs=1, skip_lstm=False):
+    """Run every stage on one dataset; records get the dataset name attached"""
+    from sklearn.preprocessing import MinMaxScaler
+    from statsmodels.tsa.arima.model import ARIMA
+    import joblib
+
+    stage_records = []
+    tmp_dir = tempfile.mkdtemp(prefix='bench_')
+    try:
+        df = measure(stage_records, 'load_csv', lambda: pd.read_csv(csv_path, index_col=0, parse_dates=True))
+        measure(stage_records, 'load_cache_build', lambda: load_frame(csv_path, cache_dir, refresh=True))
+        df = measure(stage_records, 'load_cache_mmap', lambda: load_frame(csv_path, cache_dir))
+
+        markets = [column for column in df.columns if column != 'is_holiday']
+        split = int(len(df) * 0.8)
+        train, test = df.iloc[:split], df.iloc[split:]
+
+        scaler = MinMaxScaler()
+        train_scaled = measure(stage_records, 'scale_fit_transform', lambda: scaler.fit_transform(train.to_numpy()))
+        test_scaled = measure(stage_records, 'scale_transform', lambda: scaler.transform(test.to_numpy()))
+
+        if not skip_lstm:
+            from tensorflow.keras.preprocessing.sequence import TimeseriesGenerator
+            from train_lstm import build_lstm_model, predict_windows
+            from windowing import make_windows, window_dataset
+
+            windows, targets = measure(stage_records, 'windows_strided', lambda: make_windows(train_scaled, look_back))
+
+            def generator_batches():
+                generator = TimeseriesGenerator(train_scaled, train_scaled, length=look_back, batch_size=batch_size)
+                return [generator[i] for i in range(len(generator))]
+            measure(stage_records, 'windows_generator', generator_batches)
+
+            n_features = train_scaled.shape[1]
+            generator = TimeseriesGenerator(train_scaled, train_scaled, length=look_back, batch_size=batch_size)
+            measure(stage_records, 'lstm_fit_generator', lambda: build_lstm_model(look_back, n_features).fit(
+                generator, epochs=lstm_epochs, verbose=0),
+                epochs=lstm_epochs, windows=len(windows))
+            lstm_model = build_lstm_model(look_back, n_features)
+            dataset = window_dataset(train_scaled, look_back, batch_size)
+            measure(stage_records, 'lstm_fit', lambda: lstm_model.fit(dataset, epochs=lstm_epochs, verbose=0),
+                    epochs=lstm_epochs, windows=len(windows))
+            test_windows, _ = make_windows(test_scaled, look_back)
+            test_generator = TimeseriesGenerator(test_scaled, test_scaled, length=look_back, batch_size=batch_size)
+            generator_predictions = measure(stage_records, 'lstm_predict_generator', lambda: np.concatenate(
+                [lstm_model.predict(test_generator[i][0], verbose=0) for i in range(len(test_generator))]),
+                windows=len(test_windows), calls=len(test_generator))
+            predictions = measure(stage_records, 'lstm_predict', lambda: predict_windows(lstm_model, test_windows),
+                                  windows=len(test_windows), calls=1)
+            stage_records[-1]['max_abs_diff'] = float(np.max(np.abs(predictions - generator_predictions)))
+            measure(stage_records, 'lstm_save_h5', lambda: lstm_model.save(os.path.join(tmp_dir, 'lstm.h5')))
+
+        fit_subset = markets[:fit_markets]
+        exog = train['is_holiday'].to_numpy().reshape(-1, 1)
+        test_exog = test['is_holiday'].to_numpy().reshape(-1, 1)
+
+        def fit_arimax():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                return {market: ARIMA(train[market], exog=exog, order=(1, 1, 1)).fit() for market in fit_subset}
+
+        def forecast_arimax():
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                return {market: result.forecast(steps=len(test), exog=test_exog) for market, result in fitted.items()}
+
+        fitted = measure(stage_records, 'arimax_fit', fit_arimax, markets_fitted=len(fit_subset))
+        # Per-market ARIMA fits are independent, so the full cost scales linearly
+        stage_records[-1]['estimated_seconds_all_markets'] = (
+            stage_records[-1]['seconds'] * len(markets) / max(1, len(fit_subset)))
+        measure(stage_records, 'arimax_forecast', forecast_arimax)
+        measure(stage_records, 'arimax_joblib_dump', lambda: [
+            joblib.dump(result, os.path.join(tmp_dir, f'arimax_{i}.joblib')) for i, result in enumerate(fitted.values())])
+
+        def plot_panels():
+            import matplotlib
+            matplotlib.use('Agg')
+            import matplotlib.pyplot as plt
+            subset = markets[:plot_markets]
+            fig, axes = plt.subplots(len(subset), 1, figsize=(14, 3 * len(subset)), squeeze=False)
+            for ax, market in zip(axes[:, 0], subset):
+                ax.plot(test.index, test[market], 'k-', linewidth=2)
+                ax.set_title(market)
+            fig.tight_layout()
+            fig.savefig(os.path.join(tmp_dir, 'plot.png'), dpi=100)
+            plt.close(fig)
+        measure(stage_records, 'plot_savefig', plot_panels, markets=min(plot_markets, len(markets)))
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    for record in stage_records:
+        record.update({'dataset': name, 'rows': int(len(df)), 'markets': len(markets)})
+    records.extend(stage_records)
+
+def bench_entry_points(scripts=ENTRY_POINTS):
+    """
+    Time each script end to end in a scratch copy of the repo, so their
+    outputs do not overwrite the committed models and results.
+    """
+    records = []
+    scratch = tempfile.mkdtemp(prefix='bench_repo_')
+    try:
+        for item in ['data', 'models', 'result'] + [f for f in os.listdir('.') if f.endswith('.py')]:
+            source = os.path.join('.', item)
+            target = os.path.join(scratch, item)
+            if os.path.isdir(source):
+                shutil.copytree(source, target, ignore=shutil.ignore_patterns('cache', 'benchmarks'))
+            else:
+                shutil.copy2(source, target)
+
+        for script in scripts:
+            start = time.perf_counter()
+            process = subprocess.Popen([sys.executable, script], cwd=scratch,
+                                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            with PeakRssSampler(process.pid) as sampler:
+                returncode = process.wait()
+            seconds = time.perf_counter() - start
+            records.append({
+                'stage': f'entry:{script}',
+                'dataset': 'real',
+                'seconds': seconds,
+                'rss_peak_mb': sampler.peak / 2**20,
+                'returncode': returncode,
+            })
+            print(f"    {script:<28} {seconds:>8.1f} s   peak RSS {sampler.peak / 2**20:>8.1f} MB   exit {returncode}")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+    return records
+
+def environment_info():
+    """Versions and machine details stored with every result file"""
+    info = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+    }
+    try:
+        info['git_commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True,
+                                            text=True, check=True).stdout.strip()
+    except Exception:
+        info['git_commit'] = None
+    return info
+
+def compare_with(previous_path, records):
+    """Print the time ratio of each (dataset, stage) against an earlier result file"""
+    with open(previous_path) as f:
+        previous = {(r['dataset'], r['stage']): r for r in json.load(f)['records']}
+    print(f"\nComparison with {previous_path} (ratio > 1 means slower now):")
+    for record in records:
+        before = previous.get((record['dataset'], record['stage']))
+        if before and before['seconds'] > 0:
+            ratio = record['seconds'] / before['seconds']
+            flag = '  ⚠ regression' if ratio > 1.2 else ''
+            print(f"  {record['dataset']:<22} {record['stage']:<24} {ratio:>6.2f}x{flag}")
+
+def main(markets=(5, 50, 500), years=(1, 5, 10), real=True, synthetic=True, entry_points=False,
+         fit_markets=5, skip_lstm=False, output=None, compare=None):
+    print("="*80)
+    print("BENCHMARK - Chili Price Prediction")
+    print("="*80)
+
+    records = []
+    data_dir = tempfile.mkdtemp(prefix='bench_data_')
+    cache_dir = os.path.join(data_dir, 'cache')
+    try:
+        if real:
+            print(f"\nDataset: real ({DATA_PATH}, {len(MARKET_COLUMNS)} markets)")
+            bench_dataset('real', DATA_PATH, cache_dir, records, fit_markets=fit_markets, skip_lstm=skip_lstm)
+
+        if synthetic:
+            for n_markets in markets:
+                for n_years in years:
+                    name = f'synthetic_{n_markets}m_{n_years}y'
+                    print(f"\nDataset: {name}")
+                    csv_path = os.path.join(data_dir, f'{name}.csv')
+                    make_synthetic_frame(n_markets, n_years).to_csv(csv_path)
+                    bench_dataset(name, csv_path, cache_dir, records, fit_markets=fit_markets, skip_lstm=skip_lstm)
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+    if entry_points:
+        print("\nEntry points (end to end, real data):")
+        records.extend(bench_entry_points())
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    output = output or os.path.join(RESULTS_DIR, f'benchmark_{stamp}.json')
+    with open(output, 'w') as f:
+        json.dump({'created': stamp, 'environment': environment_info(), 'records': records}, f, indent=2)
+    print(f"\n✓ Benchmark results saved to: {output}")
+
+    if compare:
+        compare_with(compare, records)
+    return records
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Benchmark training and inference stages')
+    parser.add_argument('--markets', type=int, nargs='+', default=[5, 50, 500], help='Synthetic market counts')
+    parser.add_argument('--years', type=int, nargs='+', default=[1, 5, 10], help='Synthetic history lengths')
+    parser.add_argument('--no-real', action='store_true', help='Skip the real dataset')
+    parser.add_argument('--no-synthetic', action='store_true', help='Skip the synthetic datasets')
+    parser.add_argument('--entry-points', action='store_true',
+                        help='Also time the four scripts end to end (in a scratch copy of the repo)')
+    parser.add_argument('--fit-markets', type=int, default=5,
+                        help='Markets to fit ARIMAX on per dataset (time for all markets is extrapolated)')
+    parser.add_argument('--skip-lstm', action='store_true', help='Skip the TensorFlow stages')
+    parser.add_argument('--output', help='Result file (default: result/benchmarks/benchmark_<timestamp>.json)')
+    parser.add_argument('--compare', help='Earlier result file to compare stage times against')
+    args = parser.parse_args(argv)
+
+    main(args.markets, args.years, not args.no_real, not args.no_synthetic, args.entry_points,
+         args.fit_markets, args.skip_lstm, args.output, args.compare)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,257 @@
+"""
+Calendar Features for Chili Price Prediction
+Holiday and calendar features for any date, past or future, built on the
+`holidays` package for Indonesia. The features are precomputed once into a
+dense day-indexed array (cached under data/cache), so the exog of ARIMAX or
+the holiday flags of the LSTM for any forecast horizon are a slice away
+"""
+
+import pandas as pd
+import numpy as np
+from data_access import CACHE_DIR, load_market_frame
+from artifact_cache import artifact_key, atomic_open
+import argparse
+import holidays
+import os
+import time
+
+START_DATE = '2020-01-01'
+END_DATE = '2035-12-31'
+FEATURES = ('is_holiday', 'is_public_holiday', 'days_to_lebaran', 'days_since_lebaran',
+            'days_to_holiday', 'days_since_holiday', 'weekday', 'is_market_day')
+
+# Holiday windows (name, first day, last day) around the Indonesian holidays,
+# as used for the is_holiday column of data_with_holidays.csv
+HOLIDAY_PERIODS = [
+    ('New Year 2024', '2023-12-25', '2024-01-01'),
+    ('New Year 2025', '2024-12-23', '2025-01-01'),
+    ('Imlek 2024', '2024-02-05', '2024-02-12'),
+    ('Imlek 2025', '2025-01-27', '2025-02-03'),
+    ('Ramadhan 2024', '2024-03-11', '2024-03-18'),
+    ('Ramadhan 2025', '2025-02-24', '2025-03-03'),
+    ('Lebaran 2024', '2024-04-01', '2024-04-10'),
+    ('Lebaran 2025', '2025-03-24', '2025-03-31'),
+    ('Idul Adha 2024', '2024-06-10', '2024-06-17'),
+    ('Idul Adha 2025', '2025-06-02', '2025-06-09'),
+    ('Christmas 2024', '2024-12-16', '2024-12-25'),
+]
+
+# Major holidays by their English name in the `holidays` package
+MAJOR_HOLIDAYS = {
+    "New Year's Day": 'New Year',
+    'Lunar New Year': 'Imlek',
+    'Eid al-Fitr': 'Lebaran',
+    'Eid al-Adha': 'Idul Adha',
+    'Christmas Day': 'Christmas',
+}
+# Years without an explicit period get the week before each major holiday and
+# the first week of Ramadhan (which starts 30 days before Lebaran)
+WINDOW_DAYS = 7
+RAMADHAN_DAYS_BEFORE_LEBARAN = 30
+
+_loaded = {}
+
+def public_holidays(years):
+    """{date: [names]} of the Indonesian public holidays in `years` (English names, '(estimated)' dropped)"""
+    calendar = holidays.Indonesia(years=years, language='en_US')
+    return {pd.Timestamp(day): [name.replace(' (estimated)', '') for name in names.split('; ')]
+            for day, names in sorted(calendar.items())}
+
+def major_holiday_dates(years):
+    """{event: [dates]} of the major holidays (New Year, Imlek, Lebaran, Idul Adha, Christmas)"""
+    events = {event: [] for event in MAJOR_HOLIDAYS.values()}
+    for day, names in public_holidays(years).items():
+        for name in names:
+            if name in MAJOR_HOLIDAYS:
+                events[MAJOR_HOLIDAYS[name]].append(day)
+    return events
+
+def holiday_windows(years):
+    """
+    Holiday windows (name, first day, last day) for `years`: HOLIDAY_PERIODS
+    where defined, otherwise derived from the major holiday dates.
+    """
+    windows = {}
+    for event, days in major_holiday_dates(years).items():
+        for day in days:
+            windows[f'{event} {day.year}'] = (day - pd.Timedelta(days=WINDOW_DAYS), day)
+            if event == 'Lebaran':
+                start = day - pd.Timedelta(days=RAMADHAN_DAYS_BEFORE_LEBARAN)
+                windows[f'Ramadhan {day.year}'] = (start, start + pd.Timedelta(days=WINDOW_DAYS))
+    for name, start, end in HOLIDAY_PERIODS:
+        windows[name] = (pd.Timestamp(start), pd.Timestamp(end))
+    return sorted(((name, start, end) for name, (start, end) in windows.items()), key=lambda window: window[1])
+
+def _days_to_next(days, events):
+    """Days from each day to the next event (0 on the day itself), NaN after the last"""
+    position = np.searchsorted(events, days, side='left')
+    found = position < len(events)
+    result = np.full(len(days), np.nan)
+    result[found] = events[position[found]] - days[found]
+    return result
+
+def _days_since_last(days, events):
+    """Days from the previous event to each day (0 on the day itself), NaN before the first"""
+    position = np.searchsorted(events, days, side='right') - 1
+    found = position >= 0
+    result = np.full(len(days), np.nan)
+    result[found] = days[found] - events[position[found]]
+    return result
+
+def build_features(start=START_DATE, end=END_DATE):
+    """(days, FEATURES) float64 array, one row per calendar day from `start` to `end`"""
+    dates = pd.date_range(start, end, freq='D')
+    # One extra year on each side so distances near the range edges are known
+    years = range(dates[0].year - 1, dates[-1].year + 2)
+    origin = dates[0]
+    days = np.arange(len(dates))
+
+    def offsets(timestamps):
+        return np.array(sorted((pd.Timestamp(day) - origin).days for day in timestamps), dtype=np.int64)
+
+    is_holiday = np.zeros(len(dates))
+    for _, first, last in holiday_windows(years):
+        lo, hi = max((first - origin).days, 0), min((last - origin).days + 1, len(dates))
+        if lo < hi:
+            is_holiday[lo:hi] = 1.0
+    public = offsets(public_holidays(years))
+    events = major_holiday_dates(years)
+    lebaran = offsets(events['Lebaran'])
+    major = offsets(day for event_days in events.values() for day in event_days)
+
+    features = np.column_stack([
+        is_holiday,
+        np.isin(days, public).astype(np.float64),
+        _days_to_next(days, lebaran),
+        _days_since_last(days, lebaran),
+        _days_to_next(days, major),
+        _days_since_last(days, major),
+        dates.weekday.to_numpy(dtype=np.float64),
+        # Prices are reported Monday to Friday, public holidays included
+        (dates.weekday < 5).astype(np.float64),
+    ])
+    return np.ascontiguousarray(features)
+
+def calendar_key(start=START_DATE, end=END_DATE):
+    """Cache key: the date range, the holiday rules and the `holidays` version"""
+    return artifact_key('calendar', {
+        'start': str(start), 'end': str(end), 'features': FEATURES,
+        'periods': HOLIDAY_PERIODS, 'major': MAJOR_HOLIDAYS,
+        'window_days': WINDOW_DAYS, 'ramadhan': RAMADHAN_DAYS_BEFORE_LEBARAN,
+    }, packages=('holidays',))
+
+class CalendarFeatures:
+    """
+    Dense day-indexed calendar features from `start` to `end`.
+
+    Row r holds the features of day start + r, so a date maps to its row by
+    subtraction and a run of consecutive days is a view of the array.
+    """
+
+    def __init__(self, values, start=START_DATE):
+        self.values = values
+        self.start = pd.Timestamp(start)
+        self._origin = np.datetime64(self.start.date(), 'D')
+        self.end = self.start + pd.Timedelta(days=len(values) - 1)
+        self.columns = FEATURES
+
+    @classmethod
+    def load(cls, start=START_DATE, end=END_DATE, cache_dir=CACHE_DIR, refresh=False):
+        """Features from the .npy cache (memory-mapped), built and saved first if missing"""
+        path = os.path.join(cache_dir, f'calendar_{calendar_key(start, end)}.npy')
+        if refresh or not os.path.exists(path):
+            os.makedirs(cache_dir, exist_ok=True)
+            with atomic_open(path) as f:
+                np.save(f, build_features(start, end))
+        return cls(np.load(path, mmap_mode='r'), start)
+
+    def rows(self, dates):
+        """Row of each date; dates outside the precomputed range raise ValueError"""
+        rows = (np.asarray(dates, dtype='datetime64[D]') - self._origin).astype(np.int64)
+        if len(rows) and (rows.min() < 0 or rows.max() >= len(self.values)):
+            raise ValueError(f"Dates outside the calendar range {self.start.date()} to {self.end.date()}")
+        return rows
+
+    @staticmethod
+    def _names(columns):
+        return [columns] if isinstance(columns, str) else list(columns)
+
+    def _positions(self, columns):
+        return [FEATURES.index(column) for column in self._names(columns)]
+
+    def window(self, start, days, columns=FEATURES):
+        """(days, columns) features of `days` consecutive days from `start`, as a view"""
+        first = self.rows([start])[0]
+        if first + days > len(self.values):
+            raise ValueError(f"Dates outside the calendar range {self.start.date()} to {self.end.date()}")
+        block = self.values[first:first + days]
+        return block if self._names(columns) == list(FEATURES) else block[:, self._positions(columns)]
+
+    def features(self, dates, columns=FEATURES):
+        """(len(dates), columns) features of arbitrary dates, e.g. the next trading days"""
+        return self.values[self.rows(dates)][:, self._positions(columns)]
+
+    def exog(self, dates):
+        """(len(dates), 1) is_holiday exog of ARIMAX for the given dates"""
+        return self.features(dates, ['is_holiday'])
+
+    def frame(self, dates, columns=FEATURES):
+        """Features of `dates` as a date-indexed DataFrame"""
+        index = pd.DatetimeIndex(dates)
+        return pd.DataFrame(self.features(index, columns), index=index, columns=self._names(columns))
+
+def load_calendar(start=START_DATE, end=END_DATE):
+    """CalendarFeatures shared within the process (loaded from the cache once)"""
+    if (start, end) not in _loaded:
+        _loaded[(start, end)] = CalendarFeatures.load(start, end)
+    return _loaded[(start, end)]
+
+def main(start=None, days=10, refresh=False):
+    print("="*80)
+    print("CALENDAR FEATURES - Indonesian holidays for past and future dates")
+    print("="*80)
+
+    begin = time.perf_counter()
+    calendar = CalendarFeatures.load(refresh=refresh)
+    _loaded[(START_DATE, END_DATE)] = calendar
+    print(f"\n✓ {len(calendar.values):,} days x {len(FEATURES)} features "
+          f"({calendar.start.date()} to {calendar.end.date()}) ready in {time.perf_counter() - begin:.2f}s")
+
+    # The derived flags must reproduce the preprocessed is_holiday column
+    df_with_holidays = load_market_frame()
+    derived = calendar.exog(df_with_holidays.index)[:, 0]
+    mismatches = int(np.sum(derived != df_with_holidays['is_holiday'].to_numpy()))
+    if mismatches:
+        print(f"⚠ is_holiday differs from the data on {mismatches} of {len(derived)} days")
+    else:
+        print(f"✓ is_holiday matches the data on all {len(derived)} days "
+              f"({df_with_holidays.index[0].date()} to {df_with_holidays.index[-1].date()})")
+
+    start = pd.Timestamp(start) if start else df_with_holidays.index[-1] + pd.Timedelta(days=1)
+    dates = pd.bdate_range(start, periods=days, name='Date')
+    begin = time.perf_counter()
+    for _ in range(1000):
+        calendar.exog(dates)
+    print(f"✓ Exog for {days} trading days in {(time.perf_counter() - begin) * 1000:.3f} µs per call")
+
+    print(f"\nFeatures from {dates[0].date()}:")
+    print(calendar.frame(dates).astype({'weekday': int}).to_string())
+
+    years = range(start.year, start.year + 2)
+    print(f"\nHoliday windows {years[0]}-{years[-1]}:")
+    for name, first, last in holiday_windows(years):
+        if first.year in years or last.year in years:
+            print(f"  {name:<20} {first.date()} to {last.date()}")
+    return calendar
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Build the calendar feature cache and show upcoming features')
+    parser.add_argument('--start', default=None, help='First date to show (default: the day after the data)')
+    parser.add_argument('--days', type=int, default=10, help='Trading days to show')
+    parser.add_argument('--refresh', action='store_true', help='Rebuild the cached features')
+    args = parser.parse_args(argv)
+    main(args.start, args.days, args.refresh)
+
+if __name__ == "__main__":
+    cli()
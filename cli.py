@@ -0,0 +1,106 @@
+"""
+Command-Line Entry Point for Chili Price Prediction
+One command with a subcommand per script. Each script module is imported only
+when its subcommand runs, so TensorFlow, statsmodels and matplotlib are loaded
+only by the subcommands that use them
+"""
+
+import argparse
+import importlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+# Subcommand -> (module, summary); the module's cli(argv, prog) parses the rest
+COMMANDS = {
+    'ingest': ('ingest', 'Ingest the raw export into melted/cleaned CSVs'),
+    'preprocess': ('preprocess', 'Impute, add the holiday flag and fit the scalers'),
+    'train-arima': ('train_arima', 'Train or update the ARIMA/ARIMAX models'),
+    'train-lstm': ('train_lstm', 'Train the LSTM models'),
+    'train-prophet': ('train_prophet', 'Train the Prophet models'),
+    'forecast': ('inference', 'Forecast with the saved models, or print test-set tables'),
+    'plot': ('visualize_predictions', 'Plot test-set predictions'),
+    'pipeline': ('pipeline', 'Run the out-of-date pipeline stages (ingest to plots)'),
+    'serve': ('serve', 'Serve forecasts over HTTP (or load-test the service)'),
+    'bench': ('benchmark', 'Benchmark pipeline stages'),
+    'backtest': ('backtest', 'Walk-forward backtest'),
+    'ensemble': ('ensemble', 'Learn per-market ensemble weights over the base models'),
+    'calendar': ('calendar_features', 'Build the holiday/calendar feature cache'),
+    'evaluate': ('evaluation', 'Bootstrap confidence intervals and Diebold-Mariano tests'),
+    'tune-lstm': ('tune_lstm', 'Search LSTM hyperparameters'),
+    'export-lstm': ('lstm_runtime', 'Export LSTM models to the NumPy runtime'),
+    'export-arima': ('arima_format', 'Export ARIMA models to the compact format'),
+}
+
+HEAVY_MODULES = ('tensorflow', 'statsmodels', 'prophet', 'matplotlib', 'sklearn', 'pandas')
+
+def run_command(command, argv):
+    """Import the subcommand's module and hand it the remaining arguments"""
+    module_name = COMMANDS[command][0]
+    module = importlib.import_module(module_name)
+    return module.cli(argv, prog=f'{os.path.basename(sys.argv[0])} {command}')
+
+_STARTUP_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import cli
+try:
+    cli.main({argv!r})
+except SystemExit:
+    pass
+print(json.dumps({{'seconds': time.perf_counter() - start,
+                  'heavy': [name for name in cli.HEAVY_MODULES if name in sys.modules]}}))
+"""
+
+def measure_startup(commands=None):
+    """
+    Time each subcommand up to argument parsing (`<command> --help`) in a fresh
+    interpreter, and record which heavy libraries it imported.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for command in [None] + list(commands or COMMANDS):
+        argv = ['--help'] if command is None else [command, '--help']
+        start = time.perf_counter()
+        completed = subprocess.run([sys.executable, '-c', _STARTUP_PROBE.format(argv=argv)], cwd=here,
+                                   capture_output=True, text=True, check=True,
+                                   env={**os.environ, 'TF_CPP_MIN_LOG_LEVEL': '3'})
+        wall = time.perf_counter() - start
+        probe = json.loads(completed.stdout.strip().splitlines()[-1])
+        results[command or '(none)'] = {'import_seconds': probe['seconds'], 'process_seconds': wall,
+                                       'heavy_modules': probe['heavy']}
+    return results
+
+def print_startup(results):
+    print("="*80)
+    print("CLI STARTUP TIME PER SUBCOMMAND (fresh process, up to argument parsing)")
+    print("="*80)
+    print(f"{'Subcommand':<14} {'Imports':>9} {'Process':>9}  Heavy modules loaded")
+    print("-"*80)
+    for command, result in results.items():
+        heavy = ', '.join(result['heavy_modules']) or '-'
+        print(f"{command:<14} {result['import_seconds']:>8.2f}s {result['process_seconds']:>8.2f}s  {heavy}")
+
+def main(argv=None):
+    commands = '\n'.join(f'  {name:<13} {summary}' for name, (_, summary) in COMMANDS.items())
+    parser = argparse.ArgumentParser(
+        description='Chili price prediction pipeline',
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog=f'subcommands:\n{commands}\n  startup       Measure the startup time of every subcommand\n\n'
+               f'Run "%(prog)s <subcommand> --help" for the options of a subcommand.')
+    parser.add_argument('command', choices=list(COMMANDS) + ['startup'], metavar='subcommand')
+    parser.add_argument('args', nargs=argparse.REMAINDER, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.command == 'startup':
+        unknown = [command for command in args.args if command not in COMMANDS]
+        if unknown:
+            parser.error(f"unknown subcommands for startup: {', '.join(unknown)}")
+        print_startup(measure_startup(args.args or None))
+        return
+    return run_command(args.command, args.args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""
+Shared Data Access for Chili Price Prediction
+Loads date-indexed CSV tables (data/processed/data_with_holidays.csv by default)
+through a binary columnar cache so every script gets the market matrix as a
+memory-mapped NumPy array instead of re-parsing the CSV on each run
+"""
+
+import pandas as pd
+import numpy as np
+from artifact_cache import atomic_open
+import hashlib
+import json
+import os
+
+DATA_PATH = 'data/processed/data_with_holidays.csv'
+CACHE_DIR = 'data/cache'
+CACHE_VERSION = 1
+
+MARKET_COLUMNS = ['Pasar Sukaramai', 'Pasar Aksara', 'Pasar Petisah', 'Pusat Pasar', 'Pasar Brayan']
+TEST_SIZE = 0.2
+
+def split_index(n_rows, test_size=TEST_SIZE):
+    """Row where the chronological test split starts"""
+    return int(n_rows * (1 - test_size))
+
+def _cache_paths(csv_path, cache_dir):
+    """Values, index and metadata files of the cache for one CSV"""
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    base = os.path.join(cache_dir, name)
+    return {
+        'values': f'{base}.values.npy',
+        'index': f'{base}.index.npy',
+        'meta': f'{base}.meta.json',
+    }
+
+def _file_hash(path):
+    """SHA-256 of a file, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _source_stat(csv_path):
+    stat = os.stat(csv_path)
+    return {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+def _atomic_save(path, array):
+    """Write an .npy file via a unique temporary name so readers never see a partial file"""
+    with atomic_open(path) as f:
+        np.save(f, array)
+
+def _atomic_write_json(path, data):
+    with atomic_open(path, 'w') as f:
+        json.dump(data, f, indent=2)
+
+def build_cache(csv_path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Parse the CSV once and write its float64 matrix, date index and metadata"""
+    df = pd.read_csv(csv_path, index_col=0, parse_dates=True)
+    paths = _cache_paths(csv_path, cache_dir)
+    os.makedirs(cache_dir, exist_ok=True)
+
+    _atomic_save(paths['values'], np.ascontiguousarray(df.to_numpy(dtype=np.float64)))
+    _atomic_save(paths['index'], df.index.values.astype('datetime64[ns]'))
+
+    meta = {
+        'version': CACHE_VERSION,
+        'source': os.path.abspath(csv_path),
+        'sha256': _file_hash(csv_path),
+        'columns': [str(column) for column in df.columns],
+        'index_name': df.index.name,
+        'shape': list(df.shape),
+        **_source_stat(csv_path),
+    }
+    # Metadata goes last: it is what marks the cache as complete
+    _atomic_write_json(paths['meta'], meta)
+    return meta
+
+def _read_meta(meta_path):
+    try:
+        with open(meta_path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def ensure_cache(csv_path=DATA_PATH, cache_dir=CACHE_DIR, refresh=False):
+    """
+    Return cache metadata for `csv_path`, rebuilding the cache if it is stale.
+
+    The cache is fresh when the source's mtime and size are unchanged. If only
+    the mtime changed (e.g. the file was rewritten with identical content) the
+    SHA-256 decides, and a matching hash just records the new mtime.
+    """
+    paths = _cache_paths(csv_path, cache_dir)
+    meta = None if refresh else _read_meta(paths['meta'])
+    if (meta is None or meta.get('version') != CACHE_VERSION
+            or not os.path.exists(paths['values']) or not os.path.exists(paths['index'])):
+        return build_cache(csv_path, cache_dir)
+
+    stat = _source_stat(csv_path)
+    if stat['mtime_ns'] == meta['mtime_ns'] and stat['size'] == meta['size']:
+        return meta
+    if stat['size'] == meta['size'] and _file_hash(csv_path) == meta['sha256']:
+        meta.update(stat)
+        _atomic_write_json(paths['meta'], meta)
+        return meta
+    return build_cache(csv_path, cache_dir)
+
+def load_frame(csv_path=DATA_PATH, cache_dir=CACHE_DIR, refresh=False):
+    """
+    Load a date-indexed CSV as a DataFrame backed by a read-only memory map.
+
+    All columns come back as float64 (is_holiday included) so the frame is a
+    single block over the mapped matrix and no data is copied on load.
+    """
+    meta = ensure_cache(csv_path, cache_dir, refresh=refresh)
+    paths = _cache_paths(csv_path, cache_dir)
+
+    values = np.load(paths['values'], mmap_mode='r')
+    index = pd.DatetimeIndex(np.load(paths['index']), name=meta['index_name'])
+    return pd.DataFrame(values, index=index, columns=meta['columns'], copy=False)
+
+def load_market_frame(refresh=False):
+    """Load data/processed/data_with_holidays.csv through the shared cache"""
+    return load_frame(DATA_PATH, CACHE_DIR, refresh=refresh)
+
+def data_fingerprint(csv_path=DATA_PATH, cache_dir=CACHE_DIR):
+    """Content hash of the current source data (cheap once the cache is warm)"""
+    return ensure_cache(csv_path, cache_dir)['sha256']
@@ -0,0 +1,230 @@
+"""
+Ensemble Forecaster for Chili Price Prediction
+Combines ARIMA, ARIMAX, both LSTM variants (and Prophet when installed) with
+per-market weights learned from their walk-forward forecasts. Base forecasts
+are stored by (model, market, origin date, horizon), so a new ensemble or a
+reweighting never re-runs the base models
+"""
+
+import numpy as np
+import pandas as pd
+from scipy.optimize import nnls
+from artifact_cache import atomic_open
+from data_access import MARKET_COLUMNS, split_index, load_market_frame
+from backtest import DEFAULT_CONFIG, MODELS, OPTIONAL_MODELS, fold_job, make_origins, run_folds
+from evaluation import error_metrics
+import argparse
+import joblib
+import os
+import time
+
+STORE_PATH = 'result/ensemble/base_forecasts.joblib'
+WEIGHTS_PATH = 'models/ensemble/ensemble_weights.joblib'
+METHODS = ('inverse', 'stacking', 'equal')
+
+class ForecastStore:
+    """
+    Base-model forecasts keyed by (model, market, origin date, horizon).
+
+    A value is the model's `horizon`-step forecast made at the origin date (the
+    first forecast day), stored with the backtest fold key it came from. That
+    key covers the fold config and the training data, so a forecast made with
+    other settings or before a revision of past prices counts as missing and
+    is replaced. The whole store is one joblib file, read once.
+    """
+
+    def __init__(self, path=STORE_PATH, refresh=False):
+        self.path = path
+        self.forecasts = joblib.load(path) if os.path.exists(path) and not refresh else {}
+        self.added = 0
+
+    @staticmethod
+    def key(model, market, origin, horizon):
+        return (model, market, pd.Timestamp(origin), int(horizon))
+
+    def has_fold(self, model, origin, horizon, fingerprint):
+        """True when the forecasts of every market are stored for this fold key"""
+        for market in MARKET_COLUMNS:
+            entry = self.forecasts.get(self.key(model, market, origin, horizon))
+            # Entries of older stores are bare arrays without a fold key
+            if not isinstance(entry, tuple) or entry[0] != fingerprint:
+                return False
+        return True
+
+    def put(self, model, origin, horizon, fingerprint, forecast):
+        """Store a (horizon, markets) forecast with its fold key"""
+        for idx, market in enumerate(MARKET_COLUMNS):
+            self.forecasts[self.key(model, market, origin, horizon)] = (
+                fingerprint, np.asarray(forecast[:, idx], dtype=np.float64))
+        self.added += 1
+
+    def fold(self, model, origin, horizon):
+        """Stored (horizon, markets) forecast"""
+        return np.column_stack([self.forecasts[self.key(model, market, origin, horizon)][1]
+                                for market in MARKET_COLUMNS])
+
+    def save(self):
+        if not self.added:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with atomic_open(self.path) as f:
+            joblib.dump(self.forecasts, f)
+        self.added = 0
+
+def collect_base_forecasts(df, models, origins, horizon, store, workers=None, config=None):
+    """
+    (models, folds, horizon, markets) forecasts of every model at every origin.
+
+    Only (model, origin) pairs whose fold key (config and training data, see
+    backtest.fold_key) is missing from the store are computed, through the
+    backtest folds (which have their own fit cache); the store is then updated.
+    """
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    jobs = {(model, origin): fold_job(df, model, origin, horizon, config) for model in models for origin in origins}
+    missing = [(model, origin) for (model, origin), job in jobs.items()
+               if not store.has_fold(model, df.index[origin], horizon, job[5])]
+    print(f"  {len(jobs) - len(missing)} of {len(jobs)} "
+          f"(model, origin) forecasts in the store, {len(missing)} to compute")
+    if missing:
+        outcomes = run_folds([jobs[pair] for pair in missing], workers)
+        for model, origin in missing:
+            key = jobs[(model, origin)][5]
+            store.put(model, df.index[origin], horizon, key, outcomes[key])
+        store.save()
+    return np.stack([[store.fold(model, df.index[origin], horizon) for origin in origins] for model in models])
+
+def fit_weights(forecasts, actual, method='inverse'):
+    """
+    (models, markets) combination weights, each market's summing to 1.
+
+    forecasts is (models, folds, horizon, markets), actual (folds, horizon, markets).
+    'inverse' weights each model by 1 / MSE, 'stacking' regresses the actuals on
+    the base forecasts with non-negative coefficients (rescaled to sum to 1) and
+    'equal' averages the models.
+    """
+    n_models, n_markets = forecasts.shape[0], forecasts.shape[-1]
+    if method == 'equal':
+        return np.full((n_models, n_markets), 1 / n_models)
+    if method == 'inverse':
+        mse = np.mean((forecasts - actual) ** 2, axis=(1, 2))
+        inverse = 1 / np.maximum(mse, np.finfo(float).tiny)
+        return inverse / inverse.sum(axis=0)
+    if method == 'stacking':
+        weights = np.empty((n_models, n_markets))
+        for idx in range(n_markets):
+            coefficients, _ = nnls(forecasts[..., idx].reshape(n_models, -1).T, actual[..., idx].ravel())
+            total = coefficients.sum()
+            weights[:, idx] = coefficients / total if total > 0 else 1 / n_models
+        return weights
+    raise ValueError(f"Unknown method '{method}', expected one of {METHODS}")
+
+def combine(forecasts, weights):
+    """Weighted sum over the leading model axis: (models, ..., markets) x (models, markets)"""
+    return np.einsum('k...m,km->...m', forecasts, weights)
+
+def holdout_split(origins, horizon, train_fraction):
+    """
+    Fold indices to fit weights on and to score them on. Holdout folds start
+    `horizon` rows after the last training origin, so no actual used for the
+    weights falls inside a holdout forecast window.
+    """
+    n_train = max(1, int(len(origins) * train_fraction))
+    first_holdout = origins[n_train - 1] + horizon
+    holdout = [idx for idx, origin in enumerate(origins) if origin >= first_holdout]
+    return np.arange(n_train), np.array(holdout, dtype=int)
+
+def evaluate_methods(forecasts, actual, models, train_idx, holdout_idx):
+    """Holdout RMSE/MAE/MAPE of every base model and every ensemble method, (markets,) arrays each"""
+    flat_actual = actual[holdout_idx].reshape(-1, actual.shape[-1])
+    holdout = forecasts[:, holdout_idx].reshape(len(models), -1, actual.shape[-1])
+    base = error_metrics(flat_actual, holdout, axis=-2)
+    scores = {model: {name: values[idx] for name, values in base.items()} for idx, model in enumerate(models)}
+    for method in METHODS:
+        weights = fit_weights(forecasts[:, train_idx], actual[train_idx], method)
+        scores[f'ensemble_{method}'] = error_metrics(flat_actual, combine(holdout, weights), axis=0)
+    return scores
+
+def load_weights(path=WEIGHTS_PATH):
+    """Saved ensemble ({'method', 'models', 'weights': {market: {model: weight}}, ...}), or None"""
+    return joblib.load(path) if os.path.exists(path) else None
+
+def main(models=MODELS, method='inverse', horizon=10, step=5, initial=None, workers=None,
+         train_fraction=0.6, refresh=False, config=None):
+    print("="*80)
+    print("ENSEMBLE - Per-market weights over the base models")
+    print("="*80)
+
+    df_with_holidays = load_market_frame()
+    initial = initial or split_index(len(df_with_holidays))
+    origins = make_origins(len(df_with_holidays), initial, step, horizon)
+    if not origins:
+        raise ValueError("No folds: initial + horizon exceeds the available history")
+    print(f"\nFolds: {len(origins)} origins from {df_with_holidays.index[origins[0]].date()} "
+          f"to {df_with_holidays.index[origins[-1]].date()}, every {step} days, horizon {horizon}")
+    print(f"Base models: {', '.join(models)}")
+
+    start = time.perf_counter()
+    store = ForecastStore(refresh=refresh)
+    forecasts = collect_base_forecasts(df_with_holidays, models, origins, horizon, store, workers, config)
+    actual = np.stack([df_with_holidays[MARKET_COLUMNS].to_numpy()[origin:origin + horizon] for origin in origins])
+    print(f"✓ Base forecasts ready in {time.perf_counter() - start:.2f}s")
+
+    train_idx, holdout_idx = holdout_split(origins, horizon, train_fraction)
+    if len(holdout_idx):
+        start = time.perf_counter()
+        scores = evaluate_methods(forecasts, actual, models, train_idx, holdout_idx)
+        print(f"\nHoldout: weights fit on {len(train_idx)} folds, scored on {len(holdout_idx)} later folds "
+              f"({(time.perf_counter() - start) * 1000:.1f} ms for all methods)")
+        print(f"{'Model':<20} {'RMSE':>12} {'MAE':>12} {'MAPE':>9}")
+        print("-"*56)
+        for name, metrics in scores.items():
+            print(f"{name:<20} {np.nanmean(metrics['rmse']):>12,.2f} {np.nanmean(metrics['mae']):>12,.2f} "
+                  f"{np.nanmean(metrics['mape']):>8.2f}%")
+    else:
+        scores = None
+        print("\n⚠ Too few folds for a holdout; weights are fit without evaluation")
+
+    # The saved weights use every fold
+    weights = fit_weights(forecasts, actual, method)
+    print(f"\nWeights ({method}, all {len(origins)} folds):")
+    print(f"{'Market':<20}" + ''.join(f"{model:>14}" for model in models))
+    print("-"*(20 + 14 * len(models)))
+    for idx, market in enumerate(MARKET_COLUMNS):
+        print(f"{market:<20}" + ''.join(f"{weight:>14.3f}" for weight in weights[:, idx]))
+
+    ensemble = {
+        'method': method,
+        'models': list(models),
+        'weights': {market: {model: float(weights[k, idx]) for k, model in enumerate(models)}
+                    for idx, market in enumerate(MARKET_COLUMNS)},
+        'horizon': horizon,
+        'origins': [df_with_holidays.index[origin] for origin in origins],
+        'holdout_scores': scores,
+    }
+    os.makedirs(os.path.dirname(WEIGHTS_PATH), exist_ok=True)
+    joblib.dump(ensemble, WEIGHTS_PATH)
+    print(f"\n✓ Weights saved to {WEIGHTS_PATH} (used by the 'ensemble' model in inference.py)")
+    return ensemble
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Learn per-market ensemble weights over the base models')
+    parser.add_argument('--models', nargs='+', choices=MODELS + OPTIONAL_MODELS, default=list(MODELS))
+    parser.add_argument('--method', choices=METHODS, default='inverse', help='Weighting of the saved ensemble')
+    parser.add_argument('--horizon', type=int, default=10, help='Forecast horizon per fold (trading days)')
+    parser.add_argument('--step', type=int, default=5, help='Days between consecutive origins')
+    parser.add_argument('--initial', type=int, default=None,
+                        help='First origin (training rows of the first fold); default is the TEST_SIZE split')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes for missing base forecasts')
+    parser.add_argument('--train-fraction', type=float, default=0.6,
+                        help='Share of the folds used to fit the weights for the holdout comparison')
+    parser.add_argument('--arima-order', type=lambda s: tuple(int(x) for x in s.split(',')), default=None,
+                        help='Fixed ARIMA order like 1,1,1 instead of the per-fold order search')
+    parser.add_argument('--epochs', type=int, default=DEFAULT_CONFIG['epochs'], help='LSTM epochs per fold')
+    parser.add_argument('--refresh', action='store_true', help='Drop the stored base forecasts and recompute them')
+    args = parser.parse_args(argv)
+    main(args.models, args.method, args.horizon, args.step, args.initial, args.workers, args.train_fraction,
+         args.refresh, config={'arima_order': args.arima_order, 'epochs': args.epochs})
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,224 @@
+"""
+Evaluation for Chili Price Prediction
+Vectorized forecast metrics (RMSE, MAE, MAPE) over any number of markets,
+models and horizons, moving-block bootstrap confidence intervals, and the
+Diebold-Mariano test for comparing two forecasts
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import stats
+from data_access import MARKET_COLUMNS
+import argparse
+import joblib
+import os
+import time
+
+MAPE_CAP = 999.99
+METRICS = ('rmse', 'mae', 'mape')
+RESULTS_PATH = 'result/metrics/evaluation.pkl'
+
+def calculate_mape(actual, predicted):
+    """Calculate Mean Absolute Percentage Error"""
+    mask = actual != 0
+    if mask.sum() == 0:
+        return np.nan
+    mape = np.mean(np.abs((actual[mask] - predicted[mask]) / actual[mask])) * 100
+    return min(mape, MAPE_CAP)
+
+def _pointwise_losses(actual, predicted):
+    """Stacked squared error, absolute error, absolute percentage error and MAPE mask"""
+    actual = np.asarray(actual, dtype=np.float64)
+    errors = np.asarray(predicted, dtype=np.float64) - actual
+    abs_errors = np.abs(errors)
+    valid = actual != 0
+    ape = np.where(valid, abs_errors / np.where(valid, np.abs(actual), 1.0), 0.0)
+    return np.stack(np.broadcast_arrays(errors ** 2, abs_errors, ape, valid.astype(np.float64)))
+
+def _metrics_from_means(means):
+    """RMSE, MAE and MAPE from averaged _pointwise_losses()"""
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mape = np.minimum(means[2] / means[3] * 100, MAPE_CAP)
+    return {
+        'rmse': np.sqrt(means[0]),
+        'mae': means[1],
+        'mape': np.where(means[3] > 0, mape, np.nan),
+    }
+
+def error_metrics(actual, predicted, axis=0):
+    """
+    RMSE, MAE and MAPE reduced along `axis` (the time/fold axis).
+
+    `actual` and `predicted` are broadcast against each other and `axis`
+    indexes the broadcast shape, so e.g. (n, markets) actuals with
+    (models, n, markets) forecasts and axis=-2 give (models, markets)
+    results (the default axis=0 would reduce over the models). MAPE skips zero actuals, is NaN where every
+    actual is zero and is capped like calculate_mape().
+    """
+    losses = _pointwise_losses(actual, predicted)
+    return _metrics_from_means(losses.mean(axis=axis % (losses.ndim - 1) + 1))
+
+def default_block_size(n):
+    """Block length n^(1/3), the usual rate for the moving-block bootstrap"""
+    return max(1, int(round(n ** (1 / 3))))
+
+def block_bootstrap_indices(n, n_resamples, block_size=None, seed=0):
+    """
+    (n_resamples, n) row indices of a circular moving-block bootstrap: each
+    resample joins randomly placed blocks of consecutive rows, which keeps the
+    autocorrelation of forecast errors within a block.
+    """
+    block_size = block_size or default_block_size(n)
+    n_blocks = -(-n // block_size)
+    starts = np.random.default_rng(seed).integers(0, n, size=(n_resamples, n_blocks))
+    indices = (starts[:, :, np.newaxis] + np.arange(block_size)) % n
+    return indices.reshape(n_resamples, -1)[:, :n]
+
+def bootstrap_ci(actual, predicted, n_resamples=2000, block_size=None, confidence=0.95, seed=0):
+    """
+    Point estimates and percentile confidence intervals of every metric.
+
+    `actual` is (n, markets) and `predicted` (..., n, markets), e.g. with a
+    leading model axis. All resamples are computed in one matrix product.
+    Returns {metric: (point, low, high)}, each (..., markets).
+    """
+    losses = _pointwise_losses(actual, predicted)
+    n = losses.shape[-2]
+    indices = block_bootstrap_indices(n, n_resamples, block_size, seed)
+    # A resample mean is a weighted sum of the rows, weighted by how often each was
+    # drawn, so all resamples are one (resamples, n) @ (..., n, markets) product
+    offsets = n * np.arange(n_resamples)[:, np.newaxis]
+    counts = np.bincount((indices + offsets).ravel(), minlength=n_resamples * n).reshape(n_resamples, n)
+    samples = _metrics_from_means(np.matmul(counts / n, losses))
+    point = _metrics_from_means(losses.mean(axis=-2))
+    tail = (1 - confidence) / 2 * 100
+    return {metric: (point[metric],
+                     np.nanpercentile(samples[metric], tail, axis=-2),
+                     np.nanpercentile(samples[metric], 100 - tail, axis=-2))
+            for metric in METRICS}
+
+def diebold_mariano(actual, predicted_a, predicted_b, horizon=1, power=2):
+    """
+    Diebold-Mariano test of equal accuracy with the Harvey-Leybourne-Newbold
+    small-sample correction, along axis 0 (vectorized over the other axes).
+
+    The loss differential is |e_a|^power - |e_b|^power; its long-run variance
+    uses autocovariances up to lag horizon - 1. A negative statistic means
+    forecast A has the lower loss. Returns {'statistic', 'p_value'} (two-sided,
+    Student t with n - 1 degrees of freedom).
+    """
+    actual = np.asarray(actual, dtype=np.float64)
+    loss_a = np.abs(np.asarray(predicted_a, dtype=np.float64) - actual) ** power
+    loss_b = np.abs(np.asarray(predicted_b, dtype=np.float64) - actual) ** power
+    d = loss_a - loss_b
+    n = d.shape[0]
+    centered = d - d.mean(axis=0)
+
+    long_run_var = np.mean(centered ** 2, axis=0)
+    for lag in range(1, horizon):
+        long_run_var = long_run_var + 2 * np.sum(centered[lag:] * centered[:-lag], axis=0) / n
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        statistic = d.mean(axis=0) / np.sqrt(long_run_var / n)
+    correction = np.sqrt((n + 1 - 2 * horizon + horizon * (horizon - 1) / n) / n)
+    statistic = statistic * correction
+    return {'statistic': statistic, 'p_value': 2 * stats.t.sf(np.abs(statistic), df=n - 1)}
+
+def load_test_predictions():
+    """Aligned test-set actuals and (n, markets) forecasts of the saved LSTM, ARIMA and (if trained) Prophet results"""
+    lstm_results = joblib.load('result/metrics/lstm_detailed_results.pkl')
+    arima_results = joblib.load('result/metrics/arima_detailed_results.pkl')
+    LOOK_BACK = lstm_results.get('look_back', 30)
+
+    actual = lstm_results['actual']
+    n = len(actual)
+    # ARIMA forecasts start at the first test day, LSTM LOOK_BACK days later
+    forecasts = {
+        'lstm': lstm_results['predictions_no_holiday'],
+        'lstm_holiday': lstm_results['predictions_with_holiday'],
+        'arima': np.column_stack([np.asarray(arima_results[m]['arima_forecast'])[LOOK_BACK:LOOK_BACK + n]
+                                  for m in MARKET_COLUMNS]),
+        'arimax': np.column_stack([np.asarray(arima_results[m]['arimax_forecast'])[LOOK_BACK:LOOK_BACK + n]
+                                   for m in MARKET_COLUMNS]),
+    }
+    prophet_path = 'result/metrics/prophet_detailed_results.pkl'
+    if os.path.exists(prophet_path):
+        prophet_results = joblib.load(prophet_path)
+        for model, key in (('prophet', 'prophet_pred'), ('prophet_holiday', 'prophet_holiday_pred')):
+            forecasts[model] = np.column_stack([np.asarray(prophet_results[m][key])[LOOK_BACK:LOOK_BACK + n]
+                                                for m in MARKET_COLUMNS])
+    n = min(len(values) for values in forecasts.values())
+    dates = pd.DatetimeIndex(lstm_results['test_dates'])[:n]
+    return dates, actual[:n], {model: values[:n] for model, values in forecasts.items()}
+
+def main(n_resamples=2000, block_size=None, confidence=0.95, seed=0):
+    print("="*80)
+    print("MODEL EVALUATION - Bootstrap confidence intervals and Diebold-Mariano tests")
+    print("="*80)
+
+    dates, actual, forecasts = load_test_predictions()
+    models = list(forecasts)
+    stacked = np.stack([forecasts[model] for model in models])
+    block_size = block_size or default_block_size(len(actual))
+    print(f"\nTest period: {dates[0].date()} to {dates[-1].date()} ({len(actual)} days)")
+    print(f"Bootstrap: {n_resamples} resamples, block size {block_size}, {confidence:.0%} intervals")
+
+    start = time.perf_counter()
+    intervals = bootstrap_ci(actual, stacked, n_resamples, block_size, confidence, seed)
+    bootstrap_seconds = time.perf_counter() - start
+    print(f"✓ {n_resamples} x {len(models)} models x {len(MARKET_COLUMNS)} markets resampled "
+          f"in {bootstrap_seconds * 1000:.0f} ms")
+
+    for metric in METRICS:
+        point, low, high = intervals[metric]
+        unit = '%' if metric == 'mape' else ''
+        print(f"\n{metric.upper()} (average over markets) [{confidence:.0%} CI]:")
+        print(f"{'Model':<14} {'Estimate':>12} {'Low':>12} {'High':>12}")
+        print("-"*53)
+        for idx, model in enumerate(models):
+            print(f"{model:<14} {np.nanmean(point[idx]):>11,.2f}{unit or ' '} {np.nanmean(low[idx]):>11,.2f}{unit or ' '} "
+                  f"{np.nanmean(high[idx]):>11,.2f}{unit or ' '}")
+
+    comparisons = [('lstm_holiday', 'arimax'), ('lstm', 'arima'), ('lstm_holiday', 'lstm')]
+    if 'prophet' in forecasts:
+        comparisons.append(('lstm', 'prophet'))
+    tests = {}
+    print("\nDiebold-Mariano test (squared error, negative = first model more accurate):")
+    print(f"{'Market':<20}" + ''.join(f"{a + ' vs ' + b:>28}" for a, b in comparisons))
+    print("-"*(20 + 28 * len(comparisons)))
+    for a, b in comparisons:
+        tests[(a, b)] = diebold_mariano(actual, forecasts[a], forecasts[b])
+    for idx, market in enumerate(MARKET_COLUMNS):
+        cells = ''.join(f"{tests[pair]['statistic'][idx]:>15.2f} (p={tests[pair]['p_value'][idx]:.3f})"
+                        for pair in comparisons)
+        print(f"{market:<20}{cells}")
+
+    results = {
+        'dates': dates,
+        'models': models,
+        'markets': MARKET_COLUMNS,
+        'n_resamples': n_resamples,
+        'block_size': block_size,
+        'confidence': confidence,
+        'intervals': {metric: {model: tuple(values[idx] for values in intervals[metric])
+                               for idx, model in enumerate(models)} for metric in METRICS},
+        'diebold_mariano': tests,
+        'bootstrap_seconds': bootstrap_seconds,
+    }
+    os.makedirs(os.path.dirname(RESULTS_PATH), exist_ok=True)
+    joblib.dump(results, RESULTS_PATH)
+    print(f"\n✓ Results saved to {RESULTS_PATH}")
+    return results
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Bootstrap confidence intervals and Diebold-Mariano tests')
+    parser.add_argument('--resamples', type=int, default=2000, help='Bootstrap resamples')
+    parser.add_argument('--block-size', type=int, default=None, help='Bootstrap block length (default: n^(1/3))')
+    parser.add_argument('--confidence', type=float, default=0.95, help='Confidence level of the intervals')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    main(args.resamples, args.block_size, args.confidence, args.seed)
+
+if __name__ == "__main__":
+    cli()
@@ -7,8 +7,480 @@ Output: Actual Price | LSTM Price | ARIMA Price
 import pandas as pd
 import numpy as np
 import joblib
+from data_access import DATA_PATH, MARKET_COLUMNS, split_index, load_frame, load_market_frame
+from lstm_runtime import is_current, load_runtime, load_scaler, runtime_path, scaler_is_current
+from evaluation import error_metrics
+from calendar_features import load_calendar
+from instrumentation import add_trace_arguments, span, trace_options, trace_run
+import argparse
+import glob
 import os
 import sys
+import time
+from statistics import NormalDist
+
+LSTM_MODEL_FILES = {
+    'lstm': 'lstm_model_all_markets.h5',
+    'lstm_holiday': 'lstm_holiday_model_all_markets.h5',
+}
+# Global LSTM over every series of the export (train_lstm.py --global)
+GLOBAL_MODEL_FILE = 'lstm_global_model.h5'
+GLOBAL_META_FILE = 'lstm_global_meta.joblib'
+SCALER_FILES = {
+    'lstm': 'scaler_markets.joblib',
+    'lstm_holiday': 'scaler_with_features.joblib',
+}
+ARIMA_MODEL_PREFIXES = {
+    'arima': 'arima_model_',
+    'arimax': 'arimax_model_',
+}
+# Per-market weights over the kinds above, written by ensemble.py
+ENSEMBLE_WEIGHTS_FILE = os.path.join('ensemble', 'ensemble_weights.joblib')
+MODEL_KINDS = tuple(LSTM_MODEL_FILES) + ('lstm_global',) + tuple(ARIMA_MODEL_PREFIXES) + ('ensemble',)
+# Kinds that forecast every market in one model call
+ALL_MARKET_KINDS = tuple(LSTM_MODEL_FILES) + ('lstm_global',)
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+class ModelRegistry:
+    """
+    In-process registry of the trained models, scalers and the latest data window.
+
+    Everything is read from disk once in load(); forecast() then only runs the
+    models on the in-memory window, so repeated calls take milliseconds.
+    `kinds` limits loading to some model kinds (default: all of MODEL_KINDS);
+    'ensemble' also loads the base models it combines. The global LSTM needs
+    TensorFlow, so load() only reads its metadata and the model itself is
+    loaded on its first forecast.
+    """
+
+    def __init__(self, data_path=DATA_PATH,
+                 models_dir='models', scalers_dir='data/scalers', look_back=30, kinds=None):
+        self.data_path = data_path
+        self.kinds = tuple(kinds) if kinds else MODEL_KINDS
+        self.models_dir = models_dir
+        self.scalers_dir = scalers_dir
+        self.look_back = look_back
+        self.lstm_models = {}
+        self._lstm_predict = {}
+        self._lstm_sample = {}
+        self._look_backs = {}
+        self.arima_models = {}
+        self.global_meta = None
+        self._global = None
+        self.scalers = {}
+        self.ensemble = None
+        self.calendar = None
+        self.history = None
+        self.loaded = False
+
+    def load(self):
+        """Load the data, scalers and every available model into memory"""
+        self.history = load_frame(self.data_path)
+        self.calendar = load_calendar()
+        if 'ensemble' in self.kinds:
+            self._load_ensemble()
+
+        for kind, filename in SCALER_FILES.items():
+            if kind in self.kinds:
+                self.scalers[kind] = self._load_scaler(os.path.join(self.scalers_dir, filename))
+
+        self._load_lstm_models()
+        self._load_arima_models()
+        if 'lstm_global' in self.kinds:
+            meta_path = os.path.join(self.models_dir, 'lstm', GLOBAL_META_FILE)
+            if os.path.exists(meta_path) and os.path.exists(os.path.join(self.models_dir, 'lstm', GLOBAL_MODEL_FILE)):
+                self.global_meta = joblib.load(meta_path)
+        self._global = None
+
+        # Scaled look-back windows are fixed until new data arrives
+        self._windows = {}
+        for kind, scaler in self.scalers.items():
+            columns = list(scaler.feature_names_in_)
+            look_back = self._look_backs.get(kind, self.look_back)
+            scaled = scaler.transform(self.history[columns].iloc[-look_back:])
+            self._windows[kind] = scaled.astype(np.float32)
+
+        self.loaded = True
+        return self
+
+    @staticmethod
+    def _load_scaler(path):
+        """Exported scaler parameters when current (avoids importing scikit-learn), else the joblib file"""
+        if scaler_is_current(path):
+            return load_scaler(runtime_path(path))
+        return joblib.load(path)
+
+    def _load_lstm_models(self):
+        lstm_dir = os.path.join(self.models_dir, 'lstm')
+        paths = {kind: os.path.join(lstm_dir, filename) for kind, filename in LSTM_MODEL_FILES.items()
+                 if kind in self.kinds and os.path.exists(os.path.join(lstm_dir, filename))}
+
+        # Models exported by lstm_runtime.py run in NumPy, without importing TensorFlow
+        for kind, path in list(paths.items()):
+            if is_current(path):
+                self.lstm_models[kind] = load_runtime(runtime_path(path))
+                self._lstm_predict[kind] = self.lstm_models[kind].predict
+                self._lstm_sample[kind] = self.lstm_models[kind].predict
+                self._look_backs[kind] = self.lstm_models[kind].input_shape[0]
+                del paths[kind]
+        if not paths:
+            return
+
+        # TensorFlow is only needed for models without an up-to-date export
+        import tensorflow as tf
+        from tensorflow.keras.models import load_model
+        for kind, path in paths.items():
+            lstm_model = load_model(path, compile=False)
+            # Tuned models may use another look-back than the registry default
+            look_back, n_features = lstm_model.input_shape[1:]
+            self._look_backs[kind] = look_back
+
+            # Eager Keras calls re-run the Python graph every time; a traced
+            # function with a fixed signature is an order of magnitude faster
+            predict = tf.function(
+                lambda x, m=lstm_model: m(x, training=False),
+                input_signature=[tf.TensorSpec((None, look_back, n_features), tf.float32)],
+            )
+            predict(np.zeros((1, look_back, n_features), dtype=np.float32))
+            # Dropout-active twin for MC-dropout, traced on first use
+            sample = tf.function(
+                lambda x, m=lstm_model: m(x, training=True),
+                input_signature=[tf.TensorSpec((None, look_back, n_features), tf.float32)],
+            )
+
+            self.lstm_models[kind] = lstm_model
+            self._lstm_predict[kind] = lambda x, fn=predict: fn(x).numpy()
+            self._lstm_sample[kind] = lambda x, rng, fn=sample: fn(x).numpy()
+
+    def _load_ensemble(self):
+        path = os.path.join(self.models_dir, ENSEMBLE_WEIGHTS_FILE)
+        if not os.path.exists(path):
+            return
+        self.ensemble = joblib.load(path)
+        self.kinds = tuple(dict.fromkeys(self.kinds + tuple(self._ensemble_bases())))
+
+    def _ensemble_bases(self):
+        """Model kinds with a non-zero weight in any market"""
+        return [model for model in self.ensemble['models']
+                if any(weights.get(model, 0) > 0 for weights in self.ensemble['weights'].values())]
+
+    def _load_arima_models(self):
+        from arima_format import load_entry
+
+        arima_dir = os.path.join(self.models_dir, 'arima')
+        for kind, prefix in ARIMA_MODEL_PREFIXES.items():
+            if kind not in self.kinds:
+                continue
+            for path in sorted(glob.glob(os.path.join(arima_dir, f'{prefix}*.joblib'))):
+                market = os.path.basename(path)[len(prefix):-len('.joblib')].replace('_', ' ')
+                if market not in self.history.columns:
+                    continue
+                saved = load_entry(path)
+                self.arima_models[(kind, market)] = self._extend_arima(kind, market, saved)
+
+    def _extend_arima(self, kind, market, saved):
+        """Bring a saved ARIMA result up to the last observed date without refitting"""
+        model = saved['model']
+        transform = saved.get('transform_params') or {}
+        log_transform = transform.get('method') == 'log'
+
+        # Models saved by train_arima.py record their last date; older ones cover the first nobs rows
+        if 'last_date' in saved:
+            new_rows = self.history.loc[self.history.index > pd.Timestamp(saved['last_date'])]
+        else:
+            new_rows = self.history.iloc[int(model.nobs):]
+
+        new_y = new_rows[market].values
+        if log_transform:
+            new_y = np.log(new_y)
+        if len(new_y) > 0:
+            new_exog = None
+            if kind == 'arimax':
+                new_exog = new_rows['is_holiday'].values.reshape(-1, 1)
+            model = model.append(new_y, exog=new_exog)
+
+        return {'model': model, 'order': saved['order'], 'log_transform': log_transform}
+
+    def available_models(self):
+        """Return the model kinds that have at least one loaded model"""
+        kinds = list(self.lstm_models)
+        if self.global_meta is not None and all(market in self.global_meta['series'] for market in MARKET_COLUMNS):
+            kinds.append('lstm_global')
+        kinds.extend(sorted({kind for kind, _ in self.arima_models}))
+        if self.ensemble is not None and all(base in kinds for base in self._ensemble_bases()):
+            kinds.append('ensemble')
+        return kinds
+
+    def future_dates(self, horizon):
+        """Next `horizon` trading days (Mon-Fri) after the last observed date"""
+        return pd.bdate_range(self.history.index[-1] + pd.Timedelta(days=1), periods=horizon, name='Date')
+
+    def forecast(self, market, horizon=1, model='lstm_holiday'):
+        """Forecast `market` for the next `horizon` trading days with one model kind"""
+        if not self.loaded:
+            self.load()
+        if model not in MODEL_KINDS:
+            raise ValueError(f"Unknown model '{model}', expected one of {MODEL_KINDS}")
+        if market not in MARKET_COLUMNS:
+            raise ValueError(f"Unknown market '{market}', expected one of {MARKET_COLUMNS}")
+        if horizon < 1:
+            raise ValueError("horizon must be at least 1")
+
+        if model in LSTM_MODEL_FILES:
+            values = self._forecast_lstm(model, horizon)[:, MARKET_COLUMNS.index(market)]
+        elif model == 'lstm_global':
+            values = self._forecast_global([market], horizon)[:, 0]
+        elif model == 'ensemble':
+            values = self._forecast_ensemble(market, horizon)
+        else:
+            values = self._forecast_arima(model, market, horizon)
+
+        return pd.Series(values, index=self.future_dates(horizon), name=market)
+
+    def forecast_all(self, horizon=1, model='lstm_holiday'):
+        """Forecast every market at once, returned as a date x market DataFrame"""
+        if not self.loaded:
+            self.load()
+        if model in LSTM_MODEL_FILES:
+            values = self._forecast_lstm(model, horizon)[:, :len(MARKET_COLUMNS)]
+            return pd.DataFrame(values, index=self.future_dates(horizon), columns=MARKET_COLUMNS)
+        if model == 'lstm_global':
+            return self.forecast_series(MARKET_COLUMNS, horizon)
+        return pd.DataFrame({market: self.forecast(market, horizon, model) for market in MARKET_COLUMNS})
+
+    def forecast_series(self, series=None, horizon=1):
+        """
+        Forecast any series of the export (default: all) with the global LSTM,
+        returned as a date x series DataFrame. All series advance together, one
+        batched model call per step.
+        """
+        if not self.loaded:
+            self.load()
+        if horizon < 1:
+            raise ValueError("horizon must be at least 1")
+        if self.global_meta is None:
+            raise ValueError(f"Global LSTM model is not available in {self.models_dir}/lstm "
+                             f"(train it with train_lstm.py --global)")
+        series = list(series or self.global_meta['series'])
+        unknown = [name for name in series if name not in self.global_meta['series']]
+        if unknown:
+            raise ValueError(f"Unknown series {unknown}, expected some of {self.global_meta['series']}")
+        return pd.DataFrame(self._forecast_global(series, horizon), index=self.future_dates(horizon), columns=series)
+
+    def forecast_quantiles(self, horizon=1, model='lstm_holiday', quantiles=QUANTILES, samples=200, seed=0):
+        """
+        Probabilistic forecast of every market as a (markets, horizon, quantiles) array.
+
+        LSTMs draw `samples` MC-dropout paths, advanced together as one batch per
+        step (`seed` applies to the NumPy runtime); ARIMA/ARIMAX quantiles come
+        from the normal predictive distribution of get_forecast().
+        """
+        if not self.loaded:
+            self.load()
+        quantiles = np.asarray(quantiles, dtype=np.float64)
+        if np.any((quantiles <= 0) | (quantiles >= 1)):
+            raise ValueError("quantiles must be between 0 and 1")
+        if horizon < 1:
+            raise ValueError("horizon must be at least 1")
+
+        if model in LSTM_MODEL_FILES:
+            paths = self._sample_lstm(model, horizon, samples, seed)
+            return np.moveaxis(np.quantile(paths, quantiles, axis=0), 0, -1)
+        if model in ARIMA_MODEL_PREFIXES:
+            return np.stack([self._arima_quantiles(model, market, horizon, quantiles) for market in MARKET_COLUMNS])
+        raise ValueError(f"No quantile forecasts for '{model}', expected one of "
+                         f"{tuple(LSTM_MODEL_FILES) + tuple(ARIMA_MODEL_PREFIXES)}")
+
+    def _lstm_inputs(self, kind, horizon):
+        """Scaler, its columns, and the holiday column with its scaled future flags (None without one)"""
+        if kind not in self.lstm_models:
+            raise ValueError(f"LSTM model '{kind}' is not available in {self.models_dir}/lstm")
+        scaler = self.scalers[kind]
+        columns = list(scaler.feature_names_in_)
+        if 'is_holiday' not in columns:
+            return scaler, columns, None, None
+
+        # Holiday flags of the forecast days come from the calendar, scaled like the history
+        holiday_column = columns.index('is_holiday')
+        future = pd.DataFrame(np.zeros((horizon, len(columns))), columns=columns)
+        future['is_holiday'] = self.calendar.exog(self.future_dates(horizon))[:, 0]
+        return scaler, columns, holiday_column, scaler.transform(future).astype(np.float32)[:, holiday_column]
+
+    def _forecast_lstm(self, kind, horizon):
+        """Recursive multi-step forecast; each prediction is fed back into the window"""
+        scaler, columns, holiday_column, future_holidays = self._lstm_inputs(kind, horizon)
+        predict = self._lstm_predict[kind]
+        window = self._windows[kind].copy()
+
+        predictions = np.empty((horizon, len(columns)), dtype=np.float32)
+        for step in range(horizon):
+            pred = np.array(predict(window[np.newaxis])[0])
+            if holiday_column is not None:
+                pred[holiday_column] = future_holidays[step]
+            predictions[step] = pred
+            window = np.vstack([window[1:], pred])
+
+        prices = scaler.inverse_transform(pd.DataFrame(predictions, columns=columns))
+        # Reorder to MARKET_COLUMNS regardless of the scaler's column order
+        return prices[:, [columns.index(market) for market in MARKET_COLUMNS]]
+
+    def _sample_lstm(self, kind, horizon, samples, seed=0):
+        """(samples, horizon, markets) MC-dropout price paths, all samples in one batch per step"""
+        scaler, columns, holiday_column, future_holidays = self._lstm_inputs(kind, horizon)
+        sample = self._lstm_sample[kind]
+        rng = np.random.default_rng(seed)
+        windows = np.repeat(self._windows[kind][np.newaxis], samples, axis=0)
+
+        predictions = np.empty((samples, horizon, len(columns)), dtype=np.float32)
+        for step in range(horizon):
+            pred = np.array(sample(windows, rng))
+            if holiday_column is not None:
+                pred[:, holiday_column] = future_holidays[step]
+            predictions[:, step] = pred
+            windows = np.concatenate([windows[:, 1:], pred[:, np.newaxis]], axis=1)
+
+        prices = scaler.inverse_transform(pd.DataFrame(predictions.reshape(-1, len(columns)), columns=columns))
+        prices = prices[:, [columns.index(market) for market in MARKET_COLUMNS]]
+        return prices.reshape(samples, horizon, len(MARKET_COLUMNS))
+
+    def _global_lstm(self):
+        """(predict, scaled windows) of the global LSTM, loaded on first use"""
+        if self._global is None:
+            import tensorflow as tf
+            from tensorflow.keras.models import load_model
+            from ingest import load_all_series
+
+            meta = self.global_meta
+            look_back = meta['look_back']
+            model = load_model(os.path.join(self.models_dir, 'lstm', GLOBAL_MODEL_FILE), compile=False)
+            predict = tf.function(
+                lambda windows, ids, m=model: m({'window': windows, 'series_id': ids}, training=False),
+                input_signature=[tf.TensorSpec((None, look_back, 2), tf.float32), tf.TensorSpec((None,), tf.int32)],
+            )
+            # Non-market series are only in the export; the markets come from the history
+            series = load_all_series(index=self.history.index) if set(meta['series']) - set(self.history.columns) \
+                else self.history
+            prices = series[meta['series']].to_numpy()[-look_back:]
+            scaled = (prices - meta['series_min']) / meta['series_range']
+            holidays = self.history['is_holiday'].to_numpy()[-look_back:]
+            # (series, look_back, [scaled price, holiday flag]) as in train_lstm.stack_series_windows
+            windows = np.stack([scaled.T, np.broadcast_to(holidays, scaled.T.shape)], axis=-1).astype(np.float32)
+            self._global = (lambda x, ids, fn=predict: fn(x, ids).numpy(), windows)
+        return self._global
+
+    def _forecast_global(self, series, horizon):
+        """(horizon, series) recursive forecast; the known future holiday flags are fed back with each price"""
+        predict, all_windows = self._global_lstm()
+        meta = self.global_meta
+        ids = np.array([meta['series'].index(name) for name in series], dtype=np.int32)
+        windows = all_windows[ids]
+        future_holidays = self.calendar.exog(self.future_dates(horizon))[:, 0].astype(np.float32)
+
+        predictions = np.empty((horizon, len(ids)), dtype=np.float32)
+        for step in range(horizon):
+            pred = predict(windows, ids)[:, 0]
+            predictions[step] = pred
+            row = np.stack([pred, np.full(len(ids), future_holidays[step], dtype=np.float32)], axis=-1)
+            windows = np.concatenate([windows[:, 1:], row[:, np.newaxis]], axis=1)
+        return predictions * meta['series_range'][ids] + meta['series_min'][ids]
+
+    def _forecast_ensemble(self, market, horizon):
+        """Weighted sum of the base models' forecasts with the market's ensemble weights"""
+        if self.ensemble is None:
+            raise ValueError(f"Ensemble weights are not available in {self.models_dir}/ensemble")
+        weights = {base: weight for base, weight in self.ensemble['weights'][market].items() if weight > 0}
+        unsupported = [base for base in weights if base not in MODEL_KINDS]
+        if unsupported:
+            raise ValueError(f"Ensemble uses {unsupported}, which the registry cannot forecast")
+        return sum(weight * self.forecast(market, horizon, base).to_numpy() for base, weight in weights.items())
+
+    def _arima_entry(self, kind, market):
+        entry = self.arima_models.get((kind, market))
+        if entry is None:
+            raise ValueError(f"{kind.upper()} model for '{market}' is not available in {self.models_dir}/arima")
+        return entry
+
+    def _forecast_arima(self, kind, market, horizon):
+        entry = self._arima_entry(kind, market)
+        exog = self.calendar.exog(self.future_dates(horizon)) if kind == 'arimax' else None
+        values = np.asarray(entry['model'].forecast(steps=horizon, exog=exog))
+        if entry['log_transform']:
+            values = np.exp(values)
+        return values
+
+    def _arima_quantiles(self, kind, market, horizon, quantiles):
+        """(horizon, quantiles) from the predictive mean and standard error of get_forecast()"""
+        entry = self._arima_entry(kind, market)
+        exog = self.calendar.exog(self.future_dates(horizon)) if kind == 'arimax' else None
+        prediction = entry['model'].get_forecast(steps=horizon, exog=exog)
+        z = np.array([NormalDist().inv_cdf(q) for q in quantiles])
+        values = np.asarray(prediction.predicted_mean)[:, np.newaxis] + np.asarray(prediction.se_mean)[:, np.newaxis] * z
+        # Quantiles survive the monotone back-transform of log models
+        return np.exp(values) if entry['log_transform'] else values
+
+
+def run_forecast(horizon, markets=None, models=None, quantiles=None, samples=200, seed=0):
+    """Print forward-looking forecasts (or quantiles) for the requested markets and models"""
+    print("="*80)
+    print(f"CHILI PRICE FORECAST - NEXT {horizon} TRADING DAYS")
+    print("="*80)
+
+    print("\nLoading model registry...")
+    start = time.perf_counter()
+    with span('registry.load'):
+        registry = ModelRegistry(kinds=models).load()
+    print(f"✓ Registry loaded in {time.perf_counter() - start:.2f}s")
+    print(f"  Last observed date: {registry.history.index[-1].date()}")
+    print(f"  Models available: {', '.join(registry.available_models())}")
+
+    markets = markets or MARKET_COLUMNS
+    models = models or registry.available_models()
+    if quantiles:
+        return run_quantile_forecast(registry, horizon, markets, models, quantiles, samples, seed)
+
+    for market in markets:
+        start = time.perf_counter()
+        with span('forecast_market', market=market, models=len(models)):
+            table = pd.DataFrame({kind: registry.forecast(market, horizon, kind) for kind in models})
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        print(f"\n{'='*80}")
+        print(f"Market: {market}  ({elapsed_ms:.1f} ms for {len(models)} models)")
+        print(f"{'='*80}")
+        print(table.round(0).to_string())
+
+    print("\n✓ Forecast completed successfully!")
+    return registry
+
+def run_quantile_forecast(registry, horizon, markets, models, quantiles, samples=200, seed=0):
+    """Print quantile forecasts with the time each model takes for all markets"""
+    models = [kind for kind in models if kind in LSTM_MODEL_FILES or kind in ARIMA_MODEL_PREFIXES]
+    print(f"\nQuantiles {', '.join(f'{q:g}' for q in quantiles)} "
+          f"(LSTM: {samples} MC-dropout samples, ARIMA: get_forecast intervals)")
+    bands = {}
+    for kind in models:
+        start = time.perf_counter()
+        with span('forecast_quantiles', model=kind, samples=samples):
+            bands[kind] = registry.forecast_quantiles(horizon, kind, quantiles, samples, seed)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        detail = (f"{samples} samples in {horizon} batched steps, {elapsed_ms * 1000 / samples:.0f} µs per sample"
+                  if kind in LSTM_MODEL_FILES else f"{len(MARKET_COLUMNS)} markets")
+        print(f"✓ {kind:<13} {elapsed_ms:8.1f} ms ({detail})")
+
+    dates = registry.future_dates(horizon)
+    names = [f'q{q * 100:g}' for q in quantiles]
+    for market in markets:
+        idx = MARKET_COLUMNS.index(market)
+        table = pd.concat({kind: pd.DataFrame(bands[kind][idx], index=dates, columns=names) for kind in models}, axis=1)
+        print(f"\n{'='*80}")
+        print(f"Market: {market}")
+        print(f"{'='*80}")
+        print(table.round(0).to_string())
+
+    print("\n✓ Quantile forecast completed successfully!")
+    return bands
+
 
 def main():
     print("="*80)
@@ -24,18 +496,22 @@ def main():
     
     # Load data
     print("\nLoading data...")
-    df_with_holidays = pd.read_csv('data/processed/data_with_holidays.csv', index_col=0, parse_dates=True)
-    market_columns = ['Pasar Sukaramai', 'Pasar Aksara', 'Pasar Petisah', 'Pusat Pasar', 'Pasar Brayan']
+    with span('load_data'):
+        df_with_holidays = load_market_frame()
+    market_columns = MARKET_COLUMNS
     
     # Load saved results (contains predictions on test set)
     print("Loading model results...")
-    lstm_results = joblib.load('result/metrics/lstm_detailed_results.pkl')
-    arima_results = joblib.load('result/metrics/arima_detailed_results.pkl')
+    with span('load_results'):
+        lstm_results = joblib.load('result/metrics/lstm_detailed_results.pkl')
+        arima_results = joblib.load('result/metrics/arima_detailed_results.pkl')
+        # Prophet is optional: train_prophet.py writes its results
+        prophet_path = 'result/metrics/prophet_detailed_results.pkl'
+        prophet_results = joblib.load(prophet_path) if os.path.exists(prophet_path) else None
     
     # Parameters
-    TEST_SIZE = 0.2
-    SPLIT_INDEX = int(len(df_with_holidays) * (1 - TEST_SIZE))
-    LOOK_BACK = 30
+    SPLIT_INDEX = split_index(len(df_with_holidays))
+    LOOK_BACK = lstm_results.get('look_back', 30)
     
     test_data = df_with_holidays.iloc[SPLIT_INDEX:]
     
@@ -78,46 +554,52 @@ def main():
             'LSTM Price': lstm_pred,
             'ARIMA Price': arima_pred
         })
+        models = ['LSTM', 'ARIMA']
+        predictions = [lstm_pred, arima_pred]
+        if prophet_results is not None:
+            # Prophet forecasts the whole test set too (optimized variant, the best one)
+            prophet_pred = np.asarray(prophet_results[market]['prophet_pred'])[LOOK_BACK:LOOK_BACK + len(actual)]
+            comparison_df['Prophet Price'] = prophet_pred
+            models.append('Prophet')
+            predictions.append(prophet_pred)
+        price_columns = ['Date', 'Actual Price'] + [f'{name} Price' for name in models]
         
         # Calculate errors
-        comparison_df['LSTM Error'] = comparison_df['LSTM Price'] - comparison_df['Actual Price']
-        comparison_df['ARIMA Error'] = comparison_df['ARIMA Price'] - comparison_df['Actual Price']
-        comparison_df['LSTM Error %'] = (comparison_df['LSTM Error'] / comparison_df['Actual Price']) * 100
-        comparison_df['ARIMA Error %'] = (comparison_df['ARIMA Error'] / comparison_df['Actual Price']) * 100
+        for name in models:
+            comparison_df[f'{name} Error'] = comparison_df[f'{name} Price'] - comparison_df['Actual Price']
+        for name in models:
+            comparison_df[f'{name} Error %'] = (comparison_df[f'{name} Error'] / comparison_df['Actual Price']) * 100
         
         # Display first 10 rows
         print("\nFirst 10 predictions:")
-        print(comparison_df[['Date', 'Actual Price', 'LSTM Price', 'ARIMA Price']].head(10).to_string(index=False))
+        print(comparison_df[price_columns].head(10).to_string(index=False))
         
         # Display last 10 rows
         print("\nLast 10 predictions:")
-        print(comparison_df[['Date', 'Actual Price', 'LSTM Price', 'ARIMA Price']].tail(10).to_string(index=False))
+        print(comparison_df[price_columns].tail(10).to_string(index=False))
         
         # Summary statistics
         print(f"\n{'='*60}")
         print(f"Summary Statistics for {market}:")
         print(f"{'='*60}")
-        print(f"{'Metric':<25} {'Actual':>12} {'LSTM':>12} {'ARIMA':>12}")
+        print(f"{'Metric':<25} {'Actual':>12}" + ''.join(f" {name:>12}" for name in models))
         print("-"*60)
-        print(f"{'Mean Price (Rp)':<25} {actual.mean():>12,.0f} {lstm_pred.mean():>12,.0f} {arima_pred.mean():>12,.0f}")
-        print(f"{'Std Dev (Rp)':<25} {actual.std():>12,.0f} {lstm_pred.std():>12,.0f} {arima_pred.std():>12,.0f}")
-        print(f"{'Min Price (Rp)':<25} {actual.min():>12,.0f} {lstm_pred.min():>12,.0f} {arima_pred.min():>12,.0f}")
-        print(f"{'Max Price (Rp)':<25} {actual.max():>12,.0f} {lstm_pred.max():>12,.0f} {arima_pred.max():>12,.0f}")
+        for label, stat in (('Mean Price (Rp)', np.mean), ('Std Dev (Rp)', np.std),
+                            ('Min Price (Rp)', np.min), ('Max Price (Rp)', np.max)):
+            print(f"{label:<25} {stat(actual):>12,.0f}" + ''.join(f" {stat(pred):>12,.0f}" for pred in predictions))
         
         # Error metrics
-        lstm_mae = np.mean(np.abs(comparison_df['LSTM Error']))
-        arima_mae = np.mean(np.abs(comparison_df['ARIMA Error']))
-        lstm_mape = np.mean(np.abs(comparison_df['LSTM Error %']))
-        arima_mape = np.mean(np.abs(comparison_df['ARIMA Error %']))
+        metrics = error_metrics(actual, np.stack(predictions), axis=-1)
         
-        print(f"\n{'Error Metrics':<25} {'LSTM':>12} {'ARIMA':>12}")
+        print(f"\n{'Error Metrics':<25}" + ''.join(f" {name:>12}" for name in models))
         print("-"*60)
-        print(f"{'MAE (Rp)':<25} {lstm_mae:>12,.2f} {arima_mae:>12,.2f}")
-        print(f"{'MAPE (%)':<25} {lstm_mape:>12,.2f} {arima_mape:>12,.2f}")
+        print(f"{'MAE (Rp)':<25}" + ''.join(f" {value:>12,.2f}" for value in metrics['mae']))
+        print(f"{'MAPE (%)':<25}" + ''.join(f" {value:>12,.2f}" for value in metrics['mape']))
         
         # Save to CSV
         csv_filename = f'result/predictions_{market.replace(" ", "_")}.csv'
-        comparison_df.to_csv(csv_filename, index=False)
+        with span('to_csv', path=csv_filename):
+            comparison_df.to_csv(csv_filename, index=False)
         print(f"\n✓ Full predictions saved to: {csv_filename}")
     
     # Overall summary across all markets
@@ -133,6 +615,9 @@ def main():
     print("-"*60)
     print(f"{'LSTM (with holidays)':<30} {lstm_summary['avg_rmse_with_holiday']:>15,.2f} {lstm_summary['avg_mape_with_holiday']:>14,.2f}%")
     print(f"{'ARIMA':<30} {arima_summary['avg_rmse']:>15,.2f} {arima_summary['avg_mape']:>14,.2f}%")
+    if prophet_results is not None:
+        prophet_summary = joblib.load('result/metrics/prophet_summary.pkl')
+        print(f"{'Prophet (optimized)':<30} {prophet_summary['avg_rmse']:>15,.2f} {prophet_summary['avg_mape']:>14,.2f}%")
     
     # Calculate improvement
     rmse_improvement = ((arima_summary['avg_rmse'] - lstm_summary['avg_rmse_with_holiday']) / arima_summary['avg_rmse']) * 100
@@ -146,7 +631,30 @@ def main():
     
     print("\n✓ Inference completed successfully!")
     print(f"\n📊 Prediction tables saved to result/ directory")
-    print(f"   - One CSV file per market with format: Actual | LSTM | ARIMA")
+    print(f"   - One CSV file per market with format: Actual | LSTM | ARIMA" + (" | Prophet" if prophet_results is not None else ""))
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Chili price inference')
+    parser.add_argument('--forecast', type=int, metavar='H',
+                        help='Forecast the next H trading days instead of printing test-set tables')
+    parser.add_argument('--market', action='append', choices=MARKET_COLUMNS,
+                        help='Market to forecast (repeatable, default: all)')
+    parser.add_argument('--model', action='append', choices=MODEL_KINDS,
+                        help='Model kind to use (repeatable, default: all available)')
+    parser.add_argument('--quantiles', type=float, nargs='+', metavar='Q',
+                        help='Print these forecast quantiles (e.g. 0.05 0.5 0.95) instead of point forecasts')
+    parser.add_argument('--samples', type=int, default=200, help='MC-dropout samples per LSTM quantile forecast')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the MC-dropout masks')
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.forecast:
+        with trace_run('forecast', **trace_options(args)):
+            run_forecast(args.forecast, args.market, args.model, args.quantiles, args.samples, args.seed)
+    else:
+        with trace_run('inference', **trace_options(args)):
+            main()
 
 if __name__ == "__main__":
-    main()
+    cli()
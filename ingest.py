@@ -0,0 +1,154 @@
+"""
+Raw Data Ingestion Script for Chili Price Prediction
+Turns the wide semicolon-separated export in data/raw/raw-data.csv into
+data/processed/melted_data.csv and data/processed/cleaned_data.csv
+(the cleaning step of notebooks/01_data_cleaning_and_eda.ipynb)
+"""
+
+import pandas as pd
+import numpy as np
+import argparse
+import os
+import time
+
+RAW_PATH = 'data/raw/raw-data.csv'
+MELTED_PATH = 'data/processed/melted_data.csv'
+CLEANED_PATH = 'data/processed/cleaned_data.csv'
+
+RAW_SEPARATOR = ';'
+NAME_COLUMN = 'Komoditas (Rp)'
+ID_COLUMNS = ['No', NAME_COLUMN]
+DATE_FORMAT = '%d/ %m/ %Y'
+
+# National/provincial/city summary rows that are not individual markets
+AGGREGATE_SERIES = ['Semua Provinsi', 'Sumatera Utara', 'Kota Medan']
+
+def read_date_columns(raw_path=RAW_PATH):
+    """Return the date column headers of the raw export without reading any rows"""
+    header = pd.read_csv(raw_path, sep=RAW_SEPARATOR, nrows=0).columns
+    return [column for column in header if column not in ID_COLUMNS]
+
+def read_raw(raw_path=RAW_PATH, date_columns=None):
+    """Read the wide raw export as strings, optionally only some date columns"""
+    usecols = None if date_columns is None else [NAME_COLUMN] + list(date_columns)
+    return pd.read_csv(raw_path, sep=RAW_SEPARATOR, dtype=str, usecols=usecols)
+
+def melt_raw(wide):
+    """
+    Reshape the wide export to long format (Market, Date_Str, Price_Str).
+
+    Produces the same row order as DataFrame.melt: all markets for the first
+    date, then all markets for the second date, and so on.
+    """
+    date_columns = [column for column in wide.columns if column not in ID_COLUMNS]
+    markets = wide[NAME_COLUMN].to_numpy()
+    prices = wide[date_columns].to_numpy()
+
+    return pd.DataFrame({
+        'Market': np.tile(markets, len(date_columns)),
+        'Date_Str': np.repeat(np.asarray(date_columns, dtype=object), len(markets)),
+        'Price_Str': prices.T.ravel(),
+    })
+
+def parse_dates(date_strings):
+    """Parse date strings like '01/ 01/ 2024', converting each distinct string only once"""
+    codes, uniques = pd.factorize(date_strings)
+    parsed = pd.to_datetime(pd.Index(uniques), format=DATE_FORMAT, errors='coerce')
+    return pd.DatetimeIndex(parsed.take(codes)).where(codes >= 0)
+
+def parse_prices(price_strings):
+    """Parse price strings like '59,950'; '-' and blanks become NaN"""
+    cleaned = price_strings.str.replace(',', '', regex=False).replace('-', np.nan)
+    return pd.to_numeric(cleaned, errors='coerce').astype(float)
+
+def clean_melted(melted):
+    """Add numeric Price and datetime Date, drop aggregate series and unparseable rows"""
+    cleaned = melted[~melted['Market'].isin(AGGREGATE_SERIES)].copy()
+    cleaned['Price'] = parse_prices(cleaned['Price_Str'])
+    cleaned['Date'] = parse_dates(cleaned['Date_Str'].to_numpy())
+    return cleaned.dropna(subset=['Date', 'Price'])
+
+def load_all_series(melted_path=MELTED_PATH, index=None):
+    """
+    Every series in the export (aggregates included) as a date x series frame.
+
+    Gaps are filled the same way as the notebook imputation: linear
+    interpolation, then forward/backward fill. If `index` is given the frame
+    is aligned to those dates first.
+    """
+    melted = pd.read_csv(melted_path, dtype=str)
+    melted['Price'] = parse_prices(melted['Price_Str'])
+    melted['Date'] = parse_dates(melted['Date_Str'].to_numpy())
+    melted = melted.dropna(subset=['Date'])
+
+    wide = melted.pivot_table(index='Date', columns='Market', values='Price', aggfunc='last', sort=True)
+    # pivot_table drops all-NaN series; keep the export's series order
+    wide = wide.reindex(columns=[market for market in pd.unique(melted['Market']) if market in wide.columns])
+    if index is not None:
+        wide = wide.reindex(index)
+    wide.columns.name = None
+    return wide.interpolate(method='linear', axis=0).ffill().bfill()
+
+def ingested_date_columns(melted_path=MELTED_PATH):
+    """Date strings already present in the melted output"""
+    if not os.path.exists(melted_path):
+        return set()
+    return set(pd.read_csv(melted_path, usecols=['Date_Str'], dtype=str)['Date_Str'].unique())
+
+def ingest(raw_path=RAW_PATH, melted_path=MELTED_PATH, cleaned_path=CLEANED_PATH, full=False):
+    """
+    Update the processed outputs from the raw export.
+
+    By default only date columns that are not yet in melted_data.csv are
+    parsed and appended to both outputs; full=True rebuilds them from scratch.
+    Returns the number of new date columns ingested.
+    """
+    date_columns = read_date_columns(raw_path)
+    append = not full and os.path.exists(melted_path) and os.path.exists(cleaned_path)
+
+    if append:
+        seen = ingested_date_columns(melted_path)
+        new_columns = [column for column in date_columns if column not in seen]
+    else:
+        new_columns = date_columns
+
+    if not new_columns:
+        print("✓ Processed data is up to date, nothing to ingest")
+        return 0
+
+    wide = read_raw(raw_path, new_columns)
+    melted = melt_raw(wide)
+    cleaned = clean_melted(melted)
+
+    os.makedirs(os.path.dirname(melted_path), exist_ok=True)
+    os.makedirs(os.path.dirname(cleaned_path), exist_ok=True)
+    mode = 'a' if append else 'w'
+    melted.to_csv(melted_path, mode=mode, header=not append, index=False)
+    cleaned.to_csv(cleaned_path, mode=mode, header=not append, index=False)
+
+    action = "Appended" if append else "Wrote"
+    print(f"✓ {action} {len(new_columns)} date columns ({len(melted)} melted rows, {len(cleaned)} cleaned rows)")
+    print(f"  Melted data: {melted_path}")
+    print(f"  Cleaned data: {cleaned_path}")
+    return len(new_columns)
+
+def main(full=False, raw_path=RAW_PATH):
+    print("="*80)
+    print("RAW DATA INGESTION - Chili Price Prediction")
+    print("="*80)
+
+    start = time.perf_counter()
+    ingest(raw_path=raw_path, full=full)
+    print(f"\n✓ Ingestion completed in {time.perf_counter() - start:.2f}s")
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Ingest the raw wide price export')
+    parser.add_argument('--raw', default=RAW_PATH, help='Path to the raw semicolon-separated export')
+    parser.add_argument('--full', action='store_true',
+                        help='Rebuild the processed outputs instead of appending new date columns')
+    args = parser.parse_args(argv)
+    main(full=args.full, raw_path=args.raw)
+
+if __name__ == "__main__":
+    cli()
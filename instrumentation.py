@@ -0,0 +1,266 @@
+"""
+Instrumentation for Chili Price Prediction
+Timing spans, peak-RSS sampling and counters for the scripts. Each run writes
+one structured JSON trace (result/traces/), and any stage can be captured
+with cProfile for a flame graph
+"""
+
+from contextlib import contextmanager, nullcontext
+import cProfile
+import datetime
+import json
+import os
+import platform
+import pstats
+import re
+import sys
+import threading
+import time
+import psutil
+from artifact_cache import atomic_open
+
+TRACE_DIR = 'result/traces'
+TRACE_FORMAT = 1
+PROFILE_TOP = 25
+
+_active = None
+
+def process_rss(process):
+    """RSS of a psutil process and its children, in bytes (0 if it cannot be read)"""
+    try:
+        rss = process.memory_info().rss
+        for child in process.children(recursive=True):
+            rss += child.memory_info().rss
+        return rss
+    except Exception:
+        return 0
+
+class PeakRssSampler:
+    """Samples the process RSS in a background thread to catch the peak of a stage"""
+
+    def __init__(self, pid=None, interval=0.01):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _rss(self):
+        return process_rss(self.process)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._rss())
+            self._stop.wait(self.interval)
+
+    def __enter__(self):
+        self.start_rss = self._rss()
+        self.peak = self.start_rss
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.end_rss = self._rss()
+        self.peak = max(self.peak, self.end_rss)
+
+class Tracer:
+    """
+    Spans, counters and peak RSS of one script run.
+
+    span() times a named stage (nested spans record their parent) and keeps the
+    RSS at its start and end and the peak sampled while it was open; count()
+    adds to a named counter. Stages listed in `profile` also run under
+    cProfile (one at a time). write() saves everything as one JSON trace.
+    """
+
+    def __init__(self, run, trace_dir=TRACE_DIR, profile=(), interval=0.02):
+        self.run = run
+        self.trace_dir = trace_dir
+        self.profile = set(profile or ())
+        self.interval = interval
+        self.spans = []
+        self.counters = {}
+        self.process = psutil.Process()
+        self.started_at = datetime.datetime.now()
+        self.run_id = f"{run}-{self.started_at:%Y%m%d-%H%M%S}-{os.getpid()}"
+        self._open = []
+        self._profiling = False
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._start = time.perf_counter()
+        self._cpu_start = self.process.cpu_times()
+        self.peak_rss = process_rss(self.process)
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+        self._thread.start()
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self._observe(process_rss(self.process))
+
+    def _observe(self, rss):
+        with self._lock:
+            self.peak_rss = max(self.peak_rss, rss)
+            for record in self._open:
+                record['rss_peak'] = max(record['rss_peak'], rss)
+
+    @contextmanager
+    def span(self, name, **attrs):
+        rss = process_rss(self.process)
+        record = {
+            'name': name,
+            'parent': self._open[-1]['name'] if self._open else None,
+            'depth': len(self._open),
+            'start': time.perf_counter() - self._start,
+            'rss_start': rss,
+            'rss_peak': rss,
+            'attrs': attrs,
+        }
+        profiler = None
+        if name in self.profile and not self._profiling:
+            profiler = cProfile.Profile()
+            self._profiling = True
+        with self._lock:
+            self._open.append(record)
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            yield record['attrs']
+        except BaseException as error:
+            record['error'] = type(error).__name__
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                self._profiling = False
+                record['profile'] = self._save_profile(name, profiler)
+            record['seconds'] = time.perf_counter() - start
+            self._observe(process_rss(self.process))
+            with self._lock:
+                self._open.remove(record)
+            record['rss_end'] = process_rss(self.process)
+            self.spans.append(record)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def _save_profile(self, name, profiler):
+        """Write the .prof file of a stage; the trace keeps its path and top functions"""
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = os.path.join(self.trace_dir, f"{self.run_id}.{re.sub(r'[^A-Za-z0-9_.-]', '_', name)}.prof")
+        profiler.dump_stats(path)
+        stats = pstats.Stats(profiler)
+        top = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:PROFILE_TOP]
+        return {
+            'path': path,
+            'top': [{'function': f'{filename}:{line}({function})', 'calls': calls,
+                     'own_seconds': own, 'cumulative_seconds': cumulative}
+                    for (filename, line, function), (_, calls, own, cumulative, _) in top],
+        }
+
+    def summary(self):
+        """Trace as a JSON-serializable dict (sizes in MB)"""
+        cpu = self.process.cpu_times()
+        mb = 2 ** 20
+        return {
+            'format': TRACE_FORMAT,
+            'run': self.run,
+            'run_id': self.run_id,
+            'started_at': self.started_at.isoformat(timespec='seconds'),
+            'argv': sys.argv,
+            'pid': os.getpid(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'wall_seconds': time.perf_counter() - self._start,
+            'cpu_seconds': (cpu.user - self._cpu_start.user) + (cpu.system - self._cpu_start.system),
+            'peak_rss_mb': self.peak_rss / mb,
+            'counters': self.counters,
+            'spans': [{
+                'name': record['name'],
+                'parent': record['parent'],
+                'depth': record['depth'],
+                'start_seconds': record['start'],
+                'seconds': record['seconds'],
+                'rss_start_mb': record['rss_start'] / mb,
+                'rss_peak_mb': record['rss_peak'] / mb,
+                'rss_end_mb': record['rss_end'] / mb,
+                **({'attrs': record['attrs']} if record['attrs'] else {}),
+                **({key: record[key] for key in ('error', 'profile') if key in record}),
+            } for record in sorted(self.spans, key=lambda record: record['start'])],
+        }
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self):
+        """Save the trace as <trace_dir>/<run>-<timestamp>-<pid>.json"""
+        self.close()
+        os.makedirs(self.trace_dir, exist_ok=True)
+        path = os.path.join(self.trace_dir, f'{self.run_id}.json')
+        with atomic_open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2, default=str)
+        return path
+
+    def print_summary(self, max_depth=1):
+        """Table of the stages down to `max_depth`, repeated spans of a stage added up"""
+        stages = {}
+        for record in sorted(self.spans, key=lambda record: record['start']):
+            if record['depth'] <= max_depth:
+                stage = stages.setdefault((record['depth'], record['name']), [0, 0.0, 0])
+                stage[0] += 1
+                stage[1] += record['seconds']
+                stage[2] = max(stage[2], record['rss_peak'])
+        print(f"\n{'Stage':<40} {'Calls':>6} {'Seconds':>9} {'Peak RSS MB':>12}")
+        print("-"*70)
+        for (depth, name), (calls, seconds, peak) in stages.items():
+            print(f"{'  ' * depth + name:<40} {calls:>6} {seconds:>9.2f} {peak / 2**20:>12.1f}")
+        if self.counters:
+            print("Counters: " + ', '.join(f"{name}={value}" for name, value in sorted(self.counters.items())))
+
+@contextmanager
+def trace_run(run, trace_dir=TRACE_DIR, profile=(), enabled=True):
+    """
+    Trace a script run: the Tracer is active for span()/count() calls anywhere
+    in the process until the block ends, and its JSON trace is written then
+    (also when the run fails).
+    """
+    global _active
+    if not enabled:
+        yield None
+        return
+    # '*' profiles the whole run as one stage
+    tracer = Tracer(run, trace_dir, [run if stage == '*' else stage for stage in profile])
+    previous, _active = _active, tracer
+    try:
+        with tracer.span(run):
+            yield tracer
+    finally:
+        _active = previous
+        path = tracer.write()
+        tracer.print_summary()
+        print(f"✓ Trace written to {path}")
+
+def span(name, **attrs):
+    """Span of the active run's tracer (a no-op outside trace_run())"""
+    return _active.span(name, **attrs) if _active is not None else nullcontext(attrs)
+
+def count(name, n=1):
+    """Add to a counter of the active run (a no-op outside trace_run())"""
+    if _active is not None:
+        _active.count(name, n)
+
+def add_trace_arguments(parser):
+    """--no-trace, --trace-dir and --profile options shared by the scripts"""
+    group = parser.add_argument_group('tracing')
+    group.add_argument('--no-trace', action='store_true', help=f'Do not write a JSON trace to {TRACE_DIR}')
+    group.add_argument('--trace-dir', default=TRACE_DIR, help='Directory of the JSON traces and profiles')
+    group.add_argument('--profile', action='append', default=[], metavar='STAGE',
+                       help="Run a stage under cProfile (repeatable, '*' for the whole run); "
+                            "the .prof file is written next to the trace")
+
+def trace_options(args):
+    """trace_run() keyword arguments from parsed add_trace_arguments() options"""
+    return {'trace_dir': args.trace_dir, 'profile': args.profile, 'enabled': not args.no_trace}
@@ -0,0 +1,305 @@
+"""
+NumPy LSTM Runtime for Chili Price Prediction
+Exports the saved Keras LSTM models (models/lstm/*.h5) to compact .npz weight
+files and runs their forward pass in pure NumPy, so forecasting does not need
+TensorFlow
+"""
+
+import numpy as np
+from artifact_cache import atomic_open
+import argparse
+import glob
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import time
+
+RUNTIME_FORMAT = 2
+# Scaler exports have their own version: their layout is unchanged since format 1
+SCALER_FORMAT = 1
+LSTM_DIR = 'models/lstm'
+SCALERS_DIR = 'data/scalers'
+
+ACTIVATIONS = {
+    'relu': lambda x: np.maximum(x, 0),
+    'tanh': np.tanh,
+    'sigmoid': lambda x: 0.5 * (np.tanh(0.5 * x) + 1),  # Overflow-free logistic
+    'linear': lambda x: x,
+}
+
+def runtime_path(h5_path):
+    """Path of the exported weights next to a Keras .h5 file"""
+    return f'{os.path.splitext(h5_path)[0]}.npz'
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _read_header(path):
+    with np.load(path, allow_pickle=False) as data:
+        return json.loads(str(data['header']))
+
+def _activation(name):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"Unsupported activation '{name}', expected one of {sorted(ACTIVATIONS)}")
+    return ACTIVATIONS[name]
+
+def export_model(h5_path, output_path=None):
+    """
+    Write the LSTM/Dense weights of a Keras model to an .npz file.
+
+    Dropout layers are kept as weightless specs: they are the identity at
+    inference and only sample masks for MC-dropout. The layer specs are stored
+    as JSON in the same file, so loading needs only NumPy.
+    """
+    from tensorflow.keras.models import load_model
+
+    model = load_model(h5_path, compile=False)
+    output_path = output_path or runtime_path(h5_path)
+
+    layers = []
+    arrays = {}
+    for layer in model.layers:
+        kind = type(layer).__name__
+        config = layer.get_config()
+        if kind == 'Dropout':
+            layers.append({'type': 'dropout', 'rate': float(config['rate'])})
+            continue
+        if kind == 'LSTM':
+            if config.get('go_backwards') or not config.get('use_bias', True):
+                raise ValueError(f"{h5_path}: only forward LSTM layers with bias are supported")
+            spec = {'type': 'lstm', 'units': config['units'], 'activation': config['activation'],
+                    'recurrent_activation': config['recurrent_activation'],
+                    'return_sequences': config['return_sequences']}
+            names = ('kernel', 'recurrent_kernel', 'bias')
+        elif kind == 'Dense':
+            spec = {'type': 'dense', 'units': config['units'], 'activation': config['activation']}
+            names = ('kernel', 'bias')
+        else:
+            raise ValueError(f"{h5_path}: unsupported layer {kind}")
+
+        _activation(spec['activation'])
+        for name, weight in zip(names, layer.get_weights()):
+            arrays[f'layer{len(layers)}_{name}'] = weight.astype(np.float32)
+        layers.append(spec)
+
+    header = {'format': RUNTIME_FORMAT, 'source': os.path.basename(h5_path), 'source_sha256': _file_hash(h5_path),
+              'input_shape': list(model.input_shape[1:]), 'layers': layers}
+    with atomic_open(output_path) as f:
+        np.savez(f, header=np.array(json.dumps(header)), **arrays)
+    return output_path
+
+class NumpyLSTM:
+    """
+    Forward pass of a stacked LSTM + Dense model in NumPy.
+
+    Weights may carry a leading model axis (see stack()), in which case
+    predict() takes (n_models, batch, look_back, features) and runs every
+    model in the same matrix products.
+    """
+
+    def __init__(self, layers, weights, input_shape):
+        self.layers = layers
+        self.weights = weights
+        self.input_shape = tuple(input_shape)
+
+    @classmethod
+    def stack(cls, models):
+        """Combine models with identical shapes (e.g. one per market) into one batched model"""
+        first = models[0]
+        for other in models[1:]:
+            if other.layers != first.layers or other.input_shape != first.input_shape:
+                raise ValueError("Only models with identical architectures can be stacked")
+        weights = [{name: np.stack([model.weights[idx][name] for model in models])
+                    for name in layer_weights}
+                   for idx, layer_weights in enumerate(first.weights)]
+        return cls(first.layers, weights, first.input_shape)
+
+    def predict(self, windows, rng=None):
+        """
+        Run (..., batch, look_back, features) windows through the model.
+
+        With a NumPy Generator `rng`, dropout stays active (MC-dropout): every
+        window in the batch gets its own masks, as Keras does with training=True.
+        """
+        x = np.asarray(windows, dtype=np.float32)
+        for spec, weights in zip(self.layers, self.weights):
+            if spec['type'] == 'dropout':
+                if rng is not None and spec['rate'] > 0:
+                    keep = rng.random(x.shape, dtype=np.float32) >= spec['rate']
+                    x = np.where(keep, x / (1 - spec['rate']), 0).astype(np.float32)
+            elif spec['type'] == 'lstm':
+                x = self._lstm(x, spec, weights)
+            else:
+                x = _activation(spec['activation'])(x @ weights['kernel'] + weights['bias'][..., np.newaxis, :])
+        return x
+
+    __call__ = predict
+
+    @staticmethod
+    def _lstm(x, spec, weights):
+        units = spec['units']
+        activation = _activation(spec['activation'])
+        recurrent_activation = _activation(spec['recurrent_activation'])
+        kernel, recurrent_kernel = weights['kernel'], weights['recurrent_kernel']
+        bias = weights['bias'][..., np.newaxis, np.newaxis, :]
+
+        # Input projections of all time steps in one product: (..., batch, time, 4 * units)
+        projected = x @ kernel[..., np.newaxis, :, :] + bias
+        batch_shape = x.shape[:-2]
+        h = np.zeros(batch_shape + (units,), dtype=np.float32)
+        c = np.zeros_like(h)
+        outputs = []
+        for t in range(x.shape[-2]):
+            z = projected[..., t, :] + h @ recurrent_kernel
+            # Keras gate order: input, forget, cell, output
+            i = recurrent_activation(z[..., :units])
+            f = recurrent_activation(z[..., units:2 * units])
+            c = f * c + i * activation(z[..., 2 * units:3 * units])
+            o = recurrent_activation(z[..., 3 * units:])
+            h = o * activation(c)
+            if spec['return_sequences']:
+                outputs.append(h)
+        return np.stack(outputs, axis=-2) if spec['return_sequences'] else h
+
+def load_runtime(path):
+    """Load an exported .npz model"""
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data['header']))
+        if header['format'] != RUNTIME_FORMAT:
+            raise ValueError(f"{path}: runtime format {header['format']}, expected {RUNTIME_FORMAT}")
+        names = {'lstm': ('kernel', 'recurrent_kernel', 'bias'), 'dense': ('kernel', 'bias'), 'dropout': ()}
+        weights = [{name: data[f'layer{idx}_{name}'] for name in names[spec['type']]}
+                   for idx, spec in enumerate(header['layers'])]
+    return NumpyLSTM(header['layers'], weights, header['input_shape'])
+
+class MinMaxTransform:
+    """The transform/inverse_transform of a fitted MinMaxScaler, without scikit-learn"""
+
+    def __init__(self, min_, scale_, feature_names_in_):
+        self.min_ = min_
+        self.scale_ = scale_
+        self.feature_names_in_ = feature_names_in_
+
+    def transform(self, X):
+        return np.asarray(X, dtype=np.float64) * self.scale_ + self.min_
+
+    def inverse_transform(self, X):
+        return (np.asarray(X, dtype=np.float64) - self.min_) / self.scale_
+
+def export_scaler(joblib_path, output_path=None):
+    """Write the parameters of a saved MinMaxScaler to an .npz file"""
+    import joblib
+
+    scaler = joblib.load(joblib_path)
+    output_path = output_path or runtime_path(joblib_path)
+    header = {'format': SCALER_FORMAT, 'source': os.path.basename(joblib_path),
+              'source_sha256': _file_hash(joblib_path)}
+    with atomic_open(output_path) as f:
+        np.savez(f, header=np.array(json.dumps(header)), min_=scaler.min_, scale_=scaler.scale_,
+                 feature_names_in_=np.asarray(scaler.feature_names_in_, dtype=str))
+    return output_path
+
+def load_scaler(path):
+    """Load an exported scaler"""
+    with np.load(path, allow_pickle=False) as data:
+        return MinMaxTransform(data['min_'], data['scale_'], data['feature_names_in_'].astype(object))
+
+def _is_current(source_path, path, expected_format):
+    if not os.path.exists(path):
+        return False
+    try:
+        header = _read_header(path)
+    except (OSError, ValueError, KeyError):
+        return False
+    return header.get('format') == expected_format and header.get('source_sha256') == _file_hash(source_path)
+
+def is_current(h5_path, path=None):
+    """True when the exported model exists and was made from the current contents of the .h5 file"""
+    return _is_current(h5_path, path or runtime_path(h5_path), RUNTIME_FORMAT)
+
+def scaler_is_current(joblib_path, path=None):
+    """True when the exported scaler exists and was made from the current contents of the .joblib file"""
+    return _is_current(joblib_path, path or runtime_path(joblib_path), SCALER_FORMAT)
+
+def check_parity(h5_path, path=None, n_windows=256, seed=0):
+    """Max absolute difference between Keras and the NumPy runtime on random windows"""
+    from tensorflow.keras.models import load_model
+
+    runtime = load_runtime(path or runtime_path(h5_path))
+    keras_model = load_model(h5_path, compile=False)
+    windows = np.random.default_rng(seed).random((n_windows,) + runtime.input_shape, dtype=np.float32)
+    expected = np.asarray(keras_model.predict_on_batch(windows))
+    return float(np.max(np.abs(runtime.predict(windows) - expected)))
+
+def _cold_start_seconds(code):
+    """Wall time of a fresh interpreter running `code`"""
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, capture_output=True,
+                   env={**os.environ, 'TF_CPP_MIN_LOG_LEVEL': '3'})
+    return time.perf_counter() - start
+
+def compare_cold_start(h5_path):
+    """Time load + one prediction in a new process with Keras and with the NumPy runtime"""
+    shape = load_runtime(runtime_path(h5_path)).input_shape
+    zeros = f"np.zeros((1,) + {tuple(shape)}, dtype=np.float32)"
+    keras_code = ("import numpy as np\nfrom tensorflow.keras.models import load_model\n"
+                  f"load_model({h5_path!r}, compile=False).predict_on_batch({zeros})")
+    numpy_code = ("import numpy as np\nfrom lstm_runtime import load_runtime\n"
+                  f"load_runtime({runtime_path(h5_path)!r}).predict({zeros})")
+    return _cold_start_seconds(keras_code), _cold_start_seconds(numpy_code)
+
+def main(lstm_dir=LSTM_DIR, scalers_dir=SCALERS_DIR, parity=True, cold_start=True):
+    print("="*80)
+    print("LSTM EXPORT - NumPy runtime")
+    print("="*80)
+
+    h5_paths = sorted(glob.glob(os.path.join(lstm_dir, '*.h5')))
+    if not h5_paths:
+        print(f"⚠ No .h5 models found in {lstm_dir}")
+        return
+
+    print(f"\n{'Model':<40} {'h5 KB':>8} {'npz KB':>8} {'max |diff|':>12}")
+    print("-"*72)
+    exported = []
+    for h5_path in h5_paths:
+        try:
+            path = export_model(h5_path)
+        except ValueError as error:
+            # e.g. the Functional global model of train_lstm.py --global
+            print(f"⚠ {os.path.basename(h5_path)} skipped: {error}")
+            continue
+        exported.append(h5_path)
+        diff = check_parity(h5_path, path) if parity else float('nan')
+        print(f"{os.path.basename(h5_path):<40} {os.path.getsize(h5_path) / 1024:>8.1f} "
+              f"{os.path.getsize(path) / 1024:>8.1f} {diff:>12.2e}")
+        if parity and diff > 1e-4:
+            print(f"  ⚠ NumPy output differs from Keras by {diff:.2e}")
+
+    for joblib_path in sorted(glob.glob(os.path.join(scalers_dir, 'scaler_*.joblib'))):
+        path = export_scaler(joblib_path)
+        print(f"✓ Scaler exported: {path}")
+
+    if cold_start and exported:
+        reference = next((path for path in exported if path.endswith('lstm_holiday_model_all_markets.h5')), exported[0])
+        keras_time, numpy_time = compare_cold_start(reference)
+        print(f"\nCold start (new process, load + 1 prediction) for {os.path.basename(reference)}:")
+        print(f"  Keras:         {keras_time:6.2f}s")
+        print(f"  NumPy runtime: {numpy_time:6.2f}s")
+
+    print(f"\n✓ Exported {len(exported)} of {len(h5_paths)} models to {lstm_dir}/*.npz")
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Export LSTM models to the NumPy runtime')
+    parser.add_argument('--models-dir', default=LSTM_DIR, help='Directory with the .h5 models')
+    parser.add_argument('--scalers-dir', default=SCALERS_DIR, help='Directory with the MinMaxScaler .joblib files')
+    parser.add_argument('--no-parity', action='store_true', help='Skip the Keras parity check')
+    parser.add_argument('--no-cold-start', action='store_true', help='Skip the cold start comparison')
+    args = parser.parse_args(argv)
+    main(args.models_dir, args.scalers_dir, parity=not args.no_parity, cold_start=not args.no_cold_start)
+
+if __name__ == "__main__":
+    cli()
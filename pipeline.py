@@ -0,0 +1,406 @@
+"""
+Pipeline Orchestrator for Chili Price Prediction
+Runs the end-to-end flow (ingest -> imputation -> holiday flag -> scalers ->
+ARIMA and LSTM training -> inference -> plots) as a DAG of cli.py subcommands.
+Each stage declares its inputs and outputs: the dependencies follow from them,
+a stage whose inputs, code and command are unchanged since its last successful
+run (and whose outputs are intact) is skipped, and independent stages run
+concurrently within a CPU and memory budget
+"""
+
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from artifact_cache import artifact_key, atomic_open, file_hash
+from data_access import DATA_PATH
+import ingest
+import preprocess
+import argparse
+import ast
+import datetime
+import fnmatch
+import glob
+import json
+import os
+import subprocess
+import sys
+import time
+
+PIPELINE_DIR = 'result/pipeline'
+STATE_PATH = os.path.join(PIPELINE_DIR, 'state.json')
+LOGS_DIR = os.path.join(PIPELINE_DIR, 'logs')
+STATE_FORMAT = 1
+# Thread pools of the numeric libraries follow the CPUs granted to a stage
+THREAD_VARIABLES = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+                    'TF_NUM_INTRAOP_THREADS', 'TF_NUM_INTEROP_THREADS')
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+class Stage:
+    """
+    One pipeline step: a cli.py subcommand with the files it reads and writes.
+
+    `inputs` and `outputs` are paths or glob patterns. '{cpus}' in the command
+    is replaced by the CPUs granted to the stage; `memory_mb` is its expected
+    peak RSS, checked against the --memory-mb budget.
+    """
+
+    def __init__(self, name, command, inputs=(), outputs=(), cpus=1, memory_mb=0, packages=('numpy',)):
+        self.name = name
+        self.command = list(command)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.cpus = cpus
+        self.memory_mb = memory_mb
+        self.packages = packages
+
+    def argv(self, cpus):
+        return [part.replace('{cpus}', str(cpus)) for part in self.command]
+
+METRICS = 'result/metrics'
+STAGES = [
+    Stage('ingest', ['ingest'],
+          inputs=[ingest.RAW_PATH],
+          outputs=[ingest.MELTED_PATH, ingest.CLEANED_PATH],
+          memory_mb=300, packages=('pandas',)),
+    Stage('impute', ['preprocess', 'impute'],
+          inputs=[ingest.CLEANED_PATH],
+          outputs=[preprocess.IMPUTED_PATH],
+          memory_mb=300, packages=('pandas',)),
+    Stage('holidays', ['preprocess', 'holidays'],
+          inputs=[preprocess.IMPUTED_PATH],
+          outputs=[preprocess.IMPUTED_HOLIDAYS_PATH, DATA_PATH],
+          memory_mb=300, packages=('pandas', 'holidays')),
+    Stage('scalers', ['preprocess', 'scalers'],
+          inputs=[DATA_PATH],
+          outputs=[preprocess.TRAIN_PATH, preprocess.TEST_PATH,
+                   f'{preprocess.SCALERS_DIR}/scaler_*.joblib', f'{preprocess.SCALERS_DIR}/scaler_*.npz',
+                   f'{preprocess.NORMALIZED_DIR}/*_normalized.csv'],
+          memory_mb=400, packages=('pandas', 'scikit-learn')),
+    Stage('train-arima', ['train-arima', '--workers', '{cpus}'],
+          inputs=[DATA_PATH],
+          outputs=['models/arima/arima*_model_*.joblib', 'models/arima/arima*_model_*.npz',
+                   f'{METRICS}/arima_summary.pkl', f'{METRICS}/arimax_summary.pkl',
+                   f'{METRICS}/arima_detailed_results.pkl'],
+          cpus=2, memory_mb=1500, packages=('pandas', 'statsmodels')),
+    Stage('train-lstm', ['train-lstm'],
+          inputs=[DATA_PATH, f'{preprocess.SCALERS_DIR}/scaler_*.joblib'],
+          outputs=['models/lstm/lstm*_model_all_markets.h5', 'models/lstm/lstm*_model_all_markets.npz',
+                   f'{METRICS}/lstm_summary.pkl', f'{METRICS}/lstm_detailed_results.pkl'],
+          cpus=2, memory_mb=2000, packages=('pandas', 'tensorflow')),
+    Stage('inference', ['forecast'],
+          inputs=[DATA_PATH, f'{METRICS}/lstm_summary.pkl', f'{METRICS}/lstm_detailed_results.pkl',
+                  f'{METRICS}/arima_summary.pkl', f'{METRICS}/arima_detailed_results.pkl'],
+          outputs=['result/predictions_*.csv'],
+          memory_mb=800, packages=('pandas',)),
+    Stage('plot', ['plot'],
+          inputs=[DATA_PATH, f'{METRICS}/lstm_detailed_results.pkl', f'{METRICS}/arima_detailed_results.pkl',
+                  'result/predictions_*.csv'],
+          outputs=['result/plots/prediction_comparison_lstm_arima.png',
+                   'result/plots/prediction_comparison_all_markets.png',
+                   'result/plots/error_comparison_lstm_arima.png'],
+          memory_mb=600, packages=('pandas', 'matplotlib')),
+]
+
+def expand(patterns):
+    """Paths matched by `patterns` (a plain path is kept even when it does not exist yet)"""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+def hash_files(patterns):
+    """{path: sha256 or None} of the files matched by `patterns`"""
+    return {path: file_hash(path) for path in expand(patterns)}
+
+def _produces(stage, path):
+    """True when `path` (or pattern) is one of the stage's outputs"""
+    return any(path == output or fnmatch.fnmatch(path, output) or fnmatch.fnmatch(output, path)
+               for output in stage.outputs)
+
+def dependencies(stages):
+    """{stage: [upstream stages]} - a stage depends on every earlier stage producing one of its inputs"""
+    deps = {}
+    for idx, stage in enumerate(stages):
+        deps[stage.name] = [upstream.name for upstream in stages[:idx]
+                            if any(_produces(upstream, path) for path in stage.inputs)]
+    return deps
+
+def select(stages, targets):
+    """The target stages and everything upstream of them, in declaration order"""
+    if not targets:
+        return list(stages)
+    deps = dependencies(stages)
+    wanted = set()
+    todo = list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in wanted:
+            wanted.add(name)
+            todo.extend(deps[name])
+    return [stage for stage in stages if stage.name in wanted]
+
+def code_files(module, found=None):
+    """The module's file and, recursively, the files of the repository modules it imports"""
+    found = set() if found is None else found
+    path = os.path.join(HERE, f'{module}.py')
+    if module in found or not os.path.exists(path):
+        return found
+    found.add(module)
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            code_files(name.split('.')[0], found)
+    return found
+
+def stage_code(stage):
+    """Source files a stage runs: cli.py and its subcommand's module with their local imports"""
+    from cli import COMMANDS
+
+    modules = code_files('cli', code_files(COMMANDS[stage.command[0]][0]))
+    return sorted(f'{module}.py' for module in modules)
+
+def fingerprint(stage):
+    """
+    Everything a stage's result depends on: command, input and code hashes and
+    library versions. The command is kept unformatted, so a different CPU grant
+    alone does not make a stage stale.
+    """
+    record = {
+        'command': stage.command,
+        'inputs': hash_files(stage.inputs),
+        'code': hash_files(stage_code(stage)),
+    }
+    record['key'] = artifact_key('pipeline_stage', record, packages=stage.packages)
+    return record
+
+def stale_reason(stage, record, previous):
+    """Why a stage has to run (None when its last successful run is still valid)"""
+    if previous is None:
+        return 'no previous run'
+    if previous['key'] != record['key']:
+        for field, label in (('inputs', 'inputs changed'), ('code', 'code changed'),
+                             ('command', 'command changed')):
+            if previous.get(field) != record[field]:
+                changed = [path for path in set(previous[field]) | set(record[field])
+                           if previous[field].get(path) != record[field].get(path)] if field != 'command' else []
+                return f"{label}: {', '.join(sorted(changed)[:3])}" if changed else label
+        return 'library versions changed'
+    outputs = previous.get('outputs', {})
+    if not outputs or any(file_hash(path) != digest for path, digest in outputs.items()):
+        return 'outputs missing or modified'
+    if any(not glob.glob(pattern) for pattern in stage.outputs):
+        return 'outputs missing or modified'
+    return None
+
+def load_state(path=STATE_PATH):
+    """Records of the last successful run of each stage"""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        state = json.load(f)
+    return state.get('stages', {}) if state.get('format') == STATE_FORMAT else {}
+
+def save_state(stages, path=STATE_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with atomic_open(path, 'w') as f:
+        json.dump({'format': STATE_FORMAT, 'stages': stages}, f, indent=2, sort_keys=True)
+
+def run_stage(stage, cpus, logs_dir=LOGS_DIR):
+    """Run the stage's cli.py subcommand in a subprocess; returns (exit code, seconds, log path)"""
+    os.makedirs(logs_dir, exist_ok=True)
+    log_path = os.path.join(logs_dir, f'{stage.name}.log')
+    env = {**os.environ, **{variable: str(cpus) for variable in THREAD_VARIABLES}, 'PYTHONUNBUFFERED': '1'}
+    start = time.perf_counter()
+    with open(log_path, 'w') as log:
+        completed = subprocess.run([sys.executable, os.path.join(HERE, 'cli.py'), *stage.argv(cpus)],
+                                   stdout=log, stderr=subprocess.STDOUT, env=env)
+    return completed.returncode, time.perf_counter() - start, log_path
+
+class Scheduler:
+    """
+    Runs the stages of a DAG as their dependencies finish.
+
+    A ready stage is checked against its last successful run once its
+    upstream stages are done (so an upstream rerun that reproduces the same
+    files does not force it), then started when its CPUs and memory fit in
+    what the running stages leave of the budget. A stage larger than the whole
+    budget is given all of it and runs alone. A failed stage blocks its
+    downstream stages; independent branches carry on.
+    """
+
+    def __init__(self, stages, cpus=None, memory_mb=None, force=False, dry_run=False, state_path=STATE_PATH):
+        self.stages = stages
+        self.deps = dependencies(stages)
+        self.cpus = max(1, cpus or os.cpu_count() or 1)
+        self.memory_mb = memory_mb
+        self.force = force
+        self.dry_run = dry_run
+        self.state_path = state_path
+        self.state = load_state(state_path)
+        self.status = {}
+        self.results = {}
+
+    def grant(self, stage):
+        return min(stage.cpus, self.cpus)
+
+    def fits(self, stage, running):
+        if not running:
+            return True
+        cpus = sum(self.grant(other) for other in running.values())
+        if cpus + self.grant(stage) > self.cpus:
+            return False
+        if self.memory_mb is not None:
+            memory = sum(other.memory_mb for other in running.values())
+            return memory + stage.memory_mb <= self.memory_mb
+        return True
+
+    def _log(self, message):
+        print(f"[{datetime.datetime.now():%H:%M:%S}] {message}", flush=True)
+
+    def _check(self, stage):
+        """Mark a ready stage as skipped, or return its fingerprint and the reason it has to run"""
+        record = fingerprint(stage)
+        reason = 'forced' if self.force else stale_reason(stage, record, self.state.get(stage.name))
+        if reason is None:
+            self.status[stage.name] = 'skipped'
+            self._log(f"- {stage.name:<12} up to date, skipped")
+        return record, reason
+
+    def _finish(self, stage, record, outcome):
+        code, seconds, log_path = outcome
+        self.results[stage.name] = {'seconds': seconds, 'log': log_path}
+        if code == 0:
+            self.status[stage.name] = 'done'
+            record['outputs'] = hash_files(stage.outputs)
+            record['finished_at'] = datetime.datetime.now().isoformat(timespec='seconds')
+            record['seconds'] = seconds
+            self.state[stage.name] = record
+            save_state(self.state, self.state_path)
+            self._log(f"✓ {stage.name:<12} finished in {seconds:.1f}s")
+        else:
+            self.status[stage.name] = 'failed'
+            self._log(f"⚠ {stage.name:<12} failed (exit code {code}) after {seconds:.1f}s, see {log_path}")
+
+    def dry_run_plan(self):
+        """Print what a run would do; stages after one that runs are assumed to run too"""
+        for stage in self.stages:
+            upstream = [name for name in self.deps[stage.name] if self.status[name] == 'run']
+            if upstream:
+                reason = f"after {', '.join(upstream)}"
+            else:
+                reason = 'forced' if self.force else stale_reason(
+                    stage, fingerprint(stage), self.state.get(stage.name))
+            self.status[stage.name] = 'run' if reason else 'skipped'
+            print(f"  {stage.name:<12} {'run' if reason else 'up to date':<11} "
+                  f"{self.grant(stage)} CPU {stage.memory_mb:>5} MB  {reason or ''}")
+        return self.status
+
+    def run(self):
+        if self.dry_run:
+            return self.dry_run_plan()
+        pending = [stage for stage in self.stages]
+        running = {}
+        with ThreadPoolExecutor(max_workers=len(self.stages)) as executor:
+            while pending or running:
+                for stage in list(pending):
+                    blocked = [name for name in self.deps[stage.name] if self.status.get(name) in ('failed', 'blocked')]
+                    if blocked:
+                        pending.remove(stage)
+                        self.status[stage.name] = 'blocked'
+                        self._log(f"⚠ {stage.name:<12} not run: {', '.join(blocked)} did not succeed")
+                progress = False
+                for stage in list(pending):
+                    if any(self.status.get(name) not in ('done', 'skipped') for name in self.deps[stage.name]):
+                        continue
+                    if stage.name not in self.results:
+                        record, reason = self._check(stage)
+                        if reason is None:
+                            pending.remove(stage)
+                            progress = True
+                            continue
+                        self.results[stage.name] = {'record': record, 'reason': reason}
+                    if not self.fits(stage, running):
+                        continue
+                    pending.remove(stage)
+                    progress = True
+                    self.status[stage.name] = 'running'
+                    cpus = self.grant(stage)
+                    self._log(f"▶ {stage.name:<12} started ({self.results[stage.name]['reason']}; "
+                              f"{cpus} CPU, cli.py {' '.join(stage.argv(cpus))})")
+                    running[executor.submit(run_stage, stage, cpus)] = stage
+                if progress or not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    record = self.results[stage.name]['record']
+                    try:
+                        outcome = future.result()
+                    except OSError as error:
+                        outcome = (-1, 0.0, str(error))
+                    self._finish(stage, record, outcome)
+        return self.status
+
+    def print_summary(self):
+        print(f"\n{'Stage':<14} {'Status':<9} {'Seconds':>9}")
+        print("-"*34)
+        for stage in self.stages:
+            seconds = self.results.get(stage.name, {}).get('seconds')
+            print(f"{stage.name:<14} {self.status.get(stage.name, '-'):<9} "
+                  f"{'' if seconds is None else f'{seconds:.1f}':>9}")
+
+def main(targets=None, cpus=None, memory_mb=None, force=False, dry_run=False):
+    print("="*80)
+    print("PIPELINE - Ingest to plots, unchanged stages skipped")
+    print("="*80)
+
+    stages = select(STAGES, targets)
+    scheduler = Scheduler(stages, cpus, memory_mb, force, dry_run)
+    deps = scheduler.deps
+    budget = f"{scheduler.cpus} CPU" + (f", {memory_mb} MB" if memory_mb else '')
+    print(f"\nStages ({budget} budget):")
+    for stage in stages:
+        print(f"  {stage.name:<12} <- {', '.join(deps[stage.name]) or '-'}")
+    print()
+
+    start = time.perf_counter()
+    status = scheduler.run()
+    if dry_run:
+        return status
+    scheduler.print_summary()
+    failed = [name for name, value in status.items() if value in ('failed', 'blocked')]
+    if failed:
+        print(f"\n⚠ Pipeline incomplete after {time.perf_counter() - start:.1f}s: {', '.join(failed)}")
+    else:
+        print(f"\n✓ Pipeline completed in {time.perf_counter() - start:.1f}s (state in {STATE_PATH})")
+    return status
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    names = [stage.name for stage in STAGES]
+    parser = argparse.ArgumentParser(prog=prog, description='Run the pipeline stages that are out of date')
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help=f"Stages to bring up to date, with their upstream stages (default: all; {', '.join(names)})")
+    parser.add_argument('--cpus', type=int, default=None,
+                        help='CPU budget shared by concurrent stages (default: all cores)')
+    parser.add_argument('--memory-mb', type=int, default=None,
+                        help='Memory budget shared by concurrent stages (default: unlimited)')
+    parser.add_argument('--force', action='store_true', help='Run the selected stages even when up to date')
+    parser.add_argument('--dry-run', action='store_true', help='Show which stages would run and why')
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.stages if name not in names]
+    if unknown:
+        parser.error(f"unknown stages: {', '.join(unknown)}")
+    status = main(args.stages, args.cpus, args.memory_mb, args.force, args.dry_run)
+    if any(value in ('failed', 'blocked') for value in status.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    cli()
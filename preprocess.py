@@ -0,0 +1,95 @@
+"""
+Preprocessing Script for Chili Price Prediction
+Runs the steps of notebooks/01_data_cleaning_and_eda.ipynb that follow the
+cleaning done by ingest.py: imputation, the holiday flag, the chronological
+train/test split and the MinMaxScaler fitting
+"""
+
+import pandas as pd
+from data_access import DATA_PATH, MARKET_COLUMNS, split_index
+from ingest import CLEANED_PATH
+from calendar_features import load_calendar
+import argparse
+import joblib
+import os
+import time
+
+IMPUTED_PATH = 'data/imputed/imputed_prices_by_market.csv'
+IMPUTED_HOLIDAYS_PATH = 'data/imputed/imputed_prices_with_holidays.csv'
+TRAIN_PATH = 'data/processed/train_data.csv'
+TEST_PATH = 'data/processed/test_data.csv'
+SCALERS_DIR = 'data/scalers'
+NORMALIZED_DIR = 'data/normalized'
+STEPS = ('impute', 'holidays', 'scalers')
+
+def impute(cleaned_path=CLEANED_PATH, output_path=IMPUTED_PATH):
+    """Date x market price table with gaps filled by linear interpolation (then ffill/bfill at the edges)"""
+    cleaned = pd.read_csv(cleaned_path, parse_dates=['Date'])
+    prices = cleaned.pivot(index='Date', columns='Market', values='Price').sort_index()
+    imputed = prices.interpolate(method='linear', axis=0).ffill().bfill()
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    imputed.to_csv(output_path)
+    print(f"✓ Imputed {int(prices.isna().sum().sum())} missing prices: {output_path} {imputed.shape}")
+    return imputed
+
+def add_holidays(imputed_path=IMPUTED_PATH, output_paths=(IMPUTED_HOLIDAYS_PATH, DATA_PATH)):
+    """Add the is_holiday flag (the holiday windows of calendar_features.py) to the imputed prices"""
+    df_with_holidays = pd.read_csv(imputed_path, index_col=0, parse_dates=True)
+    df_with_holidays['is_holiday'] = load_calendar().exog(df_with_holidays.index)[:, 0].astype(int)
+    for path in output_paths:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df_with_holidays.to_csv(path)
+    print(f"✓ Holiday flag added: {int(df_with_holidays['is_holiday'].sum())} of {len(df_with_holidays)} days "
+          f"({', '.join(output_paths)})")
+    return df_with_holidays
+
+def fit_scalers(data_path=DATA_PATH, scalers_dir=SCALERS_DIR, normalized_dir=NORMALIZED_DIR):
+    """Split chronologically, fit both MinMaxScalers on the training rows and save the normalized data"""
+    from sklearn.preprocessing import MinMaxScaler
+    from lstm_runtime import export_scaler
+
+    df_with_holidays = pd.read_csv(data_path, index_col=0, parse_dates=True)
+    split = split_index(len(df_with_holidays))
+    train_data = df_with_holidays.iloc[:split]
+    test_data = df_with_holidays.iloc[split:]
+    train_data.to_csv(TRAIN_PATH)
+    test_data.to_csv(TEST_PATH)
+
+    os.makedirs(scalers_dir, exist_ok=True)
+    os.makedirs(normalized_dir, exist_ok=True)
+    feature_columns = MARKET_COLUMNS + ['is_holiday']
+    for name, columns, prefix in (('scaler_markets', MARKET_COLUMNS, 'markets'),
+                                  ('scaler_with_features', feature_columns, 'features')):
+        scaler = MinMaxScaler().fit(train_data[columns])
+        path = os.path.join(scalers_dir, f'{name}.joblib')
+        joblib.dump(scaler, path)
+        export_scaler(path)
+        for part, frame in (('train', train_data), ('test', test_data)):
+            scaled = pd.DataFrame(scaler.transform(frame[columns]), columns=columns, index=frame.index)
+            scaled.to_csv(os.path.join(normalized_dir, f'{part}_{prefix}_normalized.csv'))
+    print(f"✓ Scalers fit on {len(train_data)} training days ({len(test_data)} test days): "
+          f"{scalers_dir}/, {normalized_dir}/")
+
+def main(steps=STEPS):
+    print("="*80)
+    print("PREPROCESSING - Imputation, holiday flag and scalers")
+    print("="*80)
+    runners = {'impute': impute, 'holidays': add_holidays, 'scalers': fit_scalers}
+    for step in steps:
+        start = time.perf_counter()
+        runners[step]()
+        print(f"  {step} finished in {time.perf_counter() - start:.2f}s")
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Impute, add the holiday flag and fit the scalers')
+    parser.add_argument('steps', nargs='*', metavar='step',
+                        help=f"Steps to run, in order (default: all; {', '.join(STEPS)})")
+    args = parser.parse_args(argv)
+    unknown = [step for step in args.steps if step not in STEPS]
+    if unknown:
+        parser.error(f"unknown steps: {', '.join(unknown)}")
+    main(args.steps or STEPS)
+
+if __name__ == "__main__":
+    cli()
@@ -0,0 +1,416 @@
+"""
+Forecast Service Script for Chili Price Prediction
+Local asyncio HTTP service over the saved LSTM/ARIMA models. Concurrent requests
+are collected for a few milliseconds and answered by one model call per model
+kind, and forecasts are kept in an LRU cache until new data is ingested
+"""
+
+import numpy as np
+from collections import OrderedDict
+from urllib.parse import parse_qs, urlsplit
+from data_access import MARKET_COLUMNS, data_fingerprint
+from inference import ALL_MARKET_KINDS, MODEL_KINDS, ModelRegistry
+import argparse
+import asyncio
+import json
+import random
+import time
+
+HOST = '127.0.0.1'
+PORT = 8765
+MAX_HORIZON = 90
+STATUS_TEXT = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+               500: 'Internal Server Error', 503: 'Service Unavailable'}
+
+class ForecastService:
+    """
+    Forecasts served from one in-memory ModelRegistry.
+
+    Requests wait up to `batch_window` seconds (or until `max_batch` are
+    queued) and are then answered together: every LSTM kind runs once for all
+    markets at the longest requested horizon, every ARIMA (kind, market) once.
+    Results are cached by (market, as-of date, horizon, model); the cache is
+    cleared and the registry reloaded when the data fingerprint changes.
+    """
+
+    def __init__(self, kinds=None, batch_window=0.005, max_batch=64, cache_size=1024, watch_interval=2.0):
+        self.kinds = kinds
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.cache_size = cache_size
+        self.watch_interval = watch_interval
+        self.registry = None
+        self.fingerprint = None
+        self.cache = OrderedDict()
+        self.queue = None
+        self._connections = set()
+        self.stats = {'requests': 0, 'cache_hits': 0, 'batches': 0, 'batched_requests': 0,
+                      'model_calls': 0, 'reloads': 0, 'errors': 0}
+
+    @property
+    def as_of(self):
+        return self.registry.history.index[-1]
+
+    def _load_registry(self):
+        registry = ModelRegistry(kinds=self.kinds).load()
+        # Some kinds finish loading on their first forecast (lstm_global imports
+        # TensorFlow then); do it here so no batch, and no request queued behind
+        # it, pays for that
+        for kind in registry.available_models():
+            registry.forecast_all(1, kind)
+        return registry, data_fingerprint(registry.data_path)
+
+    async def start(self, host=HOST, port=PORT):
+        loop = asyncio.get_running_loop()
+        self.registry, self.fingerprint = await loop.run_in_executor(None, self._load_registry)
+        self.queue = asyncio.Queue()
+        self._tasks = [asyncio.create_task(self._batcher())]
+        if self.watch_interval:
+            self._tasks.append(asyncio.create_task(self._watch_data()))
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        return self.server
+
+    async def stop(self):
+        self.server.close()
+        await self.server.wait_closed()
+        # Let open connections see their clients' EOF instead of being cancelled mid-read
+        if self._connections:
+            await asyncio.wait(self._connections, timeout=1.0)
+        for task in self._tasks:
+            task.cancel()
+
+    # ---- Forecasts -------------------------------------------------------
+
+    def _cache_get(self, key):
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            return self.cache[key]
+        return None
+
+    def _cache_put(self, key, value):
+        if self.cache_size <= 0:
+            return
+        self.cache[key] = value
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def validate(self, market, horizon, model):
+        if model not in self.registry.available_models():
+            raise ValueError(f"Unknown or unavailable model '{model}', expected one of "
+                             f"{self.registry.available_models()}")
+        if market not in MARKET_COLUMNS:
+            raise ValueError(f"Unknown market '{market}', expected one of {MARKET_COLUMNS}")
+        if not 1 <= horizon <= MAX_HORIZON:
+            raise ValueError(f"horizon must be between 1 and {MAX_HORIZON}")
+
+    async def forecast(self, market, horizon, model):
+        """(as-of date, dates, values, cached) for one request"""
+        self.validate(market, horizon, model)
+        self.stats['requests'] += 1
+        key = (market, self.as_of, horizon, model)
+        cached = self._cache_get(key)
+        if cached is not None:
+            self.stats['cache_hits'] += 1
+            return key[1], cached[0], cached[1], True
+
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put(((market, horizon, model), future))
+        as_of, dates, values = await future
+        self._cache_put((market, as_of, horizon, model), (dates, values))
+        return as_of, dates, values, False
+
+    async def _batcher(self):
+        """Collect queued requests for up to batch_window seconds and answer them together"""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    # Take whatever is already waiting without yielding again
+                    while len(batch) < self.max_batch and not self.queue.empty():
+                        batch.append(self.queue.get_nowait())
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            requests = [request for request, _ in batch]
+            try:
+                as_of, results = await loop.run_in_executor(None, self._run_batch, self.registry, requests)
+            except Exception as error:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+            self.stats['batches'] += 1
+            self.stats['batched_requests'] += len(batch)
+            for request, future in batch:
+                if not future.done():
+                    future.set_result((as_of, *results[request]))
+
+    def _run_batch(self, registry, requests):
+        """One model call per LSTM kind and per ARIMA (kind, market), at the longest requested horizon"""
+        horizons = {}
+        for market, horizon, model in requests:
+            group = model if model in ALL_MARKET_KINDS else (model, market)
+            horizons[group] = max(horizons.get(group, 0), horizon)
+
+        frames = {}
+        for group, horizon in horizons.items():
+            if isinstance(group, tuple):
+                model, market = group
+                frames[group] = registry.forecast(market, horizon, model).to_frame()
+            else:
+                frames[group] = registry.forecast_all(horizon, group)
+            self.stats['model_calls'] += 1
+
+        # Recursive forecasts of the same state agree on their common prefix,
+        # so shorter horizons are slices of the longest one
+        results = {}
+        for market, horizon, model in requests:
+            frame = frames[model if model in ALL_MARKET_KINDS else (model, market)]
+            values = frame[market].to_numpy()[:horizon]
+            dates = [date.strftime('%Y-%m-%d') for date in frame.index[:horizon]]
+            results[(market, horizon, model)] = (dates, values.round(2).tolist())
+        return registry.history.index[-1], results
+
+    async def _watch_data(self):
+        """Reload the registry and drop cached forecasts when the source data changes"""
+        loop = asyncio.get_running_loop()
+        while True:
+            await asyncio.sleep(self.watch_interval)
+            fingerprint = await loop.run_in_executor(None, data_fingerprint, self.registry.data_path)
+            if fingerprint == self.fingerprint:
+                continue
+            registry, fingerprint = await loop.run_in_executor(None, self._load_registry)
+            self.registry, self.fingerprint = registry, fingerprint
+            self.cache.clear()
+            self.stats['reloads'] += 1
+            print(f"✓ New data detected - models reloaded, as of {self.as_of.date()}, cache cleared")
+
+    # ---- HTTP ------------------------------------------------------------
+
+    async def _handle_connection(self, reader, writer):
+        """Serve HTTP/1.1 requests on one (keep-alive) connection"""
+        task = asyncio.current_task()
+        self._connections.add(task)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length', 0)):
+                    await reader.readexactly(int(headers['content-length']))
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) != 3:
+                    status, body = 400, {'error': 'malformed request line'}
+                else:
+                    status, body = await self._route(parts[0], parts[1])
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                payload = json.dumps(body).encode()
+                writer.write(f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\n"
+                             f"Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n"
+                             f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n".encode() + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.discard(task)
+            writer.close()
+
+    async def _route(self, method, target):
+        if method != 'GET':
+            return 405, {'error': 'only GET is supported'}
+        url = urlsplit(target)
+        query = {name: values[-1] for name, values in parse_qs(url.query).items()}
+        if url.path == '/health':
+            return 200, {'status': 'ok', 'as_of': str(self.as_of.date()),
+                         'models': self.registry.available_models(), 'data_sha256': self.fingerprint}
+        if url.path == '/stats':
+            batches = self.stats['batches']
+            return 200, {**self.stats, 'cache_entries': len(self.cache),
+                         'mean_batch_size': self.stats['batched_requests'] / batches if batches else 0.0}
+        if url.path != '/forecast':
+            return 404, {'error': f'unknown path {url.path}', 'paths': ['/forecast', '/health', '/stats']}
+
+        try:
+            market = query['market']
+            horizon = int(query.get('horizon', 1))
+            model = query.get('model', 'lstm_holiday')
+            as_of, dates, values, cached = await self.forecast(market, horizon, model)
+        except KeyError:
+            return 400, {'error': 'missing query parameter: market'}
+        except ValueError as error:
+            return 400, {'error': str(error)}
+        except Exception as error:
+            self.stats['errors'] += 1
+            return 500, {'error': f'{type(error).__name__}: {error}'}
+        return 200, {'market': market, 'model': model, 'horizon': horizon, 'as_of': str(as_of.date()),
+                     'cached': cached, 'forecast': [{'date': date, 'price': value}
+                                                    for date, value in zip(dates, values)]}
+
+# ---- Load generator ------------------------------------------------------
+
+async def _get(reader, writer, path):
+    writer.write(f"GET {path} HTTP/1.1\r\nHost: {HOST}\r\n\r\n".encode())
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+async def load_test(host=HOST, port=PORT, n_requests=2000, concurrency=32, models=None,
+                    horizons=(1, 5, 10, 30), seed=0):
+    """
+    Send `n_requests` random forecast requests over `concurrency` keep-alive
+    connections and return latency percentiles, throughput and cache/batch stats.
+    """
+    rng = random.Random(seed)
+    reader, writer = await asyncio.open_connection(host, port)
+    _, health = await _get(reader, writer, '/health')
+    _, before = await _get(reader, writer, '/stats')
+    models = models or health['models']
+    paths = [f"/forecast?market={rng.choice(MARKET_COLUMNS).replace(' ', '+')}"
+             f"&horizon={rng.choice(horizons)}&model={rng.choice(models)}" for _ in range(n_requests)]
+
+    latencies = []
+    uncached = []
+    statuses = {}
+    next_path = iter(paths)
+
+    async def client():
+        client_reader, client_writer = await asyncio.open_connection(host, port)
+        for path in next_path:
+            start = time.perf_counter()
+            status, body = await _get(client_reader, client_writer, path)
+            latencies.append(time.perf_counter() - start)
+            uncached.append(not body.get('cached', True))
+            statuses[status] = statuses.get(status, 0) + 1
+        client_writer.close()
+        await client_writer.wait_closed()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    _, after = await _get(reader, writer, '/stats')
+    writer.close()
+    await writer.wait_closed()
+    served = after['requests'] - before['requests']
+    batches = after['batches'] - before['batches']
+    latencies = np.array(latencies) * 1000
+    # With only a few hundred distinct requests most are cache hits; the
+    # model path is reported on its own so the hits do not hide it
+    uncached_latencies = latencies[np.array(uncached, dtype=bool)]
+    return {
+        'requests': n_requests,
+        'concurrency': concurrency,
+        'seconds': elapsed,
+        'throughput': n_requests / elapsed,
+        'p50_ms': float(np.percentile(latencies, 50)),
+        'p99_ms': float(np.percentile(latencies, 99)),
+        'max_ms': float(latencies.max()),
+        'uncached_requests': len(uncached_latencies),
+        'uncached_p50_ms': float(np.percentile(uncached_latencies, 50)) if len(uncached_latencies) else 0.0,
+        'uncached_p99_ms': float(np.percentile(uncached_latencies, 99)) if len(uncached_latencies) else 0.0,
+        'statuses': statuses,
+        'cache_hit_rate': (after['cache_hits'] - before['cache_hits']) / served if served else 0.0,
+        'mean_batch_size': (after['batched_requests'] - before['batched_requests']) / batches if batches else 0.0,
+        'model_calls': after['model_calls'] - before['model_calls'],
+    }
+
+def print_load_report(result):
+    print(f"\n{'Requests':<20} {result['requests']} ({result['concurrency']} concurrent connections)")
+    print(f"{'Throughput':<20} {result['throughput']:.0f} req/s ({result['seconds']:.2f}s)")
+    print(f"{'Latency p50':<20} {result['p50_ms']:.2f} ms")
+    print(f"{'Latency p99':<20} {result['p99_ms']:.2f} ms (max {result['max_ms']:.2f} ms)")
+    print(f"{'Uncached p50 / p99':<20} {result['uncached_p50_ms']:.2f} / {result['uncached_p99_ms']:.2f} ms "
+          f"({result['uncached_requests']} requests)")
+    print(f"{'Cache hit rate':<20} {result['cache_hit_rate']:.1%}")
+    print(f"{'Mean batch size':<20} {result['mean_batch_size']:.1f} requests "
+          f"({result['model_calls']} model calls)")
+    print(f"{'HTTP statuses':<20} {result['statuses']}")
+
+async def serve(host=HOST, port=PORT, **options):
+    service = ForecastService(**options)
+    print("Loading models...")
+    start = time.perf_counter()
+    server = await service.start(host, port)
+    print(f"✓ Models loaded and warmed up in {time.perf_counter() - start:.2f}s: {', '.join(service.registry.available_models())}"
+          f" (as of {service.as_of.date()})")
+    print(f"✓ Serving on http://{host}:{port}/forecast?market=Pasar+Sukaramai&horizon=5&model=lstm_holiday")
+    async with server:
+        await server.serve_forever()
+
+async def run_load_test(host=HOST, port=PORT, n_requests=2000, concurrency=32, **options):
+    """Start the service in this process, run the load generator against it and stop"""
+    service = ForecastService(**options)
+    await service.start(host, port)
+    try:
+        return await load_test(host, port, n_requests, concurrency, models=service.kinds)
+    finally:
+        await service.stop()
+
+def main(host=HOST, port=PORT, models=None, batch_window_ms=5.0, max_batch=64, cache_size=1024,
+         watch_interval=2.0, load_test_requests=None, concurrency=32):
+    options = {'kinds': models, 'batch_window': batch_window_ms / 1000, 'max_batch': max_batch,
+               'cache_size': cache_size, 'watch_interval': watch_interval}
+    if load_test_requests is None:
+        print("="*80)
+        print("CHILI PRICE FORECAST SERVICE")
+        print("="*80)
+        try:
+            asyncio.run(serve(host, port, **options))
+        except KeyboardInterrupt:
+            print("\n✓ Service stopped")
+        return
+
+    print("="*80)
+    print(f"FORECAST SERVICE LOAD TEST - batch window {batch_window_ms:g} ms, cache size {cache_size}")
+    print("="*80)
+    result = asyncio.run(run_load_test(host, port, load_test_requests, concurrency, **options))
+    print_load_report(result)
+    return result
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Serve forecasts over HTTP')
+    parser.add_argument('--host', default=HOST)
+    parser.add_argument('--port', type=int, default=PORT)
+    parser.add_argument('--model', action='append', choices=MODEL_KINDS,
+                        help='Model kind to load (repeatable, default: all available)')
+    parser.add_argument('--batch-window-ms', type=float, default=5.0,
+                        help='How long to collect concurrent requests into one model call (0 = no waiting)')
+    parser.add_argument('--max-batch', type=int, default=64, help='Largest number of requests per batch')
+    parser.add_argument('--cache-size', type=int, default=1024, help='Forecasts kept in the LRU cache (0 = off)')
+    parser.add_argument('--watch-interval', type=float, default=2.0,
+                        help='Seconds between checks for new data (0 = never reload)')
+    parser.add_argument('--load-test', type=int, metavar='N', dest='load_test_requests',
+                        help='Instead of serving, start the service, send N requests and report latency')
+    parser.add_argument('--concurrency', type=int, default=32, help='Connections used by --load-test')
+    args = parser.parse_args(argv)
+    main(args.host, args.port, args.model, args.batch_window_ms, args.max_batch, args.cache_size,
+         args.watch_interval, args.load_test_requests, args.concurrency)
+
+if __name__ == "__main__":
+    cli()
@@ -7,110 +7,310 @@ import pandas as pd
 import numpy as np
 from statsmodels.tsa.arima.model import ARIMA
 from statsmodels.tsa.stattools import adfuller
-from sklearn.metrics import mean_squared_error, mean_absolute_error
+from concurrent.futures import ProcessPoolExecutor
+from data_access import MARKET_COLUMNS, TEST_SIZE, split_index, load_market_frame
+from artifact_cache import ArtifactCache, artifact_key
+from arima_format import is_current, load_entry, save_slim, slim_path
+from evaluation import calculate_mape, error_metrics
+from instrumentation import add_trace_arguments, count, span, trace_options, trace_run
+import argparse
 import joblib
 import os
+import time
 import warnings
 warnings.filterwarnings('ignore')
 
-# Ensure directories exist
-os.makedirs('models/arima', exist_ok=True)
-os.makedirs('result/metrics', exist_ok=True)
-
-def calculate_mape(actual, predicted):
-    """Calculate Mean Absolute Percentage Error"""
-    mask = actual != 0
-    if mask.sum() == 0:
-        return np.nan
-    mape = np.mean(np.abs((actual[mask] - predicted[mask]) / actual[mask])) * 100
-    return min(mape, 999.99)
-
 def check_stationarity(timeseries, name="Series"):
     """Check if time series is stationary using ADF test"""
     result = adfuller(timeseries.dropna())
     is_stationary = result[1] < 0.05
     return is_stationary
 
-def find_best_arima_order(train_data, exog_data=None):
+# Simple orders that work well in practice, in priority order (ties keep the earlier order)
+PRIORITY_ORDERS = [
+    (1, 1, 1),  # Most common
+    (2, 1, 2),
+    (1, 1, 2),
+    (2, 1, 1),
+    (0, 1, 1),
+    (1, 1, 0),
+    (2, 1, 0),
+    (0, 1, 2),
+    (3, 1, 3),
+]
+FALLBACK_ORDER = (1, 1, 1)
+
+def _as_exog(exog_data):
+    """Ensure exog_data is a 2D array (or None)"""
+    if exog_data is None:
+        return None
+    exog = exog_data.values if hasattr(exog_data, 'values') else np.array(exog_data)
+    if exog.ndim == 1:
+        exog = exog.reshape(-1, 1)
+    return exog
+
+def _limit_worker_threads():
+    """Keep each worker process on one BLAS thread so processes don't oversubscribe cores"""
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(1)
+    except ImportError:
+        pass
+    warnings.filterwarnings('ignore')
+
+def _fit_order_job(job):
+    """Fit one (series, order) candidate; returns only what selection needs"""
+    key, order, train_data, exog = job
+    try:
+        fitted_model = ARIMA(train_data, exog=exog, order=order).fit()
+        return key, order, fitted_model.aic, fitted_model.params.copy()
+    except Exception:
+        return key, order, None, None
+
+def search_key(key, train_data, exog):
+    """Cache key of one order search: the series and its exog, the candidate orders and library versions"""
+    return artifact_key('arima_search', {
+        'series': key,
+        'orders': PRIORITY_ORDERS,
+        'fallback_order': FALLBACK_ORDER,
+    }, data=(train_data, exog), packages=('numpy', 'scipy', 'statsmodels'))
+
+def search_arima_orders(series, workers=1, cache=None, keys=None):
+    """
+    Grid search PRIORITY_ORDERS for several series at once.
+
+    `series` maps a key (e.g. (variant, market)) to (train_data, exog_data).
+    Every (key, order) fit is an independent job, so with workers > 1 they are
+    spread over a process pool. Selection is the same as the sequential search:
+    lowest AIC wins, ties keep the earlier order, and a key with no successful
+    fit falls back to ARIMA(1,1,1). With an ArtifactCache, series whose data
+    and settings are unchanged reuse the stored search result; `keys` are
+    their search_key()s when the caller already has them.
+
+    Returns {key: (best_order, best_model, best_aic)}.
+    """
+    prepared = {key: (train_data, _as_exog(exog_data)) for key, (train_data, exog_data) in series.items()}
+    if keys is None:
+        keys = {key: search_key(key, train_data, exog) for key, (train_data, exog) in prepared.items()}
+
+    results = {}
+    for key, (train_data, exog) in prepared.items():
+        cached = cache.load('arima_search', keys[key]) if cache is not None else None
+        if cached is not None:
+            order, params, aic = cached
+            results[key] = (order, ARIMA(train_data, exog=exog, order=order).smooth(params), aic)
+            count('arima_searches_cached')
+            print(f"  {key}: reused cached search (order {order})")
+
+    jobs = [(key, order, train_data, exog)
+            for key, (train_data, exog) in prepared.items() if key not in results
+            for order in PRIORITY_ORDERS]
+
+    with span('arima_order_fits', fits=len(jobs), workers=workers):
+        if workers is None or workers > 1:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_limit_worker_threads) as executor:
+                outcomes = list(executor.map(_fit_order_job, jobs))
+        else:
+            outcomes = [_fit_order_job(job) for job in jobs]
+
+    # Outcomes come back in job order, so the first order with the lowest AIC wins as before
+    best = {}
+    tested = {key: 0 for key in prepared}
+    for key, order, aic, params in outcomes:
+        count('arima_orders_tried')
+        if aic is None:
+            count('arima_orders_failed')
+            continue
+        tested[key] += 1
+        if key not in best or aic < best[key][2]:
+            best[key] = (order, params, aic)
+
+    for key, (train_data, exog) in prepared.items():
+        if key in results:
+            continue
+        if key in best:
+            order, params, aic = best[key]
+            # Re-running the smoother with the winning parameters is cheap and
+            # avoids shipping full result objects back from the workers
+            best_model = ARIMA(train_data, exog=exog, order=order).smooth(params)
+        else:
+            # Fallback to simplest model
+            print(f"  ⚠ Grid search failed for {key}, using ARIMA{FALLBACK_ORDER}")
+            count('arima_fallbacks')
+            order = FALLBACK_ORDER
+            best_model = ARIMA(train_data, exog=exog, order=order).fit()
+            aic = best_model.aic
+        results[key] = (order, best_model, aic)
+        if cache is not None:
+            cache.save('arima_search', keys[key], (order, np.asarray(best_model.params), aic))
+        print(f"  {key}: tested {tested[key]} models")
+
+    return results
+
+def find_best_arima_order(train_data, exog_data=None, workers=1):
     """Find best ARIMA order using simple grid search"""
-    best_aic = float('inf')
-    best_order = None
-    best_model = None
-    
-    # Simple orders that work well in practice
-    priority_orders = [
-        (1, 1, 1),  # Most common
-        (2, 1, 2),
-        (1, 1, 2),
-        (2, 1, 1),
-        (0, 1, 1),
-        (1, 1, 0),
-        (2, 1, 0),
-        (0, 1, 2),
-        (3, 1, 3),
-    ]
-    
-    tested = 0
-    for order in priority_orders:
+    return search_arima_orders({'series': (train_data, exog_data)}, workers=workers)['series']
+
+# Update mode: how many recent one-step-ahead errors judge fit quality, and when to re-search
+QUALITY_WINDOW = 20
+FULL_SEARCH_EVERY_DAYS = 30
+DEGRADE_FACTOR = 1.5
+
+def model_path(variant, market):
+    """Path of the saved model for a variant ('arima' or 'arimax') and market"""
+    return f'models/arima/{variant}_model_{market.replace(" ", "_")}.joblib'
+
+def one_step_mape(fitted_model, actual, log_transform=False, window=QUALITY_WINDOW):
+    """MAPE of the last `window` one-step-ahead in-sample predictions, in price space"""
+    predicted = np.asarray(fitted_model.fittedvalues)[-window:]
+    if log_transform:
+        predicted = np.exp(predicted)
+    return calculate_mape(np.asarray(actual)[-window:], predicted)
+
+def _last_observed_date(saved, index):
+    """Date of the last observation in a saved model (older files don't record it)"""
+    if 'last_date' in saved:
+        return pd.Timestamp(saved['last_date'])
+    row_labels = saved['model'].model.data.row_labels
+    if isinstance(row_labels, pd.DatetimeIndex):
+        return row_labels[-1]
+    return index[int(saved['model'].nobs) - 1]
+
+def save_model(entry, path):
+    """
+    Write a model entry and its compact .npz (see arima_format.py), unless the
+    file already holds one built from the same artifact key.
+    """
+    if entry.get('artifact_key') and os.path.exists(path):
         try:
-            if exog_data is not None:
-                # Ensure exog_data is 2D array
-                if hasattr(exog_data, 'values'):
-                    exog = exog_data.values
-                else:
-                    exog = np.array(exog_data)
-                
-                if exog.ndim == 1:
-                    exog = exog.reshape(-1, 1)
-                
-                model = ARIMA(train_data, exog=exog, order=order)
-            else:
-                model = ARIMA(train_data, order=order)
-            
-            fitted_model = model.fit()
-            tested += 1
-            
-            if fitted_model.aic < best_aic:
-                best_aic = fitted_model.aic
-                best_order = order
-                best_model = fitted_model
+            if load_entry(path).get('artifact_key') == entry['artifact_key']:
+                if not is_current(path):
+                    save_slim(entry, slim_path(path), QUALITY_WINDOW, source=path)
+                return False
         except Exception:
-            continue
-    
-    if best_model is None:
-        # Fallback to simplest model
-        print("  ⚠ Grid search failed, using ARIMA(1,1,1)")
-        if exog_data is not None:
-            exog = exog_data.values if hasattr(exog_data, 'values') else np.array(exog_data)
-            if exog.ndim == 1:
-                exog = exog.reshape(-1, 1)
-            best_model = ARIMA(train_data, exog=exog, order=(1, 1, 1)).fit()
-        else:
-            best_model = ARIMA(train_data, order=(1, 1, 1)).fit()
-        best_order = (1, 1, 1)
-        best_aic = best_model.aic
-    
-    print(f"  Tested {tested} models")
-    return best_order, best_model, best_aic
+            pass
+    with span('save_model', path=path):
+        joblib.dump(entry, path)
+        save_slim(entry, slim_path(path), QUALITY_WINDOW, source=path)
+    return True
+
+def update_models(df, market_columns, workers=None, full_search_every=FULL_SEARCH_EVERY_DAYS,
+                  degrade_factor=DEGRADE_FACTOR, force_search=False, cache=None):
+    """
+    Extend the saved ARIMA/ARIMAX models with observations newer than their last date.
+
+    New observations (and holiday exog) are appended with the existing
+    parameters, which only re-runs the Kalman filter. A full order search on
+    the whole history is run only for series whose last search is older than
+    `full_search_every` days, or whose recent one-step MAPE exceeds
+    `degrade_factor` times the MAPE recorded at the last search.
+    """
+    os.makedirs('models/arima', exist_ok=True)
+    updated = {}
+    needs_search = {}
+
+    for market in market_columns:
+        for variant in ('arima', 'arimax'):
+            path = model_path(variant, market)
+            if not os.path.exists(path):
+                print(f"  ⚠ {path} not found - run a full training first")
+                continue
+
+            start = time.perf_counter()
+            # The full model, not the compact tail of load_entry(): the entry
+            # written back must keep the whole history
+            with span('load_model', path=path):
+                saved = joblib.load(path)
+            model = saved['model']
+            log_transform = (saved.get('transform_params') or {}).get('method') == 'log'
+
+            last_date = _last_observed_date(saved, df.index)
+            last_search = pd.Timestamp(saved.get('last_full_search', last_date))
+            history = df.loc[:last_date, market]
+            baseline_mape = saved.get('baseline_mape')
+            if baseline_mape is None:
+                baseline_mape = one_step_mape(model, history, log_transform)
+
+            new_rows = df.loc[df.index > last_date]
+            if len(new_rows) > 0:
+                new_y = new_rows[market].values
+                if log_transform:
+                    new_y = np.log(new_y)
+                new_exog = new_rows['is_holiday'].values.reshape(-1, 1) if variant == 'arimax' else None
+                with span('append', market=market, model=variant, rows=len(new_rows)):
+                    model = model.append(new_y, exog=new_exog)
 
-def main():
+            recent_mape = one_step_mape(model, df[market], log_transform)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"  {market:20s} {variant.upper():7s} +{len(new_rows)} days in {elapsed:6.1f} ms, "
+                  f"recent MAPE {recent_mape:6.2f}% (baseline {baseline_mape:6.2f}%)")
+
+            entry = {
+                'model': model,
+                'order': saved['order'],
+                'last_date': df.index[-1],
+                'last_full_search': last_search,
+                'baseline_mape': baseline_mape,
+            }
+            if 'transform_params' in saved:
+                entry['transform_params'] = saved['transform_params']
+            updated[(variant, market)] = entry
+
+            reason = None
+            if force_search:
+                reason = 'forced'
+            elif (df.index[-1] - last_search).days >= full_search_every:
+                reason = f'last search {last_search.date()}'
+            elif recent_mape > degrade_factor * baseline_mape:
+                reason = f'MAPE degraded {baseline_mape:.2f}% -> {recent_mape:.2f}%'
+            if reason:
+                y = np.log(df[market]) if log_transform else df[market]
+                exog = df['is_holiday'].values.reshape(-1, 1) if variant == 'arimax' else None
+                needs_search[(variant, market)] = (y, exog)
+                print(f"    → full order search scheduled ({reason})")
+
+    if needs_search:
+        print(f"\nRe-running the order search for {len(needs_search)} series...")
+        with span('order_search', series=len(needs_search)):
+            search_results = search_arima_orders(needs_search, workers=workers, cache=cache)
+        for key, (order, model, aic) in search_results.items():
+            variant, market = key
+            entry = updated[key]
+            log_transform = (entry.get('transform_params') or {}).get('method') == 'log'
+            entry.update({
+                'model': model,
+                'order': order,
+                'last_full_search': df.index[-1],
+                'baseline_mape': one_step_mape(model, df[market], log_transform),
+            })
+            print(f"  {market:20s} {variant.upper():7s} order {order}, AIC {aic:.2f}")
+
+    for (variant, market), entry in updated.items():
+        save_model(entry, model_path(variant, market))
+
+    print(f"\n✓ {len(updated)} models updated to {df.index[-1].date()} in models/arima/")
+    return updated
+
+def main(workers=None, use_cache=True):
     print("="*80)
     print("ARIMA MODEL TRAINING - Chili Price Prediction")
     print("="*80)
+    os.makedirs('models/arima', exist_ok=True)
+    os.makedirs('result/metrics', exist_ok=True)
     print("⚠️  ARIMA is NOT ideal for this high-variance, event-driven data")
     print("    This establishes a baseline - LSTM should outperform significantly")
     print("="*80)
     
     # Load preprocessed data
     print("\nLoading data...")
-    df_with_holidays = pd.read_csv('data/processed/data_with_holidays.csv', index_col=0, parse_dates=True)
+    with span('load_data'):
+        df_with_holidays = load_market_frame()
     print(f"✓ Data loaded: {df_with_holidays.shape}")
     print(f"  Date range: {df_with_holidays.index.min()} to {df_with_holidays.index.max()}")
     
     # Define market columns and train/test split
-    market_columns = ['Pasar Sukaramai', 'Pasar Aksara', 'Pasar Petisah', 'Pusat Pasar', 'Pasar Brayan']
-    TEST_SIZE = 0.2
-    SPLIT_INDEX = int(len(df_with_holidays) * (1 - TEST_SIZE))
+    market_columns = MARKET_COLUMNS
+    SPLIT_INDEX = split_index(len(df_with_holidays))
     
     # Split data
     train_data = df_with_holidays.iloc[:SPLIT_INDEX]
@@ -121,6 +321,22 @@ def main():
     print(f"  Testing: {len(test_data)} samples")
     print(f"  Split ratio: {(1-TEST_SIZE)*100:.0f}/{TEST_SIZE*100:.0f}")
     
+    # Search orders for every (variant, market) at once so the fits share one process pool
+    print(f"\nSearching ARIMA/ARIMAX orders ({len(market_columns) * 2 * len(PRIORITY_ORDERS)} fits, "
+          f"workers={workers or os.cpu_count()})...")
+    search_start = time.perf_counter()
+    cache = ArtifactCache(enabled=use_cache)
+    search_series = {}
+    for market in market_columns:
+        search_series[('arima', market)] = (train_data[market], None)
+        search_series[('arimax', market)] = (train_data[market], train_data['is_holiday'].values.reshape(-1, 1))
+    # The same keys tag the saved models below, so the training data is hashed once
+    artifact_keys = {key: search_key(key, train_y, _as_exog(exog)) for key, (train_y, exog) in search_series.items()}
+    with span('order_search', series=len(search_series)):
+        search_results = search_arima_orders(search_series, workers=workers, cache=cache, keys=artifact_keys)
+    print(f"✓ Order search finished in {time.perf_counter() - search_start:.1f}s ({cache.summary()})")
+    models_written = 0
+
     # Results storage
     arima_results = {}
     
@@ -133,7 +349,6 @@ def main():
         # Prepare data
         train_y = train_data[market]
         test_y = test_data[market]
-        train_holiday = train_data['is_holiday']
         test_holiday = test_data['is_holiday']
         
         # Check for any issues in data
@@ -143,37 +358,35 @@ def main():
         print(f"Coefficient of Variation: {cv:.1f}% (HIGH - not ideal for ARIMA)")
     
         # Check stationarity
-        is_stationary = check_stationarity(train_y, f"Stationarity check for {market}")
+        check_stationarity(train_y, f"Stationarity check for {market}")
     
         # Model 1: ARIMA without exogenous variables
         print(f"\nTraining ARIMA model (without holidays)...")
-        arima_order, arima_model, arima_aic = find_best_arima_order(train_y)
+        arima_order, arima_model, arima_aic = search_results[('arima', market)]
         print(f"✓ Best ARIMA order: {arima_order}, AIC: {arima_aic:.2f}")
     
         # Forecast
-        arima_forecast = arima_model.forecast(steps=len(test_y))
+        with span('forecast', market=market, model='arima'):
+            arima_forecast = arima_model.forecast(steps=len(test_y))
     
         # Model 2: ARIMAX with holidays
         print(f"\nTraining ARIMAX model (with holidays)...")
         
         # Convert holiday to numpy array
-        train_holiday_array = train_holiday.values.reshape(-1, 1)
         test_holiday_array = test_holiday.values.reshape(-1, 1)
         
-        arimax_order, arimax_model, arimax_aic = find_best_arima_order(train_y, train_holiday_array)
+        arimax_order, arimax_model, arimax_aic = search_results[('arimax', market)]
         print(f"✓ Best ARIMAX order: {arimax_order}, AIC: {arimax_aic:.2f}")
     
         # Forecast with exogenous variable
-        arimax_forecast = arimax_model.forecast(steps=len(test_y), exog=test_holiday_array)
+        with span('forecast', market=market, model='arimax'):
+            arimax_forecast = arimax_model.forecast(steps=len(test_y), exog=test_holiday_array)
     
         # Calculate metrics
-        arima_rmse = np.sqrt(mean_squared_error(test_y, arima_forecast))
-        arima_mae = mean_absolute_error(test_y, arima_forecast)
-        arima_mape = calculate_mape(test_y.values, arima_forecast.values if hasattr(arima_forecast, 'values') else arima_forecast)
-    
-        arimax_rmse = np.sqrt(mean_squared_error(test_y, arimax_forecast))
-        arimax_mae = mean_absolute_error(test_y, arimax_forecast)
-        arimax_mape = calculate_mape(test_y.values, arimax_forecast.values if hasattr(arimax_forecast, 'values') else arimax_forecast)
+        metrics = error_metrics(test_y.values, np.stack([np.asarray(arima_forecast), np.asarray(arimax_forecast)]), axis=-1)
+        arima_rmse, arimax_rmse = metrics['rmse']
+        arima_mae, arimax_mae = metrics['mae']
+        arima_mape, arimax_mape = metrics['mape']
     
         # Store results
         arima_results[market] = {
@@ -204,19 +417,27 @@ def main():
         else:
             print(f"  ⚠ ARIMAX degraded by {abs(improvement):.2f}% (holidays may not help ARIMA)")
     
-        # Save models
-        joblib.dump({
+        # Save models (files already built from the same inputs are left untouched)
+        models_written += save_model({
             'model': arima_model,
-            'order': arima_order
-        }, f'models/arima/arima_model_{market.replace(" ", "_")}.joblib')
+            'order': arima_order,
+            'last_date': train_data.index[-1],
+            'last_full_search': train_data.index[-1],
+            'baseline_mape': one_step_mape(arima_model, train_y),
+            'artifact_key': artifact_keys[('arima', market)]
+        }, model_path('arima', market))
         
-        joblib.dump({
+        models_written += save_model({
             'model': arimax_model,
-            'order': arimax_order
-        }, f'models/arima/arimax_model_{market.replace(" ", "_")}.joblib')
+            'order': arimax_order,
+            'last_date': train_data.index[-1],
+            'last_full_search': train_data.index[-1],
+            'baseline_mape': one_step_mape(arimax_model, train_y),
+            'artifact_key': artifact_keys[('arimax', market)]
+        }, model_path('arimax', market))
     
     print("\n" + "="*80)
-    print("✓ All ARIMA models saved to: models/arima/")
+    print(f"✓ All ARIMA models saved to: models/arima/ ({models_written} of {len(artifact_keys)} files changed)")
     print("="*80)
     
     # Summary statistics
@@ -279,13 +500,47 @@ def main():
     }
     
     # Save to pickle for inference
-    joblib.dump(arima_summary, 'result/metrics/arima_summary.pkl')
-    joblib.dump(arimax_summary, 'result/metrics/arimax_summary.pkl')
-    joblib.dump(arima_results, 'result/metrics/arima_detailed_results.pkl')
+    with span('save_results'):
+        joblib.dump(arima_summary, 'result/metrics/arima_summary.pkl')
+        joblib.dump(arimax_summary, 'result/metrics/arimax_summary.pkl')
+        joblib.dump(arima_results, 'result/metrics/arima_detailed_results.pkl')
     
     print('\n✓ Results saved to result/metrics/')
     print('✓ ARIMA training completed successfully!')
     print('\n⚠️  ARIMA serves as BASELINE - expect LSTM to perform 30-50% better!')
 
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Train ARIMA/ARIMAX models')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes for the order search (default: all cores, 1 = sequential)')
+    parser.add_argument('--update', action='store_true',
+                        help='Extend the saved models with new observations instead of retraining')
+    parser.add_argument('--full-search-every', type=int, default=FULL_SEARCH_EVERY_DAYS, metavar='DAYS',
+                        help='In update mode, re-run the order search when the last one is this old')
+    parser.add_argument('--degrade-factor', type=float, default=DEGRADE_FACTOR,
+                        help='In update mode, re-run the order search when recent MAPE exceeds baseline by this factor')
+    parser.add_argument('--force-search', action='store_true',
+                        help='In update mode, re-run the order search for every series')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore cached order searches in models/cache/ and search again (the cache is refreshed)')
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.update:
+        print("="*80)
+        print("ARIMA MODEL UPDATE - Chili Price Prediction")
+        print("="*80)
+        with trace_run('train_arima_update', **trace_options(args)):
+            with span('load_data'):
+                df_with_holidays = load_market_frame()
+            market_columns = MARKET_COLUMNS
+            update_models(df_with_holidays, market_columns, workers=args.workers,
+                          full_search_every=args.full_search_every, degrade_factor=args.degrade_factor,
+                          force_search=args.force_search, cache=ArtifactCache(enabled=not args.no_cache))
+    else:
+        with trace_run('train_arima', **trace_options(args)):
+            main(workers=args.workers, use_cache=not args.no_cache)
+
 if __name__ == "__main__":
-    main()
+    cli()
@@ -3,78 +3,394 @@ LSTM Model Training Script for Chili Price Prediction
 This script trains LSTM models (with and without holiday features) for predicting chili prices
 """
 
-import pandas as pd
 import numpy as np
 import tensorflow as tf
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import LSTM, Dense, Dropout
-from tensorflow.keras.preprocessing.sequence import TimeseriesGenerator
-from sklearn.metrics import mean_squared_error, mean_absolute_error
+from tensorflow.keras.models import Sequential, Model, load_model
+from tensorflow.keras.layers import LSTM, Dense, Dropout, Input, Embedding, RepeatVector, Concatenate
+from tensorflow.keras.callbacks import Callback
+from data_access import MARKET_COLUMNS, split_index, load_market_frame
+from windowing import window_view, window_dataset
+from lstm_runtime import export_model, is_current
+from artifact_cache import ArtifactCache, artifact_key, atomic_open, install_file
+from evaluation import error_metrics
+from instrumentation import add_trace_arguments, count, span, trace_options, trace_run
+import argparse
 import joblib
+import json
 import os
+import shutil
 import sys
+import time
 
-# Ensure directories exist
-os.makedirs('models/lstm', exist_ok=True)
-os.makedirs('result/metrics', exist_ok=True)
+CHECKPOINT_DIR = 'models/lstm/checkpoints'
 
-def calculate_mape(actual, predicted):
-    """Calculate Mean Absolute Percentage Error"""
-    mask = actual != 0
-    if mask.sum() == 0:
-        return np.nan
-    mape = np.mean(np.abs((actual[mask] - predicted[mask]) / actual[mask])) * 100
-    return min(mape, 999.99)
+def build_lstm_model(look_back, n_features, units=(64, 32), dropout=0.2):
+    """Two-layer ReLU LSTM that predicts the next row of all features"""
+    model = Sequential([
+        LSTM(units[0], activation='relu', input_shape=(look_back, n_features), return_sequences=True),
+        Dropout(dropout),
+        LSTM(units[1], activation='relu'),
+        Dropout(dropout),
+        Dense(n_features)
+    ])
+    
+    model.compile(optimizer='adam', loss='mse', metrics=['mae'])
+    return model
+
+class TrainingBudget(Callback):
+    """
+    Early stopping on validation loss with periodic, resumable checkpoints.
+
+    Every `checkpoint_every` epochs the latest weights (with the optimizer
+    state) and the early-stopping state are written to `checkpoint_dir`; the best
+    weights are written whenever val_loss improves. Training stops once
+    val_loss has not improved by `min_delta` for `patience` epochs, and the
+    best weights are restored at the end. With resume=True, a matching
+    checkpoint (same `signature`) is loaded first and training continues
+    from the epoch after it.
+    """
+
+    def __init__(self, checkpoint_dir, patience=8, min_delta=0.0, checkpoint_every=1,
+                 resume=False, signature=None):
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.patience = patience
+        self.min_delta = min_delta
+        self.checkpoint_every = checkpoint_every
+        self.signature = signature or {}
+        self.state = {'epoch': -1, 'best_loss': np.inf, 'best_epoch': -1, 'wait': 0}
+        self.resumed = resume and self._load_state()
+
+    def _path(self, name):
+        return os.path.join(self.checkpoint_dir, name)
+
+    def _load_state(self):
+        try:
+            with open(self._path('state.json')) as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if saved.get('signature') != self.signature or not os.path.exists(self._path('last.weights.h5')):
+            print(f"  ⚠ Checkpoint in {self.checkpoint_dir} does not match this run, starting fresh")
+            return False
+        self.state = saved['state']
+        return True
+
+    @property
+    def initial_epoch(self):
+        return self.state['epoch'] + 1
+
+    def on_train_begin(self, logs=None):
+        if not self.resumed:
+            return
+        # The weights file also holds the optimizer state, which loads only into a built optimizer
+        if not self.model.optimizer.built:
+            self.model.optimizer.build(self.model.trainable_variables)
+        self.model.load_weights(self._path('last.weights.h5'))
+        print(f"  ✓ Resumed from epoch {self.initial_epoch} "
+              f"(best val_loss {self.state['best_loss']:.5f} at epoch {self.state['best_epoch'] + 1})")
+
+    def on_epoch_end(self, epoch, logs=None):
+        loss = logs['val_loss']
+        self.state['epoch'] = epoch
+        if loss < self.state['best_loss'] - self.min_delta:
+            self.state.update(best_loss=float(loss), best_epoch=epoch, wait=0)
+            self.model.save_weights(self._path('best.weights.h5'))
+        else:
+            self.state['wait'] += 1
+
+        stop = self.state['wait'] >= self.patience
+        if stop or (epoch + 1) % self.checkpoint_every == 0:
+            self._save_checkpoint()
+        if stop:
+            self.model.stop_training = True
+
+    def _save_checkpoint(self):
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        self.model.save_weights(self._path('last.weights.h5'))
+        with atomic_open(self._path('state.json'), 'w') as f:
+            json.dump({'signature': self.signature, 'state': self.state}, f, indent=2)
+
+    def on_train_end(self, logs=None):
+        if os.path.exists(self._path('best.weights.h5')):
+            self.model.load_weights(self._path('best.weights.h5'))
+
+def fit_with_budget(model, train_dataset, val_dataset, name, max_epochs=50, patience=8,
+                    checkpoint_every=1, resume=False, signature=None, checkpoint_dir=CHECKPOINT_DIR):
+    """
+    Fit with early stopping on a chronological validation slice and resumable
+    checkpoints. Returns the model with its best weights and a summary dict;
+    the checkpoint directory is removed once training finishes.
+    """
+    budget = TrainingBudget(os.path.join(checkpoint_dir, name), patience=patience,
+                            checkpoint_every=checkpoint_every, resume=resume, signature=signature)
+    if not budget.resumed:
+        shutil.rmtree(budget.checkpoint_dir, ignore_errors=True)
+        os.makedirs(budget.checkpoint_dir, exist_ok=True)
+
+    start = time.perf_counter()
+    initial_epoch = budget.initial_epoch
+    with span('model.fit', model=name, initial_epoch=initial_epoch):
+        history = model.fit(
+            train_dataset,
+            epochs=max_epochs,
+            initial_epoch=initial_epoch,
+            verbose=2,
+            validation_data=val_dataset,
+            callbacks=[budget]
+        )
+    count('lstm_epochs', budget.initial_epoch - initial_epoch)
+    summary = {
+        'epochs_run': budget.state['epoch'] + 1,
+        'best_epoch': budget.state['best_epoch'] + 1,
+        'best_val_loss': budget.state['best_loss'],
+        'stopped_early': budget.state['epoch'] + 1 < max_epochs,
+        'fit_seconds': time.perf_counter() - start,
+        'history': history.history,
+    }
+    shutil.rmtree(budget.checkpoint_dir, ignore_errors=True)
+    print(f"✓ {summary['epochs_run']} of {max_epochs} epochs"
+          f"{' (stopped early)' if summary['stopped_early'] else ''}, "
+          f"best val_loss {summary['best_val_loss']:.5f} at epoch {summary['best_epoch']}, "
+          f"{summary['fit_seconds']:.1f}s")
+    return model, summary
+
+def train_cached(cache, key, h5_path, train):
+    """
+    Install the cached model and training summary for `key` at h5_path, or run
+    train() (which returns (model, summary)), save the model and cache both.
+    """
+    summary = cache.load('lstm_training', key)
+    cached_h5 = cache.file_path('lstm_model', key, '.h5')
+    if summary is not None and os.path.exists(cached_h5):
+        install_file(cached_h5, h5_path)
+        count('lstm_models_cached')
+        print(f"✓ Inputs unchanged - reusing cached model {key} "
+              f"({summary['epochs_run']} epochs, best val_loss {summary['best_val_loss']:.5f})")
+        return load_model(h5_path, compile=False), summary
+
+    model, summary = train()
+    with span('model.save', path=h5_path):
+        model.save(h5_path)
+    cache.save_file('lstm_model', key, h5_path, '.h5')
+    cache.save('lstm_training', key, summary)
+    return model, summary
+
+def recursive_forecast(model, window, horizon, holiday_column=None, future_holidays=None):
+    """
+    Forecast `horizon` steps by feeding each prediction back into the window.
+
+    `window` is a scaled (look_back, n_features) array. When the model has a
+    holiday feature, its predicted value is replaced by the known (scaled)
+    future flag in `future_holidays` before the row is fed back.
+    """
+    window = np.asarray(window, dtype=np.float32).copy()
+    predictions = np.empty((horizon, window.shape[1]), dtype=np.float32)
+    for step in range(horizon):
+        pred = np.array(model(window[np.newaxis], training=False))[0]
+        if holiday_column is not None:
+            pred[holiday_column] = 0.0 if future_holidays is None else future_holidays[step]
+        predictions[step] = pred
+        window = np.vstack([window[1:], pred])
+    return predictions
+
+def build_global_lstm_model(look_back, n_series, n_features=2, embedding_dim=8):
+    """
+    One LSTM shared by every series: the input window (scaled price and
+    holiday flag) is concatenated at each step with a learned embedding of the
+    series id, and the head predicts the next scaled price of that series only
+    """
+    window_input = Input(shape=(look_back, n_features), name='window')
+    series_input = Input(shape=(), dtype='int32', name='series_id')
+
+    embedding = Embedding(n_series, embedding_dim, name='series_embedding')(series_input)
+    embedding = RepeatVector(look_back)(embedding)
+    x = Concatenate(axis=-1)([window_input, embedding])
+    x = LSTM(64, activation='relu', return_sequences=True)(x)
+    x = Dropout(0.2)(x)
+    x = LSTM(32, activation='relu')(x)
+    x = Dropout(0.2)(x)
+    output = Dense(1)(x)
+
+    model = Model(inputs=[window_input, series_input], outputs=output)
+    model.compile(optimizer='adam', loss='mse', metrics=['mae'])
+    return model
+
+def stack_series_windows(scaled_prices, holidays, look_back):
+    """
+    Stack the look-back windows of every series into one training set.
+
+    `scaled_prices` is (time, n_series); each series contributes the same
+    windows as window_view on its [price, holiday] columns. Returns windows
+    (n_series * n_windows, look_back, 2), targets (n,) and series ids (n,).
+    """
+    n_time, n_series = scaled_prices.shape
+    features = np.stack([scaled_prices.T, np.broadcast_to(holidays, (n_series, n_time))], axis=-1)
+    windows = np.lib.stride_tricks.sliding_window_view(features, look_back, axis=1)[:, :-1]
+    # (series, n_windows, features, look_back) -> (series * n_windows, look_back, features)
+    n_windows = windows.shape[1]
+    windows = windows.transpose(0, 1, 3, 2).reshape(n_series * n_windows, look_back, 2).astype(np.float32)
+    targets = scaled_prices[look_back:].T.reshape(-1).astype(np.float32)
+    series_ids = np.repeat(np.arange(n_series, dtype=np.int32), n_windows)
+    return windows, targets, series_ids
+
+def train_global_model(epochs=50, batch_size=256, look_back=30):
+    """Train one global LSTM across every series in the raw export"""
+    from ingest import load_all_series
+
+    print("="*80)
+    print("GLOBAL LSTM TRAINING - All series, one shared model")
+    print("="*80)
+    os.makedirs('models/lstm', exist_ok=True)
+    os.makedirs('result/metrics', exist_ok=True)
+
+    with span('load_data'):
+        df_with_holidays = load_market_frame()
+        series = load_all_series(index=df_with_holidays.index)
+    holidays = df_with_holidays['is_holiday'].to_numpy()
+    series_names = list(series.columns)
+    SPLIT_INDEX = split_index(len(series))
 
-def main():
+    print(f"✓ Data loaded: {len(series)} days x {len(series_names)} series")
+    print(f"  Series: {', '.join(series_names)}")
+
+    # Per-series min-max scaling fitted on the training rows only
+    prices = series.to_numpy()
+    series_min = prices[:SPLIT_INDEX].min(axis=0)
+    series_range = np.maximum(prices[:SPLIT_INDEX].max(axis=0) - series_min, 1e-9)
+    scaled = (prices - series_min) / series_range
+
+    with span('windows'):
+        train_windows, train_targets, train_ids = stack_series_windows(
+            scaled[:SPLIT_INDEX], holidays[:SPLIT_INDEX], look_back)
+        test_windows, test_targets, test_ids = stack_series_windows(
+            scaled[SPLIT_INDEX:], holidays[SPLIT_INDEX:], look_back)
+    print(f"  Training windows: {len(train_windows)}, test windows: {len(test_windows)}")
+
+    model = build_global_lstm_model(look_back, len(series_names))
+    start = time.perf_counter()
+    with span('model.fit', model='lstm_global_model', epochs=epochs):
+        model.fit({'window': train_windows, 'series_id': train_ids}, train_targets,
+                  epochs=epochs, batch_size=batch_size, verbose=2)
+    print(f"✓ Trained in {time.perf_counter() - start:.1f}s")
+
+    with span('predict', model='lstm_global_model'):
+        predictions = np.asarray(model.predict_on_batch({'window': test_windows, 'series_id': test_ids}))[:, 0]
+    predicted_prices = predictions * series_range[test_ids] + series_min[test_ids]
+
+    print("\n" + "="*50)
+    print("Global LSTM - Metrics by Series:")
+    print("="*50)
+    n_windows = len(test_windows) // len(series_names)
+    results = {'series': series_names,
+               'predictions': predicted_prices.reshape(len(series_names), n_windows).T,
+               'actual': prices[SPLIT_INDEX + look_back:],
+               'test_dates': series.index[SPLIT_INDEX + look_back:]}
+    metrics = error_metrics(results['actual'], results['predictions'])
+    results.update({name: list(values) for name, values in metrics.items()})
+    for name, rmse, mae, mape in zip(series_names, metrics['rmse'], metrics['mae'], metrics['mape']):
+        print(f"{name:25s}: RMSE={rmse:8.2f}, MAE={mae:8.2f}, MAPE={mape:6.2f}%")
+
+    with span('save_results'):
+        model.save('models/lstm/lstm_global_model.h5')
+        joblib.dump({
+            'series': series_names,
+            'series_min': series_min,
+            'series_range': series_range,
+            'look_back': look_back,
+        }, 'models/lstm/lstm_global_meta.joblib')
+        joblib.dump(results, 'result/metrics/lstm_global_results.pkl')
+    print("\n✓ Model saved to: models/lstm/lstm_global_model.h5 (+ lstm_global_meta.joblib)")
+    print("✓ Results saved to: result/metrics/lstm_global_results.pkl")
+    return results
+
+def predict_windows(model, windows):
+    """Score all windows in a single batched call instead of one call per generator batch"""
+    return np.asarray(model.predict_on_batch(windows))
+
+def main(batch_size=16, max_epochs=50, patience=8, val_size=0.15, checkpoint_every=1, resume=False,
+         look_back=30, units=(64, 32), dropout=0.2, use_cache=True):
     print("="*80)
     print("LSTM MODEL TRAINING - Chili Price Prediction")
     print("="*80)
+    os.makedirs('models/lstm', exist_ok=True)
+    os.makedirs('result/metrics', exist_ok=True)
     
     # Load preprocessed data
     print("\nLoading data...")
-    df_with_holidays = pd.read_csv('data/processed/data_with_holidays.csv', index_col=0, parse_dates=True)
+    with span('load_data'):
+        df_with_holidays = load_market_frame()
     print(f"✓ Data loaded: {df_with_holidays.shape}")
     print(f"  Date range: {df_with_holidays.index.min()} to {df_with_holidays.index.max()}")
     
     # Define parameters
-    market_columns = ['Pasar Sukaramai', 'Pasar Aksara', 'Pasar Petisah', 'Pusat Pasar', 'Pasar Brayan']
-    TEST_SIZE = 0.2
-    LOOK_BACK = 30  # Use 30 days of history
-    SPLIT_INDEX = int(len(df_with_holidays) * (1 - TEST_SIZE))
-    EPOCHS = 50
-    BATCH_SIZE = 16
+    market_columns = MARKET_COLUMNS
+    LOOK_BACK = look_back  # Days of history per window (30 unless tuned)
+    SPLIT_INDEX = split_index(len(df_with_holidays))
+    EPOCHS = max_epochs
+    BATCH_SIZE = batch_size
     
     print(f"\nModel Parameters:")
     print(f"  Markets: {len(market_columns)}")
     print(f"  Look-back window: {LOOK_BACK} days")
-    print(f"  Epochs: {EPOCHS}")
+    print(f"  LSTM units: {units[0]}/{units[1]}, dropout: {dropout}")
+    print(f"  Max epochs: {EPOCHS} (early stopping patience {patience})")
     print(f"  Batch size: {BATCH_SIZE}")
     
     # Split data chronologically
     train_data = df_with_holidays.iloc[:SPLIT_INDEX]
     test_data = df_with_holidays.iloc[SPLIT_INDEX:]
     
+    # The last val_size of the training rows is held out for early stopping,
+    # so the test set is never seen during training
+    FIT_ROWS = len(train_data) - int(len(train_data) * val_size)
+    if FIT_ROWS <= LOOK_BACK or FIT_ROWS >= len(train_data):
+        raise ValueError(f"val_size={val_size} leaves no training or validation windows")
+    
     print(f"\nData Split:")
-    print(f"  Training: {train_data.shape[0]} days ({train_data.index[0]} to {train_data.index[-1]})")
+    print(f"  Training: {FIT_ROWS} days ({train_data.index[0]} to {train_data.index[FIT_ROWS - 1]})")
+    print(f"  Validation: {len(train_data) - FIT_ROWS} days ({train_data.index[FIT_ROWS]} to {train_data.index[-1]})")
     print(f"  Testing: {test_data.shape[0]} days ({test_data.index[0]} to {test_data.index[-1]})")
     
     # Load the scalers created in data preprocessing
     print("\nLoading scalers...")
-    scaler_markets = joblib.load('data/scalers/scaler_markets.joblib')
-    scaler_with_features = joblib.load('data/scalers/scaler_with_features.joblib')
+    with span('load_scalers'):
+        scaler_markets = joblib.load('data/scalers/scaler_markets.joblib')
+        scaler_with_features = joblib.load('data/scalers/scaler_with_features.joblib')
     print("✓ Scalers loaded successfully")
     
     # Scale the data
     print("\nScaling data...")
-    train_markets_scaled = scaler_markets.transform(train_data[market_columns])
-    test_markets_scaled = scaler_markets.transform(test_data[market_columns])
-    
     feature_columns = market_columns + ['is_holiday']
-    train_features_scaled = scaler_with_features.transform(train_data[feature_columns])
-    test_features_scaled = scaler_with_features.transform(test_data[feature_columns])
+    with span('scaler.transform'):
+        train_features_scaled = scaler_with_features.transform(train_data[feature_columns])
+        test_features_scaled = scaler_with_features.transform(test_data[feature_columns])
+        
+        # Both scalers were fit on the same market columns, so the markets-only
+        # data is a column view of the feature data and both variants share it
+        n_markets = len(market_columns)
+        if (np.array_equal(scaler_markets.scale_, scaler_with_features.scale_[:n_markets])
+                and np.array_equal(scaler_markets.min_, scaler_with_features.min_[:n_markets])):
+            train_markets_scaled = train_features_scaled[:, :n_markets]
+            test_markets_scaled = test_features_scaled[:, :n_markets]
+        else:
+            train_markets_scaled = scaler_markets.transform(train_data[market_columns])
+            test_markets_scaled = scaler_markets.transform(test_data[market_columns])
     print("✓ Data scaled successfully")
     
+    # A variant is retrained only when its training data or settings changed
+    cache = ArtifactCache(enabled=use_cache)
+    settings = {'look_back': LOOK_BACK, 'units': list(units), 'dropout': dropout, 'batch_size': BATCH_SIZE,
+                'max_epochs': EPOCHS, 'patience': patience, 'val_size': val_size}
+    packages = ('numpy', 'tensorflow', 'keras')
+    
+    # Only the model inputs are float32 (window_dataset casts the training data);
+    # evaluation windows are strided views of a float32 copy of the test data
+    test_windows_wh, _ = window_view(test_features_scaled.astype(np.float32), LOOK_BACK)
+    test_windows_nh, _ = window_view(test_markets_scaled.astype(np.float32), LOOK_BACK)
+    # Actual prices come straight from the data, not from inverse-transforming scaled values
+    test_prices = test_data[market_columns].to_numpy()
+    
     # ===========================
     # Model 1: LSTM without holidays
     # ===========================
@@ -83,85 +399,59 @@ def main():
     print("="*70)
     
     data_no_holiday = train_markets_scaled
-    test_data_nh = test_markets_scaled
     n_features_nh = data_no_holiday.shape[1]
     
-    # Create time series generators
-    train_generator_nh = TimeseriesGenerator(
-        data_no_holiday, 
-        data_no_holiday,
-        length=LOOK_BACK,
-        batch_size=BATCH_SIZE
-    )
-    
-    test_generator_nh = TimeseriesGenerator(
-        test_data_nh,
-        test_data_nh,
-        length=LOOK_BACK,
-        batch_size=BATCH_SIZE
-    )
+    # Cached, prefetching input pipelines (batches are gathered in-graph once);
+    # validation windows take their look-back rows from the end of the fit slice
+    with span('window_dataset'):
+        train_dataset_nh = window_dataset(data_no_holiday[:FIT_ROWS], LOOK_BACK, BATCH_SIZE)
+        val_dataset_nh = window_dataset(data_no_holiday[FIT_ROWS - LOOK_BACK:], LOOK_BACK, BATCH_SIZE)
     
     # Build LSTM model
-    lstm_model = Sequential([
-        LSTM(64, activation='relu', input_shape=(LOOK_BACK, n_features_nh), return_sequences=True),
-        Dropout(0.2),
-        LSTM(32, activation='relu'),
-        Dropout(0.2),
-        Dense(n_features_nh)
-    ])
-    
-    lstm_model.compile(optimizer='adam', loss='mse', metrics=['mae'])
+    lstm_model = build_lstm_model(LOOK_BACK, n_features_nh, units, dropout)
     print("\nModel architecture created")
     
     # Train the model
     print("Training model...")
-    history = lstm_model.fit(
-        train_generator_nh,
-        epochs=EPOCHS,
-        verbose=2,
-        validation_data=test_generator_nh
-    )
+    signature = {'look_back': LOOK_BACK, 'batch_size': BATCH_SIZE, 'fit_rows': FIT_ROWS,
+                 'train_end': str(train_data.index[-1].date())}
+    key_nh = artifact_key('lstm', {**settings, 'variant': 'lstm_model_all_markets'},
+                          data=(data_no_holiday,), packages=packages)
+    lstm_model, training_nh = train_cached(
+        cache, key_nh, 'models/lstm/lstm_model_all_markets.h5',
+        lambda: fit_with_budget(
+            lstm_model, train_dataset_nh, val_dataset_nh, 'lstm_model_all_markets',
+            max_epochs=EPOCHS, patience=patience, checkpoint_every=checkpoint_every,
+            resume=resume, signature={**signature, 'n_features': n_features_nh}))
     
     # Make predictions
     print("\nMaking predictions...")
-    lstm_predictions = []
-    for i in range(len(test_generator_nh)):
-        X, _ = test_generator_nh[i]
-        pred = lstm_model.predict(X, verbose=0)
-        lstm_predictions.extend(pred)
-    
-    lstm_predictions = np.array(lstm_predictions)
+    with span('predict', model='lstm_model_all_markets'):
+        lstm_predictions = predict_windows(lstm_model, test_windows_nh)
     
     # Inverse transform
     lstm_pred = scaler_markets.inverse_transform(lstm_predictions)
-    actual_test_nh = test_data_nh[LOOK_BACK:LOOK_BACK + len(lstm_pred)]
-    y_test = scaler_markets.inverse_transform(actual_test_nh)
+    y_test = test_prices[LOOK_BACK:LOOK_BACK + len(lstm_pred)]
     
     # Calculate metrics
     print("\n" + "="*50)
     print("LSTM (no holidays) - Metrics by Market:")
     print("="*50)
-    lstm_rmse_list = []
-    lstm_mae_list = []
-    lstm_mape_list = []
-    
-    for idx, market in enumerate(market_columns):
-        rmse = np.sqrt(mean_squared_error(y_test[:, idx], lstm_pred[:, idx]))
-        mae = mean_absolute_error(y_test[:, idx], lstm_pred[:, idx])
-        mape = calculate_mape(y_test[:, idx], lstm_pred[:, idx])
-        
-        lstm_rmse_list.append(rmse)
-        lstm_mae_list.append(mae)
-        lstm_mape_list.append(mape)
-        
+    metrics = error_metrics(y_test, lstm_pred)
+    lstm_rmse_list = list(metrics['rmse'])
+    lstm_mae_list = list(metrics['mae'])
+    lstm_mape_list = list(metrics['mape'])
+    
+    for market, rmse, mae, mape in zip(market_columns, lstm_rmse_list, lstm_mae_list, lstm_mape_list):
         print(f"{market:25s}: RMSE={rmse:8.2f}, MAE={mae:8.2f}, MAPE={mape:6.2f}%")
     
     avg_lstm = np.mean(lstm_rmse_list)
     print(f"\nAverage RMSE: {avg_lstm:.2f}")
     
-    # Save the model
-    lstm_model.save('models/lstm/lstm_model_all_markets.h5')
-    print("✓ Model saved to: models/lstm/lstm_model_all_markets.h5")
+    # The model file was written (or reinstalled from the cache) above; export only when it changed
+    if not is_current('models/lstm/lstm_model_all_markets.h5'):
+        export_model('models/lstm/lstm_model_all_markets.h5')
+    print("✓ Model saved to: models/lstm/lstm_model_all_markets.h5 (+ .npz for the NumPy runtime)")
     
     # ===========================
     # Model 2: LSTM with holidays
@@ -171,88 +461,58 @@ def main():
     print("="*70)
     
     data_with_holiday = train_features_scaled
-    test_data_wh = test_features_scaled
     n_features_wh = data_with_holiday.shape[1]
     
-    # Create time series generators
-    train_generator_wh = TimeseriesGenerator(
-        data_with_holiday,
-        data_with_holiday,
-        length=LOOK_BACK,
-        batch_size=BATCH_SIZE
-    )
-    
-    test_generator_wh = TimeseriesGenerator(
-        test_data_wh,
-        test_data_wh,
-        length=LOOK_BACK,
-        batch_size=BATCH_SIZE
-    )
+    # Cached, prefetching input pipelines (batches are gathered in-graph once)
+    with span('window_dataset'):
+        train_dataset_wh = window_dataset(data_with_holiday[:FIT_ROWS], LOOK_BACK, BATCH_SIZE)
+        val_dataset_wh = window_dataset(data_with_holiday[FIT_ROWS - LOOK_BACK:], LOOK_BACK, BATCH_SIZE)
     
     # Build LSTM model with holiday
-    lstm_holiday_model = Sequential([
-        LSTM(64, activation='relu', input_shape=(LOOK_BACK, n_features_wh), return_sequences=True),
-        Dropout(0.2),
-        LSTM(32, activation='relu'),
-        Dropout(0.2),
-        Dense(n_features_wh)
-    ])
-    
-    lstm_holiday_model.compile(optimizer='adam', loss='mse', metrics=['mae'])
+    lstm_holiday_model = build_lstm_model(LOOK_BACK, n_features_wh, units, dropout)
     print("\nModel architecture created")
     
     # Train the model
     print("Training model...")
-    history_h = lstm_holiday_model.fit(
-        train_generator_wh,
-        epochs=EPOCHS,
-        verbose=2,
-        validation_data=test_generator_wh
-    )
+    key_wh = artifact_key('lstm', {**settings, 'variant': 'lstm_holiday_model_all_markets'},
+                          data=(data_with_holiday,), packages=packages)
+    lstm_holiday_model, training_wh = train_cached(
+        cache, key_wh, 'models/lstm/lstm_holiday_model_all_markets.h5',
+        lambda: fit_with_budget(
+            lstm_holiday_model, train_dataset_wh, val_dataset_wh, 'lstm_holiday_model_all_markets',
+            max_epochs=EPOCHS, patience=patience, checkpoint_every=checkpoint_every,
+            resume=resume, signature={**signature, 'n_features': n_features_wh}))
     
     # Make predictions
     print("\nMaking predictions...")
-    lstm_holiday_predictions = []
-    for i in range(len(test_generator_wh)):
-        X, _ = test_generator_wh[i]
-        pred = lstm_holiday_model.predict(X, verbose=0)
-        lstm_holiday_predictions.extend(pred)
-    
-    lstm_holiday_predictions = np.array(lstm_holiday_predictions)
+    with span('predict', model='lstm_holiday_model_all_markets'):
+        lstm_holiday_predictions = predict_windows(lstm_holiday_model, test_windows_wh)
     
     # Inverse transform - only take the first 5 columns (markets)
     lstm_holiday_pred_all = scaler_with_features.inverse_transform(lstm_holiday_predictions)
     lstm_holiday_pred = lstm_holiday_pred_all[:, :5]
     
-    actual_test_wh = test_data_wh[LOOK_BACK:LOOK_BACK + len(lstm_holiday_pred)]
-    y_test_h_all = scaler_with_features.inverse_transform(actual_test_wh)
-    y_test_h = y_test_h_all[:, :5]
+    y_test_h = test_prices[LOOK_BACK:LOOK_BACK + len(lstm_holiday_pred)]
     
     # Calculate metrics
     print("\n" + "="*50)
     print("LSTM (with holidays) - Metrics by Market:")
     print("="*50)
-    lstm_h_rmse_list = []
-    lstm_h_mae_list = []
-    lstm_h_mape_list = []
-    
-    for idx, market in enumerate(market_columns):
-        rmse = np.sqrt(mean_squared_error(y_test_h[:, idx], lstm_holiday_pred[:, idx]))
-        mae = mean_absolute_error(y_test_h[:, idx], lstm_holiday_pred[:, idx])
-        mape = calculate_mape(y_test_h[:, idx], lstm_holiday_pred[:, idx])
-        
-        lstm_h_rmse_list.append(rmse)
-        lstm_h_mae_list.append(mae)
-        lstm_h_mape_list.append(mape)
-        
+    metrics = error_metrics(y_test_h, lstm_holiday_pred)
+    lstm_h_rmse_list = list(metrics['rmse'])
+    lstm_h_mae_list = list(metrics['mae'])
+    lstm_h_mape_list = list(metrics['mape'])
+    
+    for market, rmse, mae, mape in zip(market_columns, lstm_h_rmse_list, lstm_h_mae_list, lstm_h_mape_list):
         print(f"{market:25s}: RMSE={rmse:8.2f}, MAE={mae:8.2f}, MAPE={mape:6.2f}%")
     
     avg_lstm_h = np.mean(lstm_h_rmse_list)
     print(f"\nAverage RMSE: {avg_lstm_h:.2f}")
     
-    # Save the model
-    lstm_holiday_model.save('models/lstm/lstm_holiday_model_all_markets.h5')
-    print("✓ Model saved to: models/lstm/lstm_holiday_model_all_markets.h5")
+    # The model file was written (or reinstalled from the cache) above; export only when it changed
+    if not is_current('models/lstm/lstm_holiday_model_all_markets.h5'):
+        export_model('models/lstm/lstm_holiday_model_all_markets.h5')
+    print("✓ Model saved to: models/lstm/lstm_holiday_model_all_markets.h5 (+ .npz for the NumPy runtime)")
     
     # Store results
     lstm_results = {
@@ -260,6 +520,7 @@ def main():
         'predictions_with_holiday': lstm_holiday_pred,
         'actual': y_test,
         'test_dates': test_data.index[LOOK_BACK:LOOK_BACK + len(lstm_pred)],
+        'look_back': LOOK_BACK,
         'rmse_no_holiday': lstm_rmse_list,
         'mae_no_holiday': lstm_mae_list,
         'mape_no_holiday': lstm_mape_list,
@@ -267,7 +528,9 @@ def main():
         'mae_with_holiday': lstm_h_mae_list,
         'mape_with_holiday': lstm_h_mape_list,
         'avg_rmse_no_holiday': avg_lstm,
-        'avg_rmse_with_holiday': avg_lstm_h
+        'avg_rmse_with_holiday': avg_lstm_h,
+        'training_no_holiday': training_nh,
+        'training_with_holiday': training_wh
     }
     
     # Final summary
@@ -304,11 +567,53 @@ def main():
         'results': lstm_results
     }
     
-    joblib.dump(lstm_summary, 'result/metrics/lstm_summary.pkl')
-    joblib.dump(lstm_results, 'result/metrics/lstm_detailed_results.pkl')
+    with span('save_results'):
+        joblib.dump(lstm_summary, 'result/metrics/lstm_summary.pkl')
+        joblib.dump(lstm_results, 'result/metrics/lstm_detailed_results.pkl')
     
-    print('\n✓ Results saved to result/metrics/')
+    print(f'\n✓ Model cache: {cache.summary()}')
+    print('✓ Results saved to result/metrics/')
     print('✓ LSTM training completed successfully!')
 
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Train LSTM models')
+    parser.add_argument('--global', dest='global_model', action='store_true',
+                        help='Train one global model over every series in the raw export')
+    parser.add_argument('--epochs', type=int, default=50,
+                        help='Maximum epochs (the per-market models stop early when validation loss stalls)')
+    parser.add_argument('--patience', type=int, default=8,
+                        help='Epochs without validation improvement before stopping')
+    parser.add_argument('--val-size', type=float, default=0.15,
+                        help='Share of the training rows held out (chronologically last) for early stopping')
+    parser.add_argument('--checkpoint-every', type=int, default=1, metavar='N',
+                        help=f'Write a resumable checkpoint to {CHECKPOINT_DIR} every N epochs')
+    parser.add_argument('--resume', action='store_true',
+                        help='Continue an interrupted run from its last checkpoint')
+    parser.add_argument('--batch-size', type=int, default=None,
+                        help='Training batch size (default: 16, or 256 for the global model)')
+    parser.add_argument('--config', metavar='PATH',
+                        help='JSON hyperparameters from tune_lstm.py (look_back, units, dropout, batch_size)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Retrain even when models/cache/ holds a model built from the same inputs')
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    tuned = {}
+    if args.config:
+        with open(args.config) as f:
+            tuned = json.load(f)
+
+    if args.global_model:
+        with trace_run('train_lstm_global', **trace_options(args)):
+            train_global_model(epochs=args.epochs, batch_size=args.batch_size or 256)
+    else:
+        with trace_run('train_lstm', **trace_options(args)):
+            main(batch_size=args.batch_size or tuned.get('batch_size', 16), max_epochs=args.epochs,
+                 patience=args.patience, val_size=args.val_size, checkpoint_every=args.checkpoint_every,
+                 resume=args.resume, look_back=tuned.get('look_back', 30),
+                 units=tuple(tuned.get('units', (64, 32))), dropout=tuned.get('dropout', 0.2),
+                 use_cache=not args.no_cache)
+
 if __name__ == "__main__":
-    main()
+    cli()
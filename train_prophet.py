@@ -0,0 +1,252 @@
+"""
+Prophet Model Training Script for Chili Price Prediction
+This script trains the baseline, optimized and holiday Prophet models for every
+market in a process pool, reusing cached fits whose training data is unchanged
+"""
+
+import pandas as pd
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from data_access import MARKET_COLUMNS, TEST_SIZE, split_index, load_market_frame
+from artifact_cache import ArtifactCache, artifact_key, install_file
+from evaluation import error_metrics
+from calendar_features import HOLIDAY_PERIODS
+import argparse
+import joblib
+import logging
+import os
+import time
+
+PROPHET_DIR = 'models/prophet'
+RESULTS_PATH = 'result/metrics/prophet_detailed_results.pkl'
+SUMMARY_PATH = 'result/metrics/prophet_summary.pkl'
+REGRESSORS = ('lag_7', 'lag_14', 'ma_7', 'ma_30')
+
+# Variant -> (model file prefix, prediction key, metric prefix), as in notebook 04
+VARIANTS = {
+    'baseline': ('prophet_baseline', 'prophet_baseline_pred', 'prophet_baseline'),
+    'optimized': ('prophet_model', 'prophet_pred', 'prophet'),
+    'holiday': ('prophet_holiday_model', 'prophet_holiday_pred', 'prophet_h'),
+}
+
+BASELINE_PARAMS = {
+    'yearly_seasonality': True,
+    'weekly_seasonality': True,
+    'daily_seasonality': False,
+    'changepoint_prior_scale': 0.05,
+}
+# Tuned for the volatile prices (see IMPROVED_PROPHET.md)
+OPTIMIZED_PARAMS = {
+    'yearly_seasonality': True,
+    'weekly_seasonality': True,
+    'daily_seasonality': False,
+    'seasonality_mode': 'multiplicative',
+    'changepoint_prior_scale': 0.15,
+    'seasonality_prior_scale': 15.0,
+    'n_changepoints': 30,
+    'changepoint_range': 0.9,
+}
+MONTHLY_SEASONALITY = {'name': 'monthly', 'period': 30.5, 'fourier_order': 5}
+
+def holiday_frame():
+    """Prophet holidays DataFrame (holiday, ds) with one row per holiday day"""
+    frames = [pd.DataFrame({'holiday': name, 'ds': pd.date_range(start, end, freq='D')})
+              for name, start, end in HOLIDAY_PERIODS]
+    return pd.concat(frames, ignore_index=True)
+
+def model_path(variant, market):
+    return os.path.join(PROPHET_DIR, f'{VARIANTS[variant][0]}_{market.replace(" ", "_")}.joblib')
+
+def prophet_frames(prices, split):
+    """
+    Train and test frames (ds, y and the lag/moving-average regressors) of one market.
+
+    Lags and moving averages only look back, so computing them over the whole
+    series gives the training rows the same values as computing them over the
+    training data alone. The first lag rows are filled with the training mean.
+    """
+    frame = pd.DataFrame({
+        'ds': prices.index,
+        'y': prices.values,
+        'lag_7': prices.shift(7).values,
+        'lag_14': prices.shift(14).values,
+        'ma_7': prices.rolling(window=7, min_periods=1).mean().values,
+        'ma_30': prices.rolling(window=30, min_periods=1).mean().values,
+    })
+    frame = frame.fillna(prices.iloc[:split].mean())
+    return frame.iloc[:split].reset_index(drop=True), frame.iloc[split:].reset_index(drop=True)
+
+def build_model(variant):
+    """Unfitted Prophet model of one variant"""
+    from prophet import Prophet
+
+    if variant == 'baseline':
+        return Prophet(**BASELINE_PARAMS)
+    params = dict(OPTIMIZED_PARAMS)
+    if variant == 'holiday':
+        params.update(holidays=holiday_frame(), holidays_prior_scale=10.0)
+    model = Prophet(**params)
+    for regressor in REGRESSORS:
+        model.add_regressor(regressor, standardize=True)
+    model.add_seasonality(**MONTHLY_SEASONALITY)
+    return model
+
+def fit_key(variant, market, train_frame):
+    """Cache key of one fit: variant settings, market, training frame and library versions"""
+    columns = ['y'] if variant == 'baseline' else ['y', *REGRESSORS]
+    settings = {
+        'variant': variant,
+        'market': market,
+        'params': BASELINE_PARAMS if variant == 'baseline' else OPTIMIZED_PARAMS,
+    }
+    if variant != 'baseline':
+        settings.update(regressors=REGRESSORS, monthly=MONTHLY_SEASONALITY)
+    if variant == 'holiday':
+        settings.update(holidays=HOLIDAY_PERIODS, holidays_prior_scale=10.0)
+    # ds as the index keeps the hashed values numeric (a mixed frame would hash object pointers)
+    return artifact_key('prophet', settings, data=(train_frame.set_index('ds')[columns],),
+                        packages=('numpy', 'pandas', 'prophet', 'cmdstanpy'))
+
+def _init_worker(threads):
+    """
+    Limit every worker to `threads` threads (Stan and BLAS) so that
+    workers x threads stays within the cores, and silence the per-fit logging.
+    """
+    os.environ['STAN_NUM_THREADS'] = str(threads)
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+    for name in ('prophet', 'cmdstanpy'):
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+def _fit_job(job):
+    """
+    Fit (or load the cached fit of) one variant for one market and forecast
+    its test frame. The fitted model goes to the cache rather than back to
+    the parent process; only the forecast is returned.
+    """
+    variant, market, train_frame, test_frame, key, cache_dir, cached = job
+    start = time.perf_counter()
+    cache = ArtifactCache(cache_dir)
+    if cached:
+        model = joblib.load(cache.file_path('prophet', key))
+    else:
+        columns = ['ds', 'y'] if variant == 'baseline' else ['ds', 'y', *REGRESSORS]
+        model = build_model(variant)
+        model.fit(train_frame[columns])
+        cache.save('prophet', key, model)
+    forecast = model.predict(test_frame.drop(columns='y'))['yhat'].values
+    return variant, market, forecast, time.perf_counter() - start
+
+def fit_all(jobs, workers=1, threads=1):
+    """Run _fit_job over every job, in a process pool when workers > 1"""
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as executor:
+            return list(executor.map(_fit_job, jobs))
+    _init_worker(threads)
+    return [_fit_job(job) for job in jobs]
+
+def main(workers=None, threads=1, use_cache=True):
+    print("="*80)
+    print("PROPHET MODEL TRAINING - Chili Price Prediction")
+    print("="*80)
+    os.makedirs(PROPHET_DIR, exist_ok=True)
+    os.makedirs('result/metrics', exist_ok=True)
+
+    # Load preprocessed data
+    print("\nLoading data...")
+    df_with_holidays = load_market_frame()
+    print(f"✓ Data loaded: {df_with_holidays.shape}")
+
+    market_columns = MARKET_COLUMNS
+    SPLIT_INDEX = split_index(len(df_with_holidays))
+    test_data = df_with_holidays.iloc[SPLIT_INDEX:]
+    print(f"\nData Split:")
+    print(f"  Training: {SPLIT_INDEX} samples")
+    print(f"  Testing: {len(test_data)} samples")
+    print(f"  Split ratio: {(1-TEST_SIZE)*100:.0f}/{TEST_SIZE*100:.0f}")
+
+    # One job per (variant, market); cmdstan's optimizer runs on one thread per fit,
+    # so the process pool is what spreads the fits over the cores
+    cache = ArtifactCache(enabled=use_cache)
+    jobs = []
+    keys = {}
+    for market in market_columns:
+        train_frame, test_frame = prophet_frames(df_with_holidays[market], SPLIT_INDEX)
+        for variant in VARIANTS:
+            keys[(variant, market)] = fit_key(variant, market, train_frame)
+            cached = cache.has('prophet', keys[(variant, market)])
+            jobs.append((variant, market, train_frame, test_frame, keys[(variant, market)], cache.cache_dir, cached))
+
+    workers = workers or max(1, (os.cpu_count() or 1) // threads)
+    workers = min(workers, sum(not job[-1] for job in jobs) or 1)
+    print(f"\nFitting {len(jobs)} Prophet models ({cache.summary()}, workers={workers}, threads={threads})...")
+    fit_start = time.perf_counter()
+    outcomes = fit_all(jobs, workers=workers, threads=threads)
+    print(f"✓ Fitting finished in {time.perf_counter() - fit_start:.1f}s")
+
+    forecasts = {}
+    for variant, market, forecast, seconds in outcomes:
+        forecasts[(variant, market)] = forecast
+        print(f"  {variant:<10} {market:<20} {seconds:6.1f}s")
+
+    # Install the fitted models (files already holding the same fit are left untouched)
+    models_written = sum(install_file(cache.file_path('prophet', keys[key]), model_path(*key)) for key in keys)
+    print(f"\n✓ Prophet models saved to: {PROPHET_DIR}/ ({models_written} of {len(keys)} files changed)")
+
+    # Results storage (same layout as notebook 04)
+    prophet_results = {}
+    print(f"\n{'Market':<20} {'Variant':<10} {'RMSE':>12} {'MAE':>12} {'MAPE':>9}")
+    print("-"*67)
+    for market in market_columns:
+        actual_values = test_data[market].values
+        predictions = np.stack([forecasts[(variant, market)] for variant in VARIANTS])
+        metrics = error_metrics(actual_values, predictions, axis=-1)
+
+        prophet_results[market] = {'actual': actual_values, 'test_dates': test_data.index}
+        for idx, (variant, (_, pred_key, prefix)) in enumerate(VARIANTS.items()):
+            prophet_results[market][pred_key] = predictions[idx]
+            for name in ('rmse', 'mae', 'mape'):
+                prophet_results[market][f'{prefix}_{name}'] = metrics[name][idx]
+            print(f"{market:<20} {variant:<10} {metrics['rmse'][idx]:>12,.2f} {metrics['mae'][idx]:>12,.2f} "
+                  f"{metrics['mape'][idx]:>8.2f}%")
+
+    prophet_summary = {
+        'algorithm': 'Prophet',
+        'avg_baseline_rmse': np.mean([prophet_results[m]['prophet_baseline_rmse'] for m in market_columns]),
+        'avg_baseline_mape': np.mean([prophet_results[m]['prophet_baseline_mape'] for m in market_columns]),
+        'avg_rmse': np.mean([prophet_results[m]['prophet_rmse'] for m in market_columns]),
+        'avg_rmse_with_holiday': np.mean([prophet_results[m]['prophet_h_rmse'] for m in market_columns]),
+        'avg_mape': np.mean([prophet_results[m]['prophet_mape'] for m in market_columns]),
+        'avg_mape_with_holiday': np.mean([prophet_results[m]['prophet_h_mape'] for m in market_columns]),
+        'markets': market_columns,
+        'results': prophet_results,
+    }
+    joblib.dump(prophet_summary, SUMMARY_PATH)
+    joblib.dump(prophet_results, RESULTS_PATH)
+
+    print("\n" + "="*80)
+    print("PROPHET PERFORMANCE SUMMARY")
+    print("="*80)
+    print(f"✓ Prophet Baseline Average MAPE: {prophet_summary['avg_baseline_mape']:.2f}%")
+    print(f"✓ Prophet Optimized Average MAPE: {prophet_summary['avg_mape']:.2f}%")
+    print(f"✓ Prophet+Holiday Optimized Average MAPE: {prophet_summary['avg_mape_with_holiday']:.2f}%")
+    print(f"\n✓ Results saved to {RESULTS_PATH} and {SUMMARY_PATH}")
+    return prophet_results
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Train the Prophet models')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Worker processes (default: cores // threads, 1 = sequential)')
+    parser.add_argument('--threads', type=int, default=1,
+                        help='Stan/BLAS threads per worker')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Ignore cached fits in models/cache/ and refit (the cache is refreshed)')
+    args = parser.parse_args(argv)
+    main(workers=args.workers, threads=args.threads, use_cache=not args.no_cache)
+
+if __name__ == "__main__":
+    cli()
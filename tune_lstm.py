@@ -0,0 +1,257 @@
+"""
+LSTM Hyperparameter Search Script for Chili Price Prediction
+Successive-halving search over the look-back window, layer sizes, dropout and
+batch size. Trials run in parallel worker processes and every finished trial
+is appended to a JSONL log, so an interrupted search resumes where it stopped
+"""
+
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from data_access import MARKET_COLUMNS, split_index, load_market_frame
+import argparse
+import datetime
+import hashlib
+import itertools
+import joblib
+import json
+import os
+import random
+import time
+import warnings
+
+RESULTS_DIR = 'result/tuning'
+TRIALS_PATH = os.path.join(RESULTS_DIR, 'lstm_trials.jsonl')
+WEIGHTS_DIR = os.path.join(RESULTS_DIR, 'weights')
+BEST_CONFIG_PATH = os.path.join(RESULTS_DIR, 'lstm_best_config.json')
+
+SEARCH_SPACE = {
+    'look_back': [14, 30, 45, 60],
+    'units': [[32, 16], [64, 32], [128, 64]],
+    'dropout': [0.0, 0.1, 0.2, 0.3],
+    'batch_size': [8, 16, 32],
+}
+
+VARIANTS = {
+    'lstm': ('scaler_markets.joblib', MARKET_COLUMNS),
+    'lstm_holiday': ('scaler_with_features.joblib', MARKET_COLUMNS + ['is_holiday']),
+}
+
+def sample_configs(n_configs, seed=42):
+    """`n_configs` distinct configurations drawn from the SEARCH_SPACE grid"""
+    grid = [dict(zip(SEARCH_SPACE, values)) for values in itertools.product(*SEARCH_SPACE.values())]
+    if n_configs >= len(grid):
+        return grid
+    return random.Random(seed).sample(grid, n_configs)
+
+def trial_id(config, variant, val_size, seed):
+    """Stable id of one configuration; results and weights are stored under it"""
+    key = json.dumps({'config': config, 'variant': variant, 'val_size': val_size, 'seed': seed}, sort_keys=True)
+    return hashlib.sha256(key.encode()).hexdigest()[:12]
+
+def rung_budgets(min_epochs, max_epochs, eta):
+    """Epoch budget of each rung: min_epochs, min_epochs * eta, ... capped at max_epochs"""
+    budgets = []
+    epochs = min_epochs
+    while epochs < max_epochs:
+        budgets.append(epochs)
+        epochs *= eta
+    budgets.append(max_epochs)
+    return budgets
+
+def load_trials(path=TRIALS_PATH):
+    """Finished trials keyed by (trial id, epochs); a partly written last line is ignored"""
+    trials = {}
+    if not os.path.exists(path):
+        return trials
+    with open(path) as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            trials[(record['trial'], record['epochs'])] = record
+    return trials
+
+def append_trial(record, path=TRIALS_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(json.dumps(record) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+def _init_worker(threads):
+    """Bound BLAS and TensorFlow threads so parallel trials don't oversubscribe cores"""
+    try:
+        from threadpoolctl import threadpool_limits
+        threadpool_limits(threads)
+    except ImportError:
+        pass
+    os.environ['TF_NUM_INTRAOP_THREADS'] = str(threads)
+    os.environ['TF_NUM_INTEROP_THREADS'] = '1'
+    os.environ.setdefault('TF_CPP_MIN_LOG_LEVEL', '2')
+    warnings.filterwarnings('ignore')
+
+def _training_rows(variant, val_size):
+    """Scaled training rows of a variant and the row where its validation slice starts"""
+    scaler_file, columns = VARIANTS[variant]
+    df_with_holidays = load_market_frame()
+    train_data = df_with_holidays.iloc[:split_index(len(df_with_holidays))]
+    scaler = joblib.load(os.path.join('data/scalers', scaler_file))
+    scaled = scaler.transform(train_data[columns]).astype(np.float32)
+    return scaled, len(train_data) - int(len(train_data) * val_size)
+
+def run_trial(job):
+    """
+    Train one configuration up to `epochs`, continuing from the weights of its
+    previous rung, and score it by MSE on the chronological validation slice.
+    Validation windows take their look-back rows from the fit slice, so every
+    look-back is scored on the same target days.
+    """
+    trial, config, variant, val_size, seed, prev_epochs, epochs = job
+    import tensorflow as tf
+    from train_lstm import build_lstm_model
+    from windowing import window_dataset
+
+    tf.keras.utils.set_random_seed(seed)
+    scaled, fit_rows = _training_rows(variant, val_size)
+    look_back = config['look_back']
+    train_dataset = window_dataset(scaled[:fit_rows], look_back, config['batch_size'])
+    val_dataset = window_dataset(scaled[fit_rows - look_back:], look_back, config['batch_size'])
+
+    model = build_lstm_model(look_back, scaled.shape[1], config['units'], config['dropout'])
+    prev_path = os.path.join(WEIGHTS_DIR, f'{trial}.e{prev_epochs}.weights.h5')
+    if prev_epochs and os.path.exists(prev_path):
+        # The weights file also holds the optimizer state, which loads only into a built optimizer
+        model.optimizer.build(model.trainable_variables)
+        model.load_weights(prev_path)
+    else:
+        prev_epochs = 0
+
+    start = time.perf_counter()
+    model.fit(train_dataset, epochs=epochs, initial_epoch=prev_epochs, verbose=0)
+    val_loss = float(model.evaluate(val_dataset, verbose=0)[0])
+
+    os.makedirs(WEIGHTS_DIR, exist_ok=True)
+    # Weights are stored per budget, so a rung is always continued from exactly the previous one
+    tmp_path = os.path.join(WEIGHTS_DIR, f'{trial}.tmp.weights.h5')
+    model.save_weights(tmp_path)
+    os.replace(tmp_path, os.path.join(WEIGHTS_DIR, f'{trial}.e{epochs}.weights.h5'))
+    if prev_epochs:
+        os.remove(prev_path)
+
+    return {
+        'trial': trial,
+        'config': config,
+        'variant': variant,
+        'epochs': epochs,
+        'trained_epochs': epochs - prev_epochs,
+        'val_loss': val_loss,
+        'seconds': time.perf_counter() - start,
+        'finished': datetime.datetime.now().isoformat(timespec='seconds'),
+    }
+
+def _run_jobs(jobs, workers, threads):
+    """Yield trial records as they finish"""
+    if workers == 1:
+        _init_worker(threads)
+        for job in jobs:
+            yield run_trial(job)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(threads,)) as executor:
+        futures = [executor.submit(run_trial, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+def successive_halving(configs, variant='lstm_holiday', val_size=0.15, min_epochs=5, max_epochs=45, eta=3,
+                       workers=None, threads=1, seed=42, trials_path=TRIALS_PATH):
+    """
+    Train all configurations for min_epochs, keep the best 1/eta by validation
+    loss, train those eta times longer, and repeat up to max_epochs.
+
+    Trials already in the JSONL log are reused, so rerunning the same search
+    after an interruption only trains what is missing. Returns the records of
+    the final rung, best first.
+    """
+    workers = workers or max(1, (os.cpu_count() or 1) // threads)
+    trials = load_trials(trials_path)
+    budgets = rung_budgets(min_epochs, max_epochs, eta)
+    survivors = [(trial_id(config, variant, val_size, seed), config) for config in configs]
+    print(f"  Rungs (epochs): {budgets}, eta={eta}, {workers} workers x {threads} threads")
+
+    for rung, epochs in enumerate(budgets):
+        prev_epochs = budgets[rung - 1] if rung else 0
+        pending = [(trial, config, variant, val_size, seed, prev_epochs, epochs)
+                   for trial, config in survivors if (trial, epochs) not in trials]
+        print(f"\nRung {rung + 1}: {len(survivors)} configurations at {epochs} epochs "
+              f"({len(survivors) - len(pending)} already done)")
+
+        start = time.perf_counter()
+        for record in _run_jobs(pending, workers, threads):
+            append_trial(record, trials_path)
+            trials[(record['trial'], record['epochs'])] = record
+            print(f"  {record['trial']}  {_describe(record['config'])}  "
+                  f"val_loss={record['val_loss']:.5f}  ({record['seconds']:.1f}s)")
+        if pending:
+            print(f"  ✓ Rung finished in {time.perf_counter() - start:.1f}s")
+
+        ranked = sorted(survivors, key=lambda item: trials[(item[0], epochs)]['val_loss'])
+        if rung < len(budgets) - 1:
+            survivors = ranked[:max(1, len(ranked) // eta)]
+        else:
+            survivors = ranked
+
+    return [trials[(trial, budgets[-1])] for trial, _ in survivors]
+
+def _describe(config):
+    return (f"look_back={config['look_back']:<3} units={config['units'][0]:>3}/{config['units'][1]:<3} "
+            f"dropout={config['dropout']:.1f} batch={config['batch_size']:<3}")
+
+def main(n_configs=24, variant='lstm_holiday', val_size=0.15, min_epochs=5, max_epochs=45, eta=3,
+         workers=None, threads=1, seed=42):
+    print("="*80)
+    print("LSTM HYPERPARAMETER SEARCH - Successive halving")
+    print("="*80)
+
+    configs = sample_configs(n_configs, seed)
+    print(f"\nVariant: {variant}, {len(configs)} configurations, validation: last {val_size:.0%} of training rows")
+    print(f"Trial log: {TRIALS_PATH}")
+
+    start = time.perf_counter()
+    final = successive_halving(configs, variant, val_size, min_epochs, max_epochs, eta, workers, threads, seed)
+    print(f"\n✓ Search finished in {time.perf_counter() - start:.1f}s")
+
+    print("\n" + "="*80)
+    print(f"FINAL RUNG ({max_epochs} epochs)")
+    print("="*80)
+    for record in final:
+        print(f"  {_describe(record['config'])}  val_loss={record['val_loss']:.5f}")
+
+    best = final[0]
+    best_config = {**best['config'], 'variant': variant, 'epochs': best['epochs'], 'val_loss': best['val_loss']}
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    with open(BEST_CONFIG_PATH, 'w') as f:
+        json.dump(best_config, f, indent=2)
+    print(f"\n✓ Best configuration: {_describe(best['config'])}")
+    print(f"✓ Saved to {BEST_CONFIG_PATH} (use: python3 train_lstm.py --config {BEST_CONFIG_PATH})")
+    return best_config
+
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Successive-halving search over LSTM hyperparameters')
+    parser.add_argument('--configs', type=int, default=24, help='Configurations sampled from the search space')
+    parser.add_argument('--variant', choices=list(VARIANTS), default='lstm_holiday')
+    parser.add_argument('--val-size', type=float, default=0.15,
+                        help='Share of the training rows held out (chronologically last) for scoring')
+    parser.add_argument('--min-epochs', type=int, default=5, help='Epochs of the first rung')
+    parser.add_argument('--max-epochs', type=int, default=45, help='Epochs of the final rung')
+    parser.add_argument('--eta', type=int, default=3, help='Keep 1/eta of the configurations at each rung')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Parallel trials (default: cores // threads, 1 = in this process)')
+    parser.add_argument('--threads', type=int, default=1, help='BLAS/TensorFlow threads per trial')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args(argv)
+    main(args.configs, args.variant, args.val_size, args.min_epochs, args.max_epochs, args.eta,
+         args.workers, args.threads, args.seed)
+
+if __name__ == "__main__":
+    cli()
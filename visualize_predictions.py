@@ -3,180 +3,337 @@ Visualization Script for Chili Price Prediction
 Generates comparison plots with Actual, LSTM, and ARIMA predictions only
 """
 
-import pandas as pd
 import numpy as np
+import matplotlib
+matplotlib.use('Agg')  # Plots are only written to files, so no GUI backend is needed
 import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
+from artifact_cache import atomic_open
+from data_access import MARKET_COLUMNS, split_index, load_market_frame
+from instrumentation import add_trace_arguments, count, span, trace_options, trace_run
+import argparse
+import hashlib
 import joblib
+import json
 import os
+import time
 
-def main():
+PLOTS_DIR = 'result/plots'
+MARKET_PLOTS_DIR = os.path.join(PLOTS_DIR, 'markets')
+MANIFEST_NAME = 'manifest.json'
+# Bump when the drawing code changes, so existing plots are redrawn
+RENDER_VERSION = 1
+MAX_POINTS = 2000
+FORMATS = ('png', 'svg', 'html')
+
+def load_panels():
+    """Test dates and the aligned actual/LSTM/ARIMA (and Prophet) series of every market, computed once"""
+    lstm_results = joblib.load('result/metrics/lstm_detailed_results.pkl')
+    arima_results = joblib.load('result/metrics/arima_detailed_results.pkl')
+    prophet_path = 'result/metrics/prophet_detailed_results.pkl'
+    prophet_results = joblib.load(prophet_path) if os.path.exists(prophet_path) else None
+
+    df_with_holidays = load_market_frame()
+    SPLIT_INDEX = split_index(len(df_with_holidays))
+    LOOK_BACK = lstm_results.get('look_back', 30)
+    test_data = df_with_holidays.iloc[SPLIT_INDEX:]
+    test_dates = test_data.index[LOOK_BACK:LOOK_BACK + len(lstm_results['actual'])]
+
+    panels = {}
+    for idx, market in enumerate(MARKET_COLUMNS):
+        actual = lstm_results['actual'][:, idx]
+        lstm_pred = lstm_results['predictions_with_holiday'][:, idx]  # Use best LSTM
+        # ARIMA and Prophet cover the whole test set, the LSTM dates start LOOK_BACK days in
+        arima_pred = np.asarray(arima_results[market]['arimax_forecast'])[LOOK_BACK:LOOK_BACK + len(actual)]  # Use best ARIMA
+
+        # Align lengths
+        min_len = min(len(actual), len(lstm_pred), len(arima_pred))
+        panels[market] = {
+            'dates': test_dates[:min_len].values,
+            'actual': np.asarray(actual[:min_len], dtype=np.float64),
+            'lstm': np.asarray(lstm_pred[:min_len], dtype=np.float64),
+            'arima': np.asarray(arima_pred[:min_len], dtype=np.float64),
+        }
+        if prophet_results is not None:
+            prophet_pred = np.asarray(prophet_results[market]['prophet_pred'], dtype=np.float64)
+            panels[market]['prophet'] = prophet_pred[LOOK_BACK:LOOK_BACK + min_len]
+    return test_dates, panels
+
+def series_names(panel):
+    """Names of the plotted series of a panel (everything except the dates)"""
+    return [name for name in panel if name != 'dates']
+
+def downsample(panel, max_points=MAX_POINTS):
+    """
+    Keep at most about `max_points` points of a panel. Each bucket keeps its
+    first point and the minimum and maximum of every series, so price spikes
+    survive the reduction.
+    """
+    n = len(panel['dates'])
+    if max_points is None or n <= max_points:
+        return panel
+    n_buckets = max(max_points // 7, 1)  # Up to 1 + 2 * 3 points per bucket
+    edges = np.linspace(0, n, n_buckets + 1).astype(int)
+    keep = [edges[:-1], [n - 1]]
+    for name in series_names(panel):
+        values = panel[name]
+        for reduce in (np.minimum, np.maximum):
+            extremes = reduce.reduceat(values, edges[:-1])
+            for start, stop, value in zip(edges[:-1], edges[1:], extremes):
+                keep.append([start + int(np.argmax(values[start:stop] == value))])
+    index = np.unique(np.concatenate(keep))
+    return {name: values[index] for name, values in panel.items()}
+
+def content_hash(panels, **settings):
+    """SHA-256 of the plotted arrays and the settings that affect the drawing"""
+    digest = hashlib.sha256(json.dumps({'version': RENDER_VERSION, **settings}, sort_keys=True).encode())
+    for market in sorted(panels):
+        digest.update(market.encode())
+        for name in ('dates', *series_names(panels[market])):
+            digest.update(np.ascontiguousarray(panels[market][name]).tobytes())
+    return digest.hexdigest()
+
+class PlotManifest:
+    """Input hash of every rendered file, so unchanged plots are not redrawn"""
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, MANIFEST_NAME)
+        try:
+            with open(self.path) as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    def is_fresh(self, output_path, digest):
+        return self.entries.get(os.path.basename(output_path)) == digest and os.path.exists(output_path)
+
+    def record(self, output_path, digest):
+        self.entries[os.path.basename(output_path)] = digest
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with atomic_open(self.path, 'w') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+
+def _format_price_axis(ax):
+    ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x):,}'))
+
+def plot_market(ax, market, panel):
+    """Actual, LSTM, ARIMA and (when trained) Prophet lines of one market"""
+    ax.plot(panel['dates'], panel['actual'], 'k-', linewidth=2, label='Actual', alpha=0.8)
+    ax.plot(panel['dates'], panel['lstm'], 'b--', linewidth=1.5, label='LSTM', alpha=0.7)
+    ax.plot(panel['dates'], panel['arima'], 'r:', linewidth=1.5, label='ARIMA', alpha=0.7)
+    if 'prophet' in panel:
+        ax.plot(panel['dates'], panel['prophet'], 'g-.', linewidth=1.5, label='Prophet', alpha=0.7)
+
+    # Formatting
+    ax.set_title(f'Price Prediction Comparison - {market}', fontsize=12, fontweight='bold')
+    ax.set_xlabel('Date', fontsize=10)
+    ax.set_ylabel('Price (Rp)', fontsize=10)
+    ax.legend(loc='upper right', framealpha=0.9)
+    ax.grid(True, alpha=0.3)
+    _format_price_axis(ax)
+    ax.tick_params(axis='x', rotation=45)
+
+def render_market(job):
+    """Draw one market's panel to its own file (runs in a worker process)"""
+    market, panel, output_path, fmt, dpi = job
+    start = time.perf_counter()
+    fig, ax = plt.subplots(figsize=(14, 4))
+    plot_market(ax, market, panel)
+    fig.tight_layout()
+    fig.savefig(output_path, format=fmt, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
+    return output_path, time.perf_counter() - start
+
+def market_plot_path(market, fmt, output_dir=MARKET_PLOTS_DIR):
+    return os.path.join(output_dir, f'prediction_{market.replace(" ", "_")}.{fmt}')
+
+def write_html_index(paths, output_dir=MARKET_PLOTS_DIR):
+    """Single page that shows the per-market SVG plots"""
+    images = '\n'.join(f'<h2>{market}</h2>\n<img src="{os.path.basename(path)}" alt="{market}" style="width:100%">'
+                       for market, path in paths.items())
+    index_path = os.path.join(output_dir, 'index.html')
+    with open(index_path, 'w') as f:
+        f.write('<!DOCTYPE html>\n<html><head><meta charset="utf-8">'
+                '<title>Chili Price Predictions</title></head>\n'
+                f'<body style="max-width:1200px;margin:auto;font-family:sans-serif">\n'
+                f'<h1>Price Prediction Comparison</h1>\n{images}\n</body></html>\n')
+    return index_path
+
+def render_markets(panels, fmt='png', dpi=150, max_points=MAX_POINTS, workers=None, force=False,
+                   output_dir=MARKET_PLOTS_DIR):
+    """
+    One file per market, drawn in a process pool. A market is skipped when its
+    file exists and the manifest records the same input hash. The html format
+    writes SVG panels plus an index.html that shows them.
+    """
+    image_format = 'svg' if fmt == 'html' else fmt
+    os.makedirs(output_dir, exist_ok=True)
+    manifest = PlotManifest(output_dir)
+
+    paths = {}
+    jobs = []
+    digests = {}
+    for market, panel in panels.items():
+        path = market_plot_path(market, image_format, output_dir)
+        paths[market] = path
+        digests[path] = content_hash({market: panel}, format=image_format, dpi=dpi, max_points=max_points)
+        if not force and manifest.is_fresh(path, digests[path]):
+            continue
+        jobs.append((market, downsample(panel, max_points), path, image_format, dpi))
+
+    count('plots_unchanged', len(panels) - len(jobs))
+    with span('render_markets', plots=len(jobs), workers=workers):
+        if workers == 1 or len(jobs) <= 1:
+            rendered = [render_market(job) for job in jobs]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                rendered = list(executor.map(render_market, jobs))
+
+    for path, seconds in rendered:
+        manifest.record(path, digests[path])
+        print(f"  ✓ {path} ({seconds:.2f}s)")
+    manifest.save()
+    print(f"✓ {len(rendered)} market plots rendered, {len(panels) - len(rendered)} unchanged")
+
+    if fmt == 'html':
+        index_path = write_html_index(paths, output_dir)
+        print(f"✓ HTML page: {index_path}")
+    return paths
+
+def main(dpi=300, max_points=MAX_POINTS, force=False):
     print("="*80)
     print("GENERATING PREDICTION COMPARISON PLOTS")
     print("="*80)
-    
+
     # Load results
     print("\nLoading model results...")
-    lstm_results = joblib.load('result/metrics/lstm_detailed_results.pkl')
-    arima_results = joblib.load('result/metrics/arima_detailed_results.pkl')
-    
-    market_columns = ['Pasar Sukaramai', 'Pasar Aksara', 'Pasar Petisah', 'Pusat Pasar', 'Pasar Brayan']
-    
-    # Load data for dates
-    df_with_holidays = pd.read_csv('data/processed/data_with_holidays.csv', index_col=0, parse_dates=True)
-    TEST_SIZE = 0.2
-    SPLIT_INDEX = int(len(df_with_holidays) * (1 - TEST_SIZE))
-    LOOK_BACK = 30
-    test_data = df_with_holidays.iloc[SPLIT_INDEX:]
-    test_dates = test_data.index[LOOK_BACK:LOOK_BACK + len(lstm_results['actual'])]
-    
+    with span('load_results'):
+        test_dates, panels = load_panels()
+    market_columns = MARKET_COLUMNS
+
     print(f"✓ Results loaded")
     print(f"  Number of markets: {len(market_columns)}")
     print(f"  Test period: {test_dates[0]} to {test_dates[-1]}")
-    
+
+    output_path = os.path.join(PLOTS_DIR, 'prediction_comparison_lstm_arima.png')
+    output_path2 = os.path.join(PLOTS_DIR, 'prediction_comparison_all_markets.png')
+    output_path3 = os.path.join(PLOTS_DIR, 'error_comparison_lstm_arima.png')
+    os.makedirs(PLOTS_DIR, exist_ok=True)
+
+    # All three figures are drawn from the same aligned data
+    manifest = PlotManifest(PLOTS_DIR)
+    digest = content_hash(panels, dpi=dpi, max_points=max_points)
+    if not force and all(manifest.is_fresh(path, digest) for path in (output_path, output_path2, output_path3)):
+        print("\n✓ Predictions unchanged since the last run - plots are up to date")
+        count('plots_unchanged', 3)
+        return
+    drawn = {market: downsample(panel, max_points) for market, panel in panels.items()}
+
     # Create figure with subplots for each market
     fig, axes = plt.subplots(len(market_columns), 1, figsize=(14, 3 * len(market_columns)))
     fig.suptitle('Price Prediction Comparison - Pasar (Markets)', fontsize=16, fontweight='bold', y=0.995)
-    
+
     if len(market_columns) == 1:
         axes = [axes]
-    
+
     for idx, market in enumerate(market_columns):
-        ax = axes[idx]
-        
-        # Get predictions for this market
-        actual = lstm_results['actual'][:, idx]
-        lstm_pred = lstm_results['predictions_with_holiday'][:, idx]  # Use best LSTM
-        arima_pred = arima_results[market]['arimax_forecast'].values  # Use best ARIMA
-        
-        # Align lengths
-        min_len = min(len(actual), len(lstm_pred), len(arima_pred))
-        actual = actual[:min_len]
-        lstm_pred = lstm_pred[:min_len]
-        arima_pred = arima_pred[:min_len]
-        dates = test_dates[:min_len]
-        
-        # Plot
-        ax.plot(dates, actual, 'k-', linewidth=2, label='Actual', alpha=0.8)
-        ax.plot(dates, lstm_pred, 'b--', linewidth=1.5, label='LSTM', alpha=0.7)
-        ax.plot(dates, arima_pred, 'r:', linewidth=1.5, label='ARIMA', alpha=0.7)
-        
-        # Formatting
-        ax.set_title(f'Price Prediction Comparison - {market}', fontsize=12, fontweight='bold')
-        ax.set_xlabel('Date', fontsize=10)
-        ax.set_ylabel('Price (Rp)', fontsize=10)
-        ax.legend(loc='upper right', framealpha=0.9)
-        ax.grid(True, alpha=0.3)
-        
-        # Format y-axis
-        ax.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x):,}'))
-        
-        # Rotate x-axis labels
-        ax.tick_params(axis='x', rotation=45)
-    
+        plot_market(axes[idx], market, drawn[market])
+
     plt.tight_layout()
-    
+
     # Save figure
-    output_path = 'result/plots/prediction_comparison_lstm_arima.png'
-    os.makedirs('result/plots', exist_ok=True)
-    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    with span('plt.savefig', path=output_path):
+        plt.savefig(output_path, dpi=dpi, bbox_inches='tight')
+    plt.close(fig)
     print(f"\n✓ Plot saved to: {output_path}")
-    
+
     # Create a single combined plot (all markets on one chart) - alternative view
     fig2, ax2 = plt.subplots(figsize=(14, 8))
-    
+
     colors = ['#1f77b4', '#ff7f0e', '#2ca02c', '#d62728', '#9467bd']
-    
+
     for idx, market in enumerate(market_columns):
-        actual = lstm_results['actual'][:, idx]
-        lstm_pred = lstm_results['predictions_with_holiday'][:, idx]
-        
-        min_len = min(len(actual), len(lstm_pred))
-        actual = actual[:min_len]
-        lstm_pred = lstm_pred[:min_len]
-        dates = test_dates[:min_len]
-        
+        panel = drawn[market]
         # Plot actual as solid line
-        ax2.plot(dates, actual, color=colors[idx], linewidth=2, 
+        ax2.plot(panel['dates'], panel['actual'], color=colors[idx % len(colors)], linewidth=2,
                 label=f'{market} (Actual)', alpha=0.8)
         # Plot LSTM as dashed line
-        ax2.plot(dates, lstm_pred, color=colors[idx], linewidth=1.5, 
+        ax2.plot(panel['dates'], panel['lstm'], color=colors[idx % len(colors)], linewidth=1.5,
                 linestyle='--', label=f'{market} (LSTM)', alpha=0.6)
-    
-    ax2.set_title('Price Prediction Comparison - All Markets (LSTM)', 
+
+    ax2.set_title('Price Prediction Comparison - All Markets (LSTM)',
                  fontsize=14, fontweight='bold')
     ax2.set_xlabel('Date', fontsize=12)
     ax2.set_ylabel('Price (Rp)', fontsize=12)
     ax2.legend(loc='upper left', framealpha=0.9, ncol=2)
     ax2.grid(True, alpha=0.3)
-    ax2.yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x):,}'))
+    _format_price_axis(ax2)
     ax2.tick_params(axis='x', rotation=45)
-    
+
     plt.tight_layout()
-    
-    output_path2 = 'result/plots/prediction_comparison_all_markets.png'
-    plt.savefig(output_path2, dpi=300, bbox_inches='tight')
+
+    with span('plt.savefig', path=output_path2):
+        plt.savefig(output_path2, dpi=dpi, bbox_inches='tight')
+    plt.close(fig2)
     print(f"✓ Combined plot saved to: {output_path2}")
-    
+
     # Create error comparison plot
     fig3, axes3 = plt.subplots(2, 1, figsize=(14, 8))
-    
+
     # Calculate average errors across all markets
-    lstm_errors = []
-    arima_errors = []
-    
-    for idx, market in enumerate(market_columns):
-        actual = lstm_results['actual'][:, idx]
-        lstm_pred = lstm_results['predictions_with_holiday'][:, idx]
-        arima_pred = arima_results[market]['arimax_forecast'].values
-        
-        min_len = min(len(actual), len(lstm_pred), len(arima_pred))
-        actual = actual[:min_len]
-        lstm_pred = lstm_pred[:min_len]
-        arima_pred = arima_pred[:min_len]
-        
-        lstm_errors.append(np.abs(actual - lstm_pred))
-        arima_errors.append(np.abs(actual - arima_pred))
-    
-    avg_lstm_error = np.mean(lstm_errors, axis=0)
-    avg_arima_error = np.mean(arima_errors, axis=0)
-    dates_aligned = test_dates[:len(avg_lstm_error)]
-    
+    min_len = min(len(panel['actual']) for panel in panels.values())
+    avg_lstm_error = np.mean([np.abs(panel['actual'] - panel['lstm'])[:min_len] for panel in panels.values()], axis=0)
+    avg_arima_error = np.mean([np.abs(panel['actual'] - panel['arima'])[:min_len] for panel in panels.values()], axis=0)
+    error_series = {'lstm': avg_lstm_error, 'arima': avg_arima_error}
+    with_prophet = all('prophet' in panel for panel in panels.values())
+    if with_prophet:
+        error_series['prophet'] = np.mean([np.abs(panel['actual'] - panel['prophet'])[:min_len]
+                                           for panel in panels.values()], axis=0)
+    errors = downsample({'dates': test_dates[:min_len].values, **error_series}, max_points)
+
     # Plot 1: Absolute errors over time
-    axes3[0].plot(dates_aligned, avg_lstm_error, 'b-', linewidth=2, label='LSTM MAE', alpha=0.7)
-    axes3[0].plot(dates_aligned, avg_arima_error, 'r-', linewidth=2, label='ARIMA MAE', alpha=0.7)
+    axes3[0].plot(errors['dates'], errors['lstm'], 'b-', linewidth=2, label='LSTM MAE', alpha=0.7)
+    axes3[0].plot(errors['dates'], errors['arima'], 'r-', linewidth=2, label='ARIMA MAE', alpha=0.7)
+    if with_prophet:
+        axes3[0].plot(errors['dates'], errors['prophet'], 'g-', linewidth=2, label='Prophet MAE', alpha=0.7)
     axes3[0].set_title('Average Absolute Error Over Time (All Markets)', fontsize=12, fontweight='bold')
     axes3[0].set_xlabel('Date', fontsize=10)
     axes3[0].set_ylabel('Absolute Error (Rp)', fontsize=10)
     axes3[0].legend(loc='upper right')
     axes3[0].grid(True, alpha=0.3)
     axes3[0].tick_params(axis='x', rotation=45)
-    axes3[0].yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x):,}'))
-    
-    # Plot 2: Error distribution (box plot)
-    error_data = [
-        avg_lstm_error,
-        avg_arima_error
-    ]
-    
-    bp = axes3[1].boxplot(error_data, labels=['LSTM', 'ARIMA'], 
+    _format_price_axis(axes3[0])
+
+    # Plot 2: Error distribution (box plot) - from all points, not the downsampled ones
+    error_data = list(error_series.values())
+    labels = ['LSTM', 'ARIMA', 'Prophet'][:len(error_data)]
+
+    bp = axes3[1].boxplot(error_data, labels=labels,
                           patch_artist=True, showmeans=True)
-    
+
     # Color the boxes
-    colors_box = ['lightblue', 'lightcoral']
+    colors_box = ['lightblue', 'lightcoral', 'lightgreen']
     for patch, color in zip(bp['boxes'], colors_box):
         patch.set_facecolor(color)
-    
+
     axes3[1].set_title('Error Distribution Comparison (All Markets)', fontsize=12, fontweight='bold')
     axes3[1].set_ylabel('Absolute Error (Rp)', fontsize=10)
     axes3[1].grid(True, alpha=0.3, axis='y')
-    axes3[1].yaxis.set_major_formatter(plt.FuncFormatter(lambda x, p: f'{int(x):,}'))
-    
+    _format_price_axis(axes3[1])
+
     plt.tight_layout()
-    
-    output_path3 = 'result/plots/error_comparison_lstm_arima.png'
-    plt.savefig(output_path3, dpi=300, bbox_inches='tight')
+
+    with span('plt.savefig', path=output_path3):
+        plt.savefig(output_path3, dpi=dpi, bbox_inches='tight')
+    plt.close(fig3)
     print(f"✓ Error comparison plot saved to: {output_path3}")
-    
+
+    for path in (output_path, output_path2, output_path3):
+        manifest.record(path, digest)
+    manifest.save()
+
     print("\n" + "="*80)
     print("✓ All visualization plots generated successfully!")
     print("="*80)
@@ -185,5 +342,36 @@ def main():
     print(f"  2. {output_path2}")
     print(f"  3. {output_path3}")
 
+def cli(argv=None, prog=None):
+    """Parse command-line arguments and run the script"""
+    parser = argparse.ArgumentParser(prog=prog, description='Plot test-set predictions of the trained models')
+    parser.add_argument('--per-market', action='store_true',
+                        help=f'Render one file per market in parallel into {MARKET_PLOTS_DIR}/')
+    parser.add_argument('--format', choices=FORMATS, default='png',
+                        help='Per-market output: png, svg (vector) or html (SVG panels + index.html)')
+    parser.add_argument('--dpi', type=int, default=None,
+                        help='Raster resolution (default: 300 for the combined figures, 150 per market)')
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Rendering processes for --per-market (default: all cores, 1 = in this process)')
+    parser.add_argument('--max-points', type=int, default=MAX_POINTS,
+                        help='Downsample longer series to about this many points before drawing')
+    parser.add_argument('--force', action='store_true', help='Redraw even when the predictions are unchanged')
+    add_trace_arguments(parser)
+    args = parser.parse_args(argv)
+
+    if args.per_market:
+        print("="*80)
+        print("RENDERING PER-MARKET PREDICTION PLOTS")
+        print("="*80)
+        start = time.perf_counter()
+        with trace_run('visualize_per_market', **trace_options(args)):
+            with span('load_results'):
+                _, panels = load_panels()
+            render_markets(panels, args.format, args.dpi or 150, args.max_points, args.workers, args.force)
+        print(f"✓ Done in {time.perf_counter() - start:.2f}s")
+    else:
+        with trace_run('visualize_predictions', **trace_options(args)):
+            main(dpi=args.dpi or 300, max_points=args.max_points, force=args.force)
+
 if __name__ == "__main__":
-    main()
+    cli()
@@ -0,0 +1,50 @@
+"""
+Windowing Utilities for Chili Price Prediction
+Look-back windows of a scaled series: zero-copy strided views for evaluation,
+and a cached, prefetching tf.data pipeline for LSTM training that copies the
+series into a tensor and gathers each batch from it by window start index
+"""
+
+import numpy as np
+
+def window_view(data, look_back):
+    """
+    Every look-back window of `data` as a read-only strided view (no copy).
+
+    Matches TimeseriesGenerator(data, data, length=look_back): window i is
+    data[i:i + look_back] and its target is data[i + look_back]. Returns
+    windows (n, look_back, features) and targets (n, features), both views.
+    """
+    data = np.asarray(data)
+    windows = np.lib.stride_tricks.sliding_window_view(data, look_back, axis=0)[:-1]
+    # sliding_window_view puts the window axis last: (n, features, look_back)
+    return windows.transpose(0, 2, 1), data[look_back:]
+
+def make_windows(data, look_back):
+    """Contiguous float32 copy of window_view, for callers that need an owned array"""
+    windows, targets = window_view(data, look_back)
+    return np.ascontiguousarray(windows, dtype=np.float32), targets
+
+def window_dataset(data, look_back, batch_size=16):
+    """
+    tf.data pipeline of (window, target) batches from a scaled (time, features) array.
+
+    The series is copied once into a float32 tensor and each batch is gathered
+    from it in-graph by window start index, so no window is built in Python.
+    Batches keep the chronological order of TimeseriesGenerator. The gathered
+    batches are cached after the first epoch, so later epochs only read them;
+    prefetching overlaps input preparation with the training step.
+    """
+    import tensorflow as tf
+
+    series = tf.constant(np.asarray(data, dtype=np.float32))
+    offsets = tf.range(look_back, dtype=tf.int64)
+
+    def gather(starts):
+        windows = tf.gather(series, starts[:, tf.newaxis] + offsets)
+        targets = tf.gather(series, starts + look_back)
+        return windows, targets
+
+    dataset = tf.data.Dataset.range(len(data) - look_back).batch(batch_size)
+    dataset = dataset.map(gather, num_parallel_calls=tf.data.AUTOTUNE, deterministic=True)
+    return dataset.cache().prefetch(tf.data.AUTOTUNE)